@@ -0,0 +1,222 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Document catalog for every user in one SQLite database.
+#
+#   documents(user_id, id, filename, status, metadata, content_hash, created_at, updated_at)
+#
+# seq is the primary key and records upload order. The UNIQUE (user_id, id)
+# constraint's index serves upserts, lookups and deletes, and finds a user's
+# documents with one range scan; they are then listed in seq order.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    status TEXT NOT NULL,
+    metadata TEXT NOT NULL DEFAULT '{}',
+    content_hash TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    UNIQUE (user_id, id)
+);
+CREATE INDEX IF NOT EXISTS documents_user_hash ON documents (user_id, content_hash);
+CREATE TABLE IF NOT EXISTS legacy_imports (
+    user_id TEXT PRIMARY KEY,
+    imported_at REAL NOT NULL,
+    documents INTEGER NOT NULL
+);
+"""
+
+_COLUMNS = "id, filename, status, metadata, content_hash"
+
+class CatalogStore:
+    """Transactional per-user document catalog backed by SQLite."""
+
+    def __init__(self, path: str):
+        """Open (or create) the catalog database at path."""
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def upsert(self, user_id: str, entry: Dict[str, Any]) -> None:
+        """Add or replace a document entry; a stored content hash is kept if entry has none."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO documents (user_id, id, filename, status, metadata, content_hash, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, id) DO UPDATE SET
+                    filename = excluded.filename,
+                    status = excluded.status,
+                    metadata = excluded.metadata,
+                    content_hash = COALESCE(excluded.content_hash, documents.content_hash),
+                    updated_at = excluded.updated_at
+                """,
+                (
+                    user_id,
+                    entry["id"],
+                    entry["filename"],
+                    entry.get("status", "processed"),
+                    json.dumps(entry.get("metadata", {}), ensure_ascii=False),
+                    entry.get("content_hash"),
+                    now,
+                    now
+                )
+            )
+
+    def update_status(
+        self,
+        user_id: str,
+        document_id: str,
+        status: str,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """
+        Set an existing entry's status (and metadata, if given).
+
+        Returns False, without creating it, when the entry does not exist.
+        """
+        with self._lock, self._conn:
+            if metadata is None:
+                cursor = self._conn.execute(
+                    "UPDATE documents SET status = ?, updated_at = ? WHERE user_id = ? AND id = ?",
+                    (status, time.time(), user_id, document_id)
+                )
+            else:
+                cursor = self._conn.execute(
+                    "UPDATE documents SET status = ?, metadata = ?, updated_at = ? WHERE user_id = ? AND id = ?",
+                    (status, json.dumps(metadata, ensure_ascii=False), time.time(), user_id, document_id)
+                )
+        return cursor.rowcount > 0
+
+    def list_by_status(self, statuses: Sequence[str]) -> List[Tuple[str, Dict[str, Any]]]:
+        """List (user_id, entry) for every user's documents in one of statuses, in upload order."""
+        placeholders = ", ".join("?" for _ in statuses)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT user_id, {_COLUMNS} FROM documents WHERE status IN ({placeholders}) ORDER BY seq",
+                tuple(statuses)
+            ).fetchall()
+        return [(row[0], self._to_entry(row[1:])) for row in rows]
+
+    def get(self, user_id: str, document_id: str) -> Optional[Dict[str, Any]]:
+        """Get one document entry."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM documents WHERE user_id = ? AND id = ?",
+                (user_id, document_id)
+            ).fetchone()
+        return self._to_entry(row) if row else None
+
+    def list_documents(self, user_id: str) -> List[Dict[str, Any]]:
+        """List a user's documents in upload order."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM documents WHERE user_id = ? ORDER BY seq",
+                (user_id,)
+            ).fetchall()
+        return [self._to_entry(row) for row in rows]
+
+    def list_by_hash(self, user_id: str, content_hash: str) -> List[Dict[str, Any]]:
+        """List a user's documents with the given content hash, in upload order."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM documents WHERE user_id = ? AND content_hash = ? ORDER BY seq",
+                (user_id, content_hash)
+            ).fetchall()
+        return [self._to_entry(row) for row in rows]
+
+    def delete(self, user_id: str, document_id: str) -> bool:
+        """Delete a document entry, returning whether it existed."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM documents WHERE user_id = ? AND id = ?",
+                (user_id, document_id)
+            )
+        return cursor.rowcount > 0
+
+    def import_legacy_catalog(self, user_id: str, catalog_path: str) -> int:
+        """
+        Import a user's catalog.json once, in a single transaction.
+
+        Returns the number of documents imported (0 if already imported).
+        """
+        with open(catalog_path, "r", encoding="utf-8") as f:
+            documents = json.load(f).get("documents", [])
+
+        now = time.time()
+        with self._lock, self._conn:
+            if self._conn.execute("SELECT 1 FROM legacy_imports WHERE user_id = ?", (user_id,)).fetchone():
+                return 0
+            self._conn.executemany(
+                """
+                INSERT OR IGNORE INTO documents
+                    (user_id, id, filename, status, metadata, content_hash, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (
+                        user_id,
+                        doc["id"],
+                        doc.get("filename", ""),
+                        doc.get("status", "processed"),
+                        json.dumps(doc.get("metadata", {}), ensure_ascii=False),
+                        doc.get("content_hash"),
+                        now,
+                        now
+                    )
+                    for doc in documents
+                ]
+            )
+            self._conn.execute(
+                "INSERT INTO legacy_imports (user_id, imported_at, documents) VALUES (?, ?, ?)",
+                (user_id, now, len(documents))
+            )
+        return len(documents)
+
+    def import_legacy_catalogs(self, user_data_dir: str) -> int:
+        """Import every user's catalog.json that has not been imported yet."""
+        if not os.path.isdir(user_data_dir):
+            return 0
+
+        with self._lock:
+            imported = {row[0] for row in self._conn.execute("SELECT user_id FROM legacy_imports")}
+
+        total = 0
+        for user_id in sorted(os.listdir(user_data_dir)):
+            catalog_path = os.path.join(user_data_dir, user_id, "catalog.json")
+            if user_id in imported or not os.path.isfile(catalog_path):
+                continue
+            count = self.import_legacy_catalog(user_id, catalog_path)
+            print(f"Imported {count} catalog entries for user {user_id}")
+            total += count
+        return total
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _to_entry(row) -> Dict[str, Any]:
+        """Convert a row to the catalog entry dict returned by the API."""
+        document_id, filename, status, metadata, content_hash = row
+        entry = {
+            "id": document_id,
+            "filename": filename,
+            "status": status,
+            "metadata": json.loads(metadata)
+        }
+        if content_hash:
+            entry["content_hash"] = content_hash
+        return entry
@@ -1,92 +1,246 @@
 import os
 import uuid
-import shutil
+import threading
 from pathlib import Path
-from typing import Dict, List, Any, Optional
-import json
-import tempfile
-from fastapi import UploadFile
+from typing import AsyncIterator, Callable, Dict, List, Any, Optional, Tuple
+import itertools
+from fastapi.concurrency import run_in_threadpool
 
 # Import document processing modules
-from data.document_parser import DocumentParser
+from data.document_parser import DocumentParser, decision_type_from_text
 from data.document_embeddings import DocumentEmbedder
+from data import embedding_store
+from data.processed_store import save_processed_document
+from data.embedding_cache import EmbeddingCache
+from data.inference_backend import model_variant
+from api.catalog_store import CatalogStore
+from api.vector_index import VectorIndex, VectorIndexCache
+from api.workspace import WorkspaceManager, is_valid_id
+from api.upload_stream import UploadTooLargeError, discard_staged_file, receive_upload
+from api.ingestion import (
+    IngestionQueue,
+    JobCancelledError,
+    PENDING_STATUSES,
+    STATUS_QUEUED,
+    STATUS_EXTRACTING,
+    STATUS_EMBEDDING,
+    STATUS_PROCESSED,
+    STATUS_FAILED,
+)
+
+def max_upload_bytes() -> int:
+    """Largest accepted upload in bytes (MAX_UPLOAD_BYTES, default 100 MB)."""
+    return int(os.getenv("MAX_UPLOAD_BYTES", 100 * 1024 * 1024))
 
 class DocumentService:
     def __init__(self):
         """Initialize the document service."""
-        self.parser = DocumentParser()
-        self.embedder = DocumentEmbedder()
-        
         # Set up directories
         self.base_dir = Path(__file__).parent.parent
         self.user_data_dir = self.base_dir / "user_data"
         self.user_data_dir.mkdir(exist_ok=True)
+        self.workspaces = WorkspaceManager(self.user_data_dir)
+        self.max_upload_bytes = max_upload_bytes()
+        # Uploads are streamed here, then moved into the user's raw directory;
+        # files left by interrupted uploads are removed on startup
+        self.upload_staging_dir = self.user_data_dir / ".uploads"
+        self.upload_staging_dir.mkdir(exist_ok=True)
+        for stale in self.upload_staging_dir.glob("*.part"):
+            stale.unlink(missing_ok=True)
+        
+        # Chunk embeddings are shared across users, so repeat uploads skip encoding
+        self.parser = DocumentParser()
+        model_name = "all-MiniLM-L6-v2"
+        # Cached vectors are keyed by model and inference backend, whose outputs differ slightly
+        self.embedding_cache = EmbeddingCache(
+            str(self.user_data_dir / "embedding_cache.sqlite"), model_variant(model_name)
+        )
+        self.embedder = DocumentEmbedder(model_name, cache=self.embedding_cache)
+        
+        # Resident per-user vector indexes for the query path
+        self.index_cache = VectorIndexCache()
+        self._empty_index = VectorIndex()
+        
+        # Background worker pool for document processing
+        self.ingestion = IngestionQueue()
+        
+        # Document catalog for all users; existing catalog.json files are imported once
+        self.catalog = CatalogStore(str(self.user_data_dir / "catalog.sqlite"))
+        self.catalog.import_legacy_catalogs(str(self.user_data_dir))
+        
+        # Per-user corpus versions; a new version is issued whenever a corpus changes
+        self._corpus_versions: Dict[str, int] = {}
+        self._version_counter = itertools.count(1)
+        self._corpus_listeners: List[Callable[[str], None]] = []
+        
+        # Makes the duplicate check and the new catalog entry of an upload atomic
+        self._upload_lock = threading.Lock()
+        
+        # Serializes writing a processed document's outputs with deleting documents,
+        # so a document deleted mid-processing is not written back
+        self._write_lock = threading.Lock()
+        
+        # Documents left unfinished by a previous process are picked up again
+        self._recover_interrupted_documents()
     
     def get_user_dir(self, user_id: str) -> Path:
-        """Get or create user-specific directory."""
-        user_dir = self.user_data_dir / user_id
-        user_dir.mkdir(exist_ok=True)
-        
-        # Create subdirectories
-        (user_dir / "raw").mkdir(exist_ok=True)
-        (user_dir / "processed").mkdir(exist_ok=True)
-        (user_dir / "embeddings").mkdir(exist_ok=True)
-        
-        return user_dir
+        """Get or create user-specific directory (write paths only)."""
+        return self.workspaces.ensure(user_id).root
     
-    async def upload_document(self, file: UploadFile, user_id: str) -> Dict[str, Any]:
-        """Upload and process a document."""
-        # Create user directory
-        user_dir = self.get_user_dir(user_id)
-        
-        # Generate a unique filename
-        original_filename = file.filename or "document.pdf"
-        file_extension = original_filename.split(".")[-1].lower()
-        
-        if file_extension != "pdf":
-            raise ValueError("Only PDF files are supported")
-        
-        # Create a unique filename
-        unique_id = str(uuid.uuid4())
-        unique_filename = f"{unique_id}.pdf"
-        
-        # Save the uploaded file
-        file_path = user_dir / "raw" / unique_filename
-        
-        # Create a temporary file
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            # Read the uploaded file in chunks and write to the temporary file
-            content = await file.read()
-            temp_file.write(content)
-            temp_file_path = temp_file.name
-        
-        # Move the temporary file to the destination
-        shutil.move(temp_file_path, file_path)
-        
-        # Process the document
-        processed_data = self.process_document(str(file_path), user_id, original_filename)
-        
-        if not processed_data:
-            raise ValueError("Failed to process document")
+    async def upload_document(self, content_type: str, stream: AsyncIterator[bytes]) -> Dict[str, Any]:
+        """
+        Store an uploaded document from a multipart request body and queue it for processing.
+
+        The form carries the PDF as "file" and the owner as "user_id"; the PDF
+        is written to disk once, as it is received.
+        """
+        # Disk and catalog work runs on the threadpool so the event loop is never blocked
+        upload = await receive_upload(content_type, stream, self.upload_staging_dir, self.max_upload_bytes)
+        try:
+            user_id = upload.fields.get("user_id")
+            if not user_id:
+                raise ValueError("Missing user_id form field")
+            # Create user directory (raises InvalidUserIdError for unusable ids)
+            workspace = await run_in_threadpool(self.workspaces.ensure, user_id)
+            
+            # Create a unique filename
+            unique_id = str(uuid.uuid4())
+            file_path = workspace.raw_dir / f"{unique_id}.pdf"
+            return await run_in_threadpool(
+                self._register_upload,
+                user_id, unique_id, upload.filename, upload.path, file_path, upload.sha256.hexdigest()
+            )
+        except BaseException:
+            await discard_staged_file(upload.path)
+            raise
+    
+    def _register_upload(
+        self,
+        user_id: str,
+        document_id: str,
+        original_filename: str,
+        partial_path: Path,
+        file_path: Path,
+        content_hash: str
+    ) -> Dict[str, Any]:
+        """Map a stored upload to an existing copy of the same PDF, or catalog it and queue it."""
+        with self._upload_lock:
+            # The same PDF uploaded again by this user maps to the existing document
+            existing = self._find_document_by_hash(user_id, content_hash)
+            if existing is not None:
+                entry, job = existing
+                partial_path.unlink()
+                return {
+                    "id": entry["id"],
+                    "filename": entry["filename"],
+                    "status": entry.get("status", STATUS_PROCESSED),
+                    "metadata": entry.get("metadata", {}),
+                    "job_id": job["job_id"] if job else None
+                }
+            
+            os.replace(partial_path, file_path)
+            
+            # Record the document and hand processing off to the worker pool
+            self.set_document_status(
+                user_id, document_id, original_filename, STATUS_QUEUED, content_hash=content_hash
+            )
+            job = self._submit_ingestion(user_id, document_id, file_path, original_filename)
         
         return {
-            "id": unique_id,
+            "id": document_id,
             "filename": original_filename,
-            "status": "processed",
-            "metadata": processed_data.get("metadata", {})
+            "status": STATUS_QUEUED,
+            "metadata": {},
+            "job_id": job["job_id"]
         }
     
-    def process_document(self, pdf_path: str, user_id: str, original_filename: str) -> Optional[Dict[str, Any]]:
-        """Process a document and generate embeddings."""
-        user_dir = self.get_user_dir(user_id)
+    def _submit_ingestion(
+        self,
+        user_id: str,
+        document_id: str,
+        pdf_path: Path,
+        original_filename: str
+    ) -> Dict[str, Any]:
+        """Queue an uploaded PDF for processing on the worker pool."""
+        return self.ingestion.submit(
+            lambda report: self._ingest_document(str(pdf_path), user_id, original_filename, report),
+            user_id=user_id,
+            document_id=document_id
+        )
+    
+    def _recover_interrupted_documents(self) -> None:
+        """Requeue documents a previous process left queued or in progress; fail those without a PDF."""
+        for user_id, entry in self.catalog.list_by_status(PENDING_STATUSES):
+            workspace = self.workspaces.get(user_id)
+            pdf_path = workspace.raw_dir / f"{entry['id']}.pdf" if workspace is not None else None
+            if pdf_path is not None and pdf_path.exists():
+                print(f"Requeueing interrupted document {entry['id']} of user {user_id}")
+                self.catalog.update_status(user_id, entry["id"], STATUS_QUEUED)
+                self._submit_ingestion(user_id, entry["id"], pdf_path, entry["filename"])
+            else:
+                self.catalog.update_status(
+                    user_id, entry["id"], STATUS_FAILED,
+                    {"error": "Processing was interrupted and the uploaded file is missing"}
+                )
+    
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get the status of an ingestion job."""
+        return self.ingestion.get_job(job_id)
+    
+    def _ingest_document(
+        self,
+        pdf_path: str,
+        user_id: str,
+        original_filename: str,
+        report: Callable[[str], None]
+    ) -> None:
+        """Process an uploaded document on a worker, mirroring progress to the catalog."""
+        doc_id = os.path.basename(pdf_path).split(".")[0]
+        
+        def update_status(status: str) -> None:
+            # Both raise JobCancelledError once the document is deleted
+            report(status)
+            if not self.catalog.update_status(user_id, doc_id, status, {}):
+                raise JobCancelledError(f"Document {doc_id} was deleted")
+        
+        try:
+            processed_data = self.process_document(
+                pdf_path, user_id, original_filename, status_callback=update_status
+            )
+            if not processed_data:
+                raise ValueError("Failed to process document")
+        except JobCancelledError:
+            raise
+        except Exception as e:
+            # Only update the entry; a deleted document is not recreated as failed
+            if not self.catalog.update_status(user_id, doc_id, STATUS_FAILED, {"error": str(e)}):
+                raise JobCancelledError(f"Document {doc_id} was deleted") from e
+            raise
+    
+    def process_document(
+        self,
+        pdf_path: str,
+        user_id: str,
+        original_filename: str,
+        status_callback: Optional[Callable[[str], None]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Process a document and generate embeddings.
+        
+        Outputs are only written while the document is still in the catalog;
+        JobCancelledError is raised if it was deleted during processing.
+        """
+        workspace = self.workspaces.ensure(user_id)
         
         # Extract the document ID from the filename
         doc_id = os.path.basename(pdf_path).split(".")[0]
         
         # Process the document
-        processed_path = user_dir / "processed" / f"{doc_id}.json"
+        processed_path = workspace.processed_dir / f"{doc_id}.json"
         
         # Extract text and metadata
+        if status_callback:
+            status_callback(STATUS_EXTRACTING)
         text = self.parser.extract_text_from_pdf(pdf_path)
         if not text:
             return None
@@ -94,153 +248,256 @@ class DocumentService:
         # Clean the text
         text = self.parser.clean_legal_text(text)
         
-        # Extract sections
-        sections = self.parser.extract_sections(text)
+        # Locate sections as offsets into the cleaned text
+        section_spans = self.parser.extract_section_spans(text)
         
         # Create document metadata
         metadata = {
             "id": doc_id,
             "filename": original_filename,
-            "sections": {k: len(v) for k, v in sections.items()},
+            "sections": {k: end - start for k, (start, end) in section_spans.items()},
             "total_length": len(text)
         }
+        # Uploads are named freely, so the type comes from the title, when one is found
+        document_type = decision_type_from_text(text)
+        if document_type:
+            metadata["decision_type"] = document_type
         
         # Create document object
         document = {
             "id": doc_id,
             "filename": original_filename,
             "full_text": text,
-            "sections": sections,
+            "section_spans": {name: list(span) for name, span in section_spans.items()},
             "metadata": metadata
         }
         
-        # Save processed document
-        with open(processed_path, "w", encoding="utf-8") as f:
-            json.dump(document, f, ensure_ascii=False, indent=2)
-        
         # Create chunks and embeddings
+        if status_callback:
+            status_callback(STATUS_EMBEDDING)
         chunks = self.embedder.create_document_chunks(document)
         chunks_with_embeddings = self.embedder.generate_embeddings(chunks)
+        postings = self.embedder.lexical_postings(chunks_with_embeddings)
         
-        # Save embeddings
-        embeddings_path = user_dir / "embeddings" / f"{doc_id}.json"
-        with open(embeddings_path, "w", encoding="utf-8") as f:
-            json.dump(chunks_with_embeddings, f, ensure_ascii=False, indent=2)
-        
-        # Update user's document catalog
-        self.update_user_catalog(user_id, document)
+        with self._write_lock:
+            if self.catalog.get(user_id, doc_id) is None:
+                raise JobCancelledError(f"Document {doc_id} was deleted")
+            
+            # Save processed document
+            save_processed_document(str(processed_path), document)
+            
+            # Vectors go to the shared store, which identical chunks of other documents
+            # reuse; the document keeps their keys with its metadata and BM25 postings
+            vector_keys = self.embedding_cache.retain(
+                self._cache_owner(user_id, doc_id),
+                [chunk["text"] for chunk in chunks_with_embeddings],
+                [chunk["embedding"] for chunk in chunks_with_embeddings]
+            )
+            embedding_store.save_document_embeddings(
+                str(workspace.embeddings_dir), doc_id, chunks_with_embeddings,
+                postings=postings, vector_keys=vector_keys
+            )
+            
+            # Update the user's resident index, if loaded
+            self.index_cache.add_document(
+                user_id, doc_id, chunks_with_embeddings, postings, self._document_facets(document)
+            )
+            self._corpus_changed(user_id)
+            
+            # Update user's document catalog
+            self.update_user_catalog(user_id, document)
         
         return document
     
+    def _document_facets(self, entry: Dict[str, Any]) -> Dict[str, str]:
+        """Document-level values queries can filter on, from a catalog entry or processed document."""
+        metadata = entry.get("metadata", {})
+        # Documents without a recognizable title (or processed before types were recorded) have none
+        if not metadata.get("decision_type"):
+            return {}
+        return {"decision_type": metadata["decision_type"]}
+    
+    def _cache_owner(self, user_id: str, doc_id: str) -> str:
+        """Reference owner for a user's document in the shared embedding cache."""
+        return f"{user_id}/{doc_id}"
+    
     def update_user_catalog(self, user_id: str, document: Dict[str, Any]) -> None:
         """Update the user's document catalog."""
-        user_dir = self.get_user_dir(user_id)
-        catalog_path = user_dir / "catalog.json"
-        
-        # Create or load existing catalog
-        if catalog_path.exists():
-            with open(catalog_path, "r", encoding="utf-8") as f:
-                catalog = json.load(f)
-        else:
-            catalog = {"documents": []}
-        
-        # Add or update document in catalog
-        doc_entry = {
+        self._upsert_catalog_entry(user_id, {
             "id": document["id"],
             "filename": document["filename"],
-            "status": "processed",
+            "status": STATUS_PROCESSED,
             "metadata": document["metadata"]
+        })
+    
+    def set_document_status(
+        self,
+        user_id: str,
+        document_id: str,
+        filename: str,
+        status: str,
+        error: Optional[str] = None,
+        content_hash: Optional[str] = None
+    ) -> None:
+        """Record a document's processing status in the user's catalog."""
+        doc_entry = {
+            "id": document_id,
+            "filename": filename,
+            "status": status,
+            "metadata": {"error": error} if error else {}
         }
-        
-        # Check if document already exists
-        for i, existing_doc in enumerate(catalog["documents"]):
-            if existing_doc["id"] == document["id"]:
-                catalog["documents"][i] = doc_entry
-                break
-        else:
-            catalog["documents"].append(doc_entry)
-        
-        # Save updated catalog
-        with open(catalog_path, "w", encoding="utf-8") as f:
-            json.dump(catalog, f, ensure_ascii=False, indent=2)
+        if content_hash:
+            doc_entry["content_hash"] = content_hash
+        self._upsert_catalog_entry(user_id, doc_entry)
+    
+    def _find_document_by_hash(
+        self,
+        user_id: str,
+        content_hash: str
+    ) -> Optional[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]:
+        """
+        Find a user's document with the given content hash, as (entry, live job).
+        
+        Only processed documents and documents with a queued or running job
+        count; failed or abandoned entries never block a new upload.
+        """
+        for entry in self.catalog.list_by_hash(user_id, content_hash):
+            if entry["status"] == STATUS_PROCESSED:
+                return entry, None
+            job = self.ingestion.active_job(user_id, entry["id"])
+            if job is not None:
+                return entry, job
+        return None
+    
+    def _upsert_catalog_entry(self, user_id: str, doc_entry: Dict[str, Any]) -> None:
+        """Add or replace a document entry in the user's catalog."""
+        self.catalog.upsert(user_id, doc_entry)
     
     def get_user_documents(self, user_id: str) -> List[Dict[str, Any]]:
         """Get a list of documents for a user."""
-        user_dir = self.get_user_dir(user_id)
-        catalog_path = user_dir / "catalog.json"
-        
-        if not catalog_path.exists():
-            return []
-        
-        with open(catalog_path, "r", encoding="utf-8") as f:
-            catalog = json.load(f)
-        
-        # Add status field to each document
-        documents = catalog["documents"]
-        for doc in documents:
-            # Add status field if it doesn't exist
-            if "status" not in doc:
-                doc["status"] = "processed"
-        
-        return documents
+        return self.catalog.list_documents(user_id)
     
     def get_document_chunks(self, user_id: str, document_id: Optional[str] = None) -> List[Dict[str, Any]]:
         """Get document chunks for a user, optionally filtered by document ID."""
-        user_dir = self.get_user_dir(user_id)
-        embeddings_dir = user_dir / "embeddings"
+        # Unknown users and invalid ids have no chunks; nothing is created on this read path
+        workspace = self.workspaces.get(user_id)
+        if workspace is None or not workspace.exists():
+            return []
+        if document_id and not is_valid_id(document_id):
+            return []
+        embeddings_dir = workspace.embeddings_dir
         
         all_chunks = []
         
         # If document_id is provided, only load that document
         if document_id:
-            embedding_path = embeddings_dir / f"{document_id}.json"
-            if embedding_path.exists():
-                with open(embedding_path, "r", encoding="utf-8") as f:
-                    chunks = json.load(f)
-                all_chunks.extend(chunks)
+            if embedding_store.has_document(str(embeddings_dir), document_id):
+                all_chunks.extend(
+                    embedding_store.load_document_chunks(
+                        str(embeddings_dir), document_id, vectors=self.embedding_cache.vectors
+                    )
+                )
         else:
             # Load all documents
-            for embedding_file in embeddings_dir.glob("*.json"):
-                with open(embedding_file, "r", encoding="utf-8") as f:
-                    chunks = json.load(f)
-                all_chunks.extend(chunks)
+            for doc_id in embedding_store.list_document_ids(str(embeddings_dir)):
+                all_chunks.extend(
+                    embedding_store.load_document_chunks(
+                        str(embeddings_dir), doc_id, vectors=self.embedding_cache.vectors
+                    )
+                )
         
         return all_chunks
+    
+    def get_corpus_key(self, user_id: str) -> Tuple[str, int]:
+        """Get a (user_id, version) key that changes whenever the user's corpus changes."""
+        version = self._corpus_versions.get(user_id)
+        if version is None:
+            version = self._corpus_versions.setdefault(user_id, next(self._version_counter))
+        return user_id, version
+    
+    def add_corpus_listener(self, listener: Callable[[str], None]) -> None:
+        """Register a callback invoked with the user ID after an upload or delete."""
+        self._corpus_listeners.append(listener)
+    
+    def _corpus_changed(self, user_id: str) -> None:
+        """Issue a new corpus version for a user and notify listeners."""
+        self._corpus_versions[user_id] = next(self._version_counter)
+        for listener in self._corpus_listeners:
+            listener(user_id)
+    
+    def get_user_index(self, user_id: str) -> VectorIndex:
+        """Get the resident vector index for a user, loading it on first use."""
+        # Unknown users and invalid ids share one empty index that is never cached
+        workspace = self.workspaces.get(user_id)
+        if workspace is None or not workspace.exists():
+            return self._empty_index
+        return self.index_cache.get(user_id, self._build_user_index)
+    
+    def _build_user_index(self, user_id: str) -> VectorIndex:
+        """Build a vector index from all of a user's embedding files."""
+        index = VectorIndex()
+        workspace = self.workspaces.get(user_id)
+        if workspace is None or not workspace.exists():
+            return index
+        embeddings_dir = workspace.embeddings_dir
+        catalog = {entry["id"]: entry for entry in self.catalog.list_documents(user_id)}
+        
+        for doc_id in embedding_store.list_document_ids(str(embeddings_dir)):
+            try:
+                embeddings, chunks = embedding_store.load_document_embeddings(
+                    str(embeddings_dir), doc_id, vectors=self.embedding_cache.vectors
+                )
+            except KeyError as e:
+                # Its shared vectors were released by a delete that raced this load
+                print(f"Skipping document {doc_id} of user {user_id}: {str(e)}")
+                continue
+            postings = embedding_store.load_document_postings(str(embeddings_dir), doc_id)
+            # Documents missing from the catalog fall back to their chunks' source file name
+            entry = catalog.get(doc_id) or {"filename": chunks[0]["source"] if chunks else ""}
+            facets = self._document_facets(entry)
+            index.add_embeddings(doc_id, embeddings, chunks, postings, facets)
+        
+        return index
         
     def delete_document(self, user_id: str, document_id: str) -> bool:
         """Delete a document and all associated files."""
-        user_dir = self.get_user_dir(user_id)
+        workspace = self.workspaces.get(user_id)
+        if workspace is None or not is_valid_id(document_id):
+            return False
         
         # Paths to all files related to this document
-        raw_file = user_dir / "raw" / f"{document_id}.pdf"
-        processed_file = user_dir / "processed" / f"{document_id}.json"
-        embeddings_file = user_dir / "embeddings" / f"{document_id}.json"
-        
-        # Check if document exists
-        if not raw_file.exists() and not processed_file.exists() and not embeddings_file.exists():
-            return False
-            
-        # Delete files if they exist
-        if raw_file.exists():
-            raw_file.unlink()
-            
-        if processed_file.exists():
-            processed_file.unlink()
-            
-        if embeddings_file.exists():
-            embeddings_file.unlink()
-            
-        # Update catalog
-        catalog_path = user_dir / "catalog.json"
-        if catalog_path.exists():
-            with open(catalog_path, "r", encoding="utf-8") as f:
-                catalog = json.load(f)
+        raw_file = workspace.raw_dir / f"{document_id}.pdf"
+        processed_file = workspace.processed_dir / f"{document_id}.json"
+        embeddings_dir = str(workspace.embeddings_dir)
+        
+        # A running job stops at its next step and never writes its outputs back
+        self.ingestion.cancel(user_id, document_id)
+        
+        with self._write_lock:
+            # Check if document exists
+            if (
+                not raw_file.exists()
+                and not processed_file.exists()
+                and not embedding_store.has_document(embeddings_dir, document_id)
+                and self.catalog.get(user_id, document_id) is None
+            ):
+                return False
+                
+            # Delete files if they exist
+            if raw_file.exists():
+                raw_file.unlink()
+                
+            if processed_file.exists():
+                processed_file.unlink()
                 
-            # Remove document from catalog
-            catalog["documents"] = [doc for doc in catalog["documents"] if doc["id"] != document_id]
+            embedding_store.delete_document_embeddings(embeddings_dir, document_id)
+            self.embedding_cache.release(self._cache_owner(user_id, document_id))
             
-            # Save updated catalog
-            with open(catalog_path, "w", encoding="utf-8") as f:
-                json.dump(catalog, f, ensure_ascii=False, indent=2)
+            # Drop the document from the user's resident index
+            self.index_cache.remove_document(user_id, document_id)
+            self._corpus_changed(user_id)
                 
-        return True 
\ No newline at end of file
+            # Update catalog
+            self.catalog.delete(user_id, document_id)
+                    
+            return True 
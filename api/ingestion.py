@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Job and catalog statuses, in pipeline order
+STATUS_QUEUED = "queued"
+STATUS_EXTRACTING = "extracting"
+STATUS_EMBEDDING = "embedding"
+STATUS_PROCESSED = "processed"
+STATUS_FAILED = "failed"
+# Job status of a document deleted before its processing finished
+STATUS_CANCELLED = "cancelled"
+
+# Catalog statuses of documents still being processed
+PENDING_STATUSES = (STATUS_QUEUED, STATUS_EXTRACTING, STATUS_EMBEDDING)
+
+class JobCancelledError(Exception):
+    """Raised inside a task whose document was deleted while it was being processed."""
+
+class IngestionQueue:
+    """Runs document processing jobs on a worker pool and tracks their status."""
+
+    def __init__(self, max_workers: Optional[int] = None, job_ttl: Optional[float] = None):
+        """
+        Initialize the worker pool (INGESTION_WORKERS, default 2).
+
+        Finished jobs stay queryable for job_ttl seconds (INGESTION_JOB_TTL, default 3600).
+        """
+        if max_workers is None:
+            max_workers = int(os.getenv("INGESTION_WORKERS", 2))
+        if job_ttl is None:
+            job_ttl = float(os.getenv("INGESTION_JOB_TTL", 3600))
+        self.job_ttl = job_ttl
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="ingestion"
+        )
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        # Job of each (user_id, document_id) that is queued or running
+        self._active: Dict[Tuple[str, str], str] = {}
+        # Finished job ids with their finish time, oldest first
+        self._finished: "OrderedDict[str, float]" = OrderedDict()
+        self._cancelled = set()
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        task: Callable[[Callable[[str], None]], None],
+        user_id: str,
+        document_id: str
+    ) -> Dict[str, Any]:
+        """
+        Queue a processing task.
+
+        The task is called with a status callback it uses to report progress;
+        the callback raises JobCancelledError once the job is cancelled. An
+        exception raised by the task marks the job as failed.
+        """
+        now = time.time()
+        job = {
+            "job_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "document_id": document_id,
+            "status": STATUS_QUEUED,
+            "error": None,
+            "created_at": now,
+            "updated_at": now
+        }
+        with self._lock:
+            self._expire(now)
+            self.jobs[job["job_id"]] = job
+            self._active[(user_id, document_id)] = job["job_id"]
+            queued = dict(job)
+
+        self.executor.submit(self._run, job["job_id"], task)
+        return queued
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a copy of a job's current state."""
+        with self._lock:
+            self._expire(time.time())
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def active_job(self, user_id: str, document_id: str) -> Optional[Dict[str, Any]]:
+        """Get a copy of the queued or running job of a document, if any."""
+        with self._lock:
+            job_id = self._active.get((user_id, document_id))
+            return dict(self.jobs[job_id]) if job_id else None
+
+    def cancel(self, user_id: str, document_id: str) -> bool:
+        """Ask a document's queued or running job to stop at its next status report."""
+        with self._lock:
+            job_id = self._active.get((user_id, document_id))
+            if job_id is None:
+                return False
+            self._cancelled.add(job_id)
+            return True
+
+    def is_cancelled(self, job_id: str) -> bool:
+        """Whether a job was cancelled."""
+        with self._lock:
+            return job_id in self._cancelled
+
+    def _expire(self, now: float) -> None:
+        """Forget jobs that finished more than job_ttl seconds ago (lock held)."""
+        while self._finished:
+            job_id, finished_at = next(iter(self._finished.items()))
+            if now - finished_at < self.job_ttl:
+                break
+            del self._finished[job_id]
+            del self.jobs[job_id]
+
+    def _set_status(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        """Update a job's status, raising JobCancelledError if it was cancelled."""
+        with self._lock:
+            if job_id in self._cancelled:
+                raise JobCancelledError(f"Job {job_id} was cancelled")
+            job = self.jobs[job_id]
+            job["status"] = status
+            job["error"] = error
+            job["updated_at"] = time.time()
+
+    def _finish(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        """Record a job's final status and release its document."""
+        now = time.time()
+        with self._lock:
+            job = self.jobs[job_id]
+            job["status"] = status
+            job["error"] = error
+            job["updated_at"] = now
+            key = (job["user_id"], job["document_id"])
+            if self._active.get(key) == job_id:
+                del self._active[key]
+            self._cancelled.discard(job_id)
+            self._finished[job_id] = now
+
+    def _run(self, job_id: str, task: Callable[[Callable[[str], None]], None]) -> None:
+        """Execute a task on a worker thread."""
+        try:
+            if self.is_cancelled(job_id):
+                raise JobCancelledError(f"Job {job_id} was cancelled")
+            task(lambda status: self._set_status(job_id, status))
+            self._finish(job_id, STATUS_PROCESSED)
+        except JobCancelledError:
+            print(f"Ingestion job {job_id} cancelled")
+            self._finish(job_id, STATUS_CANCELLED)
+        except Exception as e:
+            print(f"Ingestion job {job_id} failed: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            self._finish(job_id, STATUS_FAILED, error=str(e))
+
+    def shutdown(self) -> None:
+        """Stop accepting jobs and wait for running ones to finish."""
+        self.executor.shutdown(wait=True)
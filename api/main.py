@@ -1,16 +1,23 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends
+from fastapi import FastAPI, HTTPException, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any, Tuple
 import sys
 import os
+import json
+import threading
 from pathlib import Path
 from api.qa_service import QAService
-from api.document_service import DocumentService
+from api.document_service import DocumentService, UploadTooLargeError, max_upload_bytes
+from api.vector_index import VectorIndex
 
 # Add the parent directory to Python path to import the QA system
 sys.path.append(str(Path(__file__).parent.parent))
 from data.qa_system import LegalQASystem
+from data.micro_batcher import batching_stats
+from data.model_registry import registry
 
 app = FastAPI(
     title="Philippine Legal Assistant API",
@@ -27,12 +34,128 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-qa_service = QAService()
-document_service = DocumentService()
+# Multipart framing and form fields on top of the file itself
+UPLOAD_OVERHEAD_BYTES = 64 * 1024
 
-# For backward compatibility
-qa_system = LegalQASystem()
+class UploadSizeLimitMiddleware:
+    """
+    Rejects upload request bodies over the limit while they are received.
+    
+    A declared Content-Length over the limit is refused before any of the body
+    is read; bodies without one are cut off once they pass the limit.
+    """
+    
+    def __init__(self, app, path: str, max_bytes: int):
+        self.app = app
+        self.path = path
+        self.max_bytes = max_bytes
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != self.path:
+            await self.app(scope, receive, send)
+            return
+        
+        too_large = JSONResponse(status_code=413, content={"detail": "Request body exceeds the upload limit"})
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await too_large(scope, receive, send)
+            return
+        
+        # Bodies without a (truthful) length are counted as they stream in
+        received = 0
+        exceeded = False
+        response_started = False
+        
+        async def limited_receive():
+            nonlocal received, exceeded
+            if exceeded:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Stop reading; the app sees a disconnected client
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+        
+        async def guarded_send(message):
+            nonlocal response_started
+            if exceeded:
+                return
+            response_started = True
+            await send(message)
+        
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not response_started:
+            await too_large(scope, receive, send)
+
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    path="/api/upload",
+    max_bytes=max_upload_bytes() + UPLOAD_OVERHEAD_BYTES
+)
+
+# Services are created on first use so the server can bind before any model loads
+_services: Dict[str, Any] = {}
+_services_lock = threading.RLock()
+
+def _get_service(name: str, factory):
+    """Get a service instance, creating it on first use."""
+    service = _services.get(name)
+    if service is None:
+        with _services_lock:
+            service = _services.get(name)
+            if service is None:
+                service = factory()
+                _services[name] = service
+    return service
+
+def _create_qa_service() -> QAService:
+    qa_service = QAService()
+    # Drop cached answers as soon as a user's corpus changes
+    get_document_service().add_corpus_listener(qa_service.invalidate_corpus)
+    return qa_service
+
+def get_qa_service() -> QAService:
+    return _get_service("qa_service", _create_qa_service)
+
+def get_document_service() -> DocumentService:
+    return _get_service("document_service", DocumentService)
+
+def get_legacy_qa_system() -> LegalQASystem:
+    """Get the legacy QA system, loaded only when the legacy endpoint is first used."""
+    return _get_service("legacy_qa_system", LegalQASystem)
+
+def _load_query_context(user_id: str) -> Tuple[QAService, VectorIndex, Tuple[str, int]]:
+    """
+    Get the QA service, the user's resident index and its corpus key.
+    
+    Services may be created and the index loaded from disk here, so endpoints
+    call this in the threadpool.
+    """
+    document_service = get_document_service()
+    # Read the key first: an answer is never cached under a version newer than its index
+    corpus_key = document_service.get_corpus_key(user_id)
+    return get_qa_service(), document_service.get_user_index(user_id), corpus_key
+
+def warm_models_on_startup() -> bool:
+    """Whether the query-path models are loaded at startup (WARM_MODELS_ON_STARTUP, default true)."""
+    return os.getenv("WARM_MODELS_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+@app.on_event("startup")
+async def warm_up_models():
+    """Create the services, and load the query-path models unless disabled, in the background once the server is up."""
+    def warm_up():
+        qa_service = get_qa_service()
+        if warm_models_on_startup():
+            qa_service.warm_up()
+    threading.Thread(target=warm_up, daemon=True).start()
 
 class QuestionRequest(BaseModel):
     question: str
@@ -40,23 +163,55 @@ class QuestionRequest(BaseModel):
     document_id: Optional[str] = None
     top_k: Optional[int] = 3
     threshold: Optional[float] = 0.5
+    # Retrieval filters; each accepts any of the listed values
+    document_ids: Optional[List[str]] = None
+    section_types: Optional[List[str]] = None
+    decision_types: Optional[List[str]] = None
+
+class BatchQuestionRequest(BaseModel):
+    questions: List[str] = Field(..., min_length=1, max_length=100)
+    user_id: str
+    document_id: Optional[str] = None
+    top_k: Optional[int] = 3
+    document_ids: Optional[List[str]] = None
+    section_types: Optional[List[str]] = None
+    decision_types: Optional[List[str]] = None
 
 class ChunkInfo(BaseModel):
     text: str
     source: str
     similarity: float
 
+class AnswerSpan(BaseModel):
+    chunk: int
+    start: int
+    end: int
+
 class AnswerResponse(BaseModel):
     answer: str
     confidence: Optional[float] = None
     source: Optional[str] = None
     relevant_chunks: List[ChunkInfo] = []
+    answer_span: Optional[AnswerSpan] = None
+
+class BatchAnswerResponse(BaseModel):
+    results: List[AnswerResponse]
 
 class DocumentResponse(BaseModel):
     id: str
     filename: str
     status: str
     metadata: Dict[str, Any] = {}
+    job_id: Optional[str] = None
+
+class JobResponse(BaseModel):
+    job_id: str
+    user_id: str
+    document_id: str
+    status: str
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
 
 class DocumentListResponse(BaseModel):
     documents: List[DocumentResponse]
@@ -66,6 +221,43 @@ async def root():
     """Health check endpoint."""
     return {"status": "ok", "message": "Philippine Legal Assistant API is running"}
 
+@app.get("/ready")
+async def ready():
+    """
+    Readiness endpoint reporting which models are warm.
+    
+    Returns 503 until the services exist and, unless WARM_MODELS_ON_STARTUP
+    is off, the query-path models are loaded, so load balancers can route
+    around cold workers. With warm-up off, models load on the first query.
+    """
+    qa_service = _services.get("qa_service")
+    is_ready = qa_service is not None and (not warm_models_on_startup() or qa_service.is_ready())
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={
+            "status": "ready" if is_ready else "warming",
+            "components": {
+                name: name in _services
+                for name in ("qa_service", "document_service", "legacy_qa_system")
+            },
+            "models": registry.memory_footprint()
+        }
+    )
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Hit/miss counters for the query embedding, answer and chunk embedding caches."""
+    qa_service = await run_in_threadpool(get_qa_service)
+    document_service = await run_in_threadpool(get_document_service)
+    stats = qa_service.cache_stats()
+    stats["chunk_embeddings"] = await run_in_threadpool(document_service.embedding_cache.stats)
+    return stats
+
+@app.get("/api/batching/stats")
+async def batch_stats():
+    """Batch sizes, queueing delay and throughput of the model batchers."""
+    return batching_stats()
+
 @app.post("/api/query", response_model=AnswerResponse)
 async def query(request: QuestionRequest):
     """
@@ -78,13 +270,10 @@ async def query(request: QuestionRequest):
         AnswerResponse object containing the answer and related information
     """
     try:
-        # Get document chunks for the user
-        chunks = document_service.get_document_chunks(
-            user_id=request.user_id,
-            document_id=request.document_id
-        )
+        # Get the resident vector index for the user (loading it blocks, so off the event loop)
+        qa_service, index, corpus_key = await run_in_threadpool(_load_query_context, request.user_id)
         
-        if not chunks:
+        if not len(index) or (request.document_id and not index.has_document(request.document_id)):
             return AnswerResponse(
                 answer="No documents found. Please upload documents first.",
                 confidence=0.0,
@@ -92,12 +281,17 @@ async def query(request: QuestionRequest):
                 relevant_chunks=[]
             )
         
-        # Get answer using QA service
+        # Get answer using QA service; it runs in the threadpool so concurrent
+        # requests can wait on the model batchers together
         try:
-            result = qa_service.answer_question(
+            result = await run_in_threadpool(
+                qa_service.answer_question,
                 question=request.question,
-                chunks=chunks,
-                top_k=request.top_k
+                index=index,
+                top_k=request.top_k,
+                document_id=request.document_id,
+                corpus_key=corpus_key,
+                filters=_filters(request)
             )
         except Exception as qa_error:
             print(f"Error in QA service: {str(qa_error)}")
@@ -108,23 +302,7 @@ async def query(request: QuestionRequest):
                 detail=f"Error processing question: {str(qa_error)}"
             )
         
-        # Transform chunks into response format
-        formatted_chunks = [
-            ChunkInfo(
-                text=chunk["text"],
-                source=chunk["source"],
-                similarity=chunk["similarity"]
-            )
-            for chunk in result.get("relevant_chunks", [])
-        ]
-        
-        # Return formatted response
-        return AnswerResponse(
-            answer=result["answer"],
-            confidence=0.0,  # Not provided by the new service
-            source=result.get("sources", [None])[0] if result.get("sources") else None,
-            relevant_chunks=formatted_chunks
-        )
+        return _to_answer_response(result)
     except HTTPException:
         raise
     except Exception as e:
@@ -133,29 +311,198 @@ async def query(request: QuestionRequest):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
-@app.post("/api/upload", response_model=DocumentResponse)
-async def upload_document(
-    file: UploadFile = File(...),
-    user_id: str = Form(...)
-):
+@app.post("/api/query/batch", response_model=BatchAnswerResponse)
+async def query_batch(request: BatchQuestionRequest):
+    """
+    Answer several questions about the same user corpus in one request.
+    
+    All questions are encoded in one call, scored with a single matrix
+    product and read by the QA model in batches.
+    
+    Args:
+        request: BatchQuestionRequest object containing the questions and user information
+        
+    Returns:
+        BatchAnswerResponse with one AnswerResponse per question, in order
+    """
+    try:
+        qa_service, index, corpus_key = await run_in_threadpool(_load_query_context, request.user_id)
+        
+        if not len(index) or (request.document_id and not index.has_document(request.document_id)):
+            return BatchAnswerResponse(results=[
+                AnswerResponse(
+                    answer="No documents found. Please upload documents first.",
+                    confidence=0.0,
+                    source=None,
+                    relevant_chunks=[]
+                )
+                for _ in request.questions
+            ])
+        
+        results = await run_in_threadpool(
+            qa_service.answer_questions,
+            questions=request.questions,
+            index=index,
+            top_k=request.top_k,
+            document_id=request.document_id,
+            corpus_key=corpus_key,
+            filters=_filters(request)
+        )
+        return BatchAnswerResponse(results=[_to_answer_response(result) for result in results])
+    except Exception as e:
+        print(f"Unexpected error in batch query endpoint: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+@app.post("/api/query/stream")
+async def query_stream(request: QuestionRequest):
     """
-    Upload a document for processing.
+    Stream the answer to a legal question as Server-Sent Events.
+    
+    Emits a "chunks" event with the ranked relevant chunks as soon as
+    retrieval finishes, then an "answer" event with the extracted answer,
+    confidence and source, and finally "done". Failures are reported as an
+    "error" event.
     
     Args:
+        request: QuestionRequest object containing the question and user information
+    """
+    def events():
+        try:
+            qa_service, index, corpus_key = _load_query_context(request.user_id)
+            
+            if not len(index) or (request.document_id and not index.has_document(request.document_id)):
+                yield _sse("chunks", {"sources": [], "relevant_chunks": []})
+                yield _sse("answer", {
+                    "answer": "No documents found. Please upload documents first.",
+                    "confidence": 0.0,
+                    "source": None
+                })
+            else:
+                for event, payload in qa_service.stream_answer(
+                    question=request.question,
+                    index=index,
+                    top_k=request.top_k,
+                    document_id=request.document_id,
+                    corpus_key=corpus_key,
+                    filters=_filters(request)
+                ):
+                    yield _sse(event, payload)
+            yield _sse("done", {})
+        except Exception as e:
+            print(f"Unexpected error in streaming query endpoint: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            yield _sse("error", {"detail": f"Unexpected error: {str(e)}"})
+    
+    # A sync generator is iterated in the threadpool, keeping the event loop free
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _filters(request: Any) -> Optional[Dict[str, List[str]]]:
+    """Retrieval filters of a question request, keyed as VectorIndex.search expects."""
+    filters = {
+        key: values
+        for key, values in (
+            ("document_id", request.document_ids),
+            ("section_type", request.section_types),
+            ("decision_type", request.decision_types)
+        )
+        if values
+    }
+    return filters or None
+
+def _sse(event: str, payload: Dict[str, Any]) -> str:
+    """Format a Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def _to_answer_response(result: Dict[str, Any]) -> AnswerResponse:
+    """Convert a QAService result into an AnswerResponse."""
+    # Transform chunks into response format
+    formatted_chunks = [
+        ChunkInfo(
+            text=chunk["text"],
+            source=chunk["source"],
+            similarity=chunk["similarity"]
+        )
+        for chunk in result.get("relevant_chunks", [])
+    ]
+    
+    # Return formatted response
+    return AnswerResponse(
+        answer=result["answer"],
+        confidence=result.get("confidence") or 0.0,
+        source=result.get("source"),
+        relevant_chunks=formatted_chunks,
+        answer_span=result.get("answer_span")
+    )
+
+# The form is parsed by the service so the PDF is streamed to disk only once;
+# the schema is declared here for the API docs
+UPLOAD_REQUEST_BODY = {
+    "required": True,
+    "content": {
+        "multipart/form-data": {
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "file": {"type": "string", "format": "binary"},
+                    "user_id": {"type": "string"}
+                },
+                "required": ["file", "user_id"]
+            }
+        }
+    }
+}
+
+@app.post("/api/upload", response_model=DocumentResponse, openapi_extra={"requestBody": UPLOAD_REQUEST_BODY})
+async def upload_document(request: Request):
+    """
+    Upload a document and queue it for processing.
+    
+    Form fields:
         file: The PDF file to upload
         user_id: The ID of the user uploading the document
         
     Returns:
-        DocumentResponse object with document information
+        DocumentResponse object with status "queued" and the ingestion job ID,
+        or the existing document if the same PDF was uploaded before (with its
+        job ID while it is still being processed)
     """
     try:
-        result = await document_service.upload_document(file, user_id)
+        document_service = await run_in_threadpool(get_document_service)
+        result = await document_service.upload_document(
+            request.headers.get("content-type", ""), request.stream()
+        )
         return DocumentResponse(**result)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """
+    Get the status of a document ingestion job.
+    
+    Args:
+        job_id: The ID returned by the upload endpoint
+        
+    Returns:
+        JobResponse object with the job's current status
+    """
+    document_service = await run_in_threadpool(get_document_service)
+    job = document_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobResponse(**job)
+
 @app.get("/api/documents/{user_id}", response_model=DocumentListResponse)
 async def get_user_documents(user_id: str):
     """
@@ -168,7 +515,9 @@ async def get_user_documents(user_id: str):
         DocumentListResponse object with a list of documents
     """
     try:
-        documents = document_service.get_user_documents(user_id)
+        # Catalog reads hit SQLite, so they run off the event loop
+        document_service = await run_in_threadpool(get_document_service)
+        documents = await run_in_threadpool(document_service.get_user_documents, user_id)
         return DocumentListResponse(
             documents=[DocumentResponse(**doc) for doc in documents]
         )
@@ -178,8 +527,9 @@ async def get_user_documents(user_id: str):
 @app.get("/api/sources/{user_id}")
 async def get_user_sources(user_id: str):
     """Get list of all available document sources for a user."""
-    chunks = document_service.get_document_chunks(user_id)
-    return qa_service.get_sources(chunks)
+    document_service = await run_in_threadpool(get_document_service)
+    index = await run_in_threadpool(document_service.get_user_index, user_id)
+    return index.get_sources()
 
 @app.delete("/api/documents/{user_id}/{document_id}")
 async def delete_document(user_id: str, document_id: str):
@@ -194,11 +544,15 @@ async def delete_document(user_id: str, document_id: str):
         Success message or error
     """
     try:
-        success = document_service.delete_document(user_id, document_id)
+        # Waits for any in-flight write of the document, so it runs off the event loop
+        document_service = await run_in_threadpool(get_document_service)
+        success = await run_in_threadpool(document_service.delete_document, user_id, document_id)
         if success:
             return {"status": "success", "message": "Document deleted successfully"}
         else:
             raise HTTPException(status_code=404, detail="Document not found")
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error deleting document: {str(e)}")
         import traceback
@@ -217,16 +571,23 @@ async def legacy_query(request: QuestionRequest):
     Returns:
         AnswerResponse object containing the answer and related information
     """
+    try:
+        qa_system = await run_in_threadpool(get_legacy_qa_system)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=503, detail=f"Legacy QA system unavailable: {str(e)}")
+    
     try:
         # Get relevant chunks first
-        relevant_chunks = qa_system.find_relevant_chunks(
+        relevant_chunks = await run_in_threadpool(
+            qa_system.find_relevant_chunks,
             request.question,
             top_k=request.top_k,
             threshold=request.threshold
         )
         
         # Get answer using QA system
-        result = qa_system.answer_question(
+        result = await run_in_threadpool(
+            qa_system.answer_question,
             request.question,
             top_k=request.top_k,
             threshold=request.threshold
@@ -1,58 +1,130 @@
-from typing import List, Dict, Any, Optional
+from typing import Hashable, Iterator, List, Dict, Any, Optional, Tuple
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from transformers import pipeline
 import os
 import json
 from pathlib import Path
 from dotenv import load_dotenv
+from api.vector_index import VectorIndex
+from api.answer_cache import TTLCache, normalize_question
+from data.micro_batcher import encoder_batcher, reader_batcher
+from data.model_registry import registry
 
 load_dotenv()
 
+NO_DOCUMENTS_ANSWER = "I don't have enough information to answer this question. Please upload relevant documents first."
+MODEL_UNAVAILABLE_ANSWER = "I'm unable to process your question because the QA model is not available. Please check the server logs for more information."
+
 class QAService:
     def __init__(self):
-        # Initialize embedding model for document retrieval
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        # Shared embedding model for document retrieval (loaded on first use)
+        self.embedding_model = registry.sentence_transformer('all-MiniLM-L6-v2')
         
-        # Initialize a local question-answering pipeline
-        try:
-            # This will use a smaller model suitable for question answering
-            self.qa_pipeline = pipeline(
-                "question-answering",
-                model="distilbert-base-cased-distilled-squad",
-                tokenizer="distilbert-base-cased-distilled-squad"
-            )
-            print("Initialized local QA model successfully")
-        except Exception as e:
-            print(f"Error initializing QA pipeline: {str(e)}")
-            self.qa_pipeline = None
-
-    def _get_relevant_chunks(self, query: str, chunks: List[Dict[str, Any]], top_k: int = 5) -> List[Dict[str, Any]]:
-        """Retrieve most relevant document chunks for the query."""
-        if not chunks:
-            return []
-            
-        # Extract embeddings from chunks
-        chunk_embeddings = np.array([chunk["embedding"] for chunk in chunks])
+        # Shared local question-answering pipeline (loaded on first use).
+        # This will use a smaller model suitable for question answering
+        self.qa_pipeline = registry.qa_pipeline("distilbert-base-cased-distilled-squad")
         
-        # Generate query embedding
-        query_embedding = self.embedding_model.encode(query)
+        # Concurrent single-question requests share batched forward passes
+        self.query_encoder = encoder_batcher(self.embedding_model)
+        self.reader = reader_batcher(self.qa_pipeline)
         
-        # Calculate similarities
-        similarities = np.dot(chunk_embeddings, query_embedding) / (
-            np.linalg.norm(chunk_embeddings, axis=1) * np.linalg.norm(query_embedding)
+        # The reader scores each retrieved chunk as its own input, best-ranked first,
+        # READER_ROUND_SIZE chunks at a time. It stops once a span scores at least
+        # READER_EARLY_EXIT_SCORE or the chunks read would exceed READER_TOKEN_BUDGET tokens.
+        self.reader_token_budget = int(os.getenv("READER_TOKEN_BUDGET", 1536))
+        self.reader_round_size = max(1, int(os.getenv("READER_ROUND_SIZE", 2)))
+        self.reader_early_exit = float(os.getenv("READER_EARLY_EXIT_SCORE", 0.5))
+        
+        # Normalized question -> query embedding
+        self.query_cache = TTLCache(
+            maxsize=int(os.getenv("QUERY_CACHE_SIZE", 10000)),
+            ttl=float(os.getenv("QUERY_CACHE_TTL", 3600))
+        )
+        # (corpus key, document_id, filters, normalized question, top_k) -> answer result.
+        # The corpus key carries a version that changes on every upload/delete.
+        self.answer_cache = TTLCache(
+            maxsize=int(os.getenv("ANSWER_CACHE_SIZE", 2000)),
+            ttl=float(os.getenv("ANSWER_CACHE_TTL", 600))
         )
+
+    def warm_up(self) -> None:
+        """Load the embedding and QA models ahead of the first query."""
+        self.embedding_model.available()
+        self.qa_pipeline.available()
+
+    def is_ready(self) -> bool:
+        """Whether the models needed to answer a query are loaded."""
+        return self.embedding_model.loaded and self.qa_pipeline.loaded
+
+    def _get_relevant_chunks(
+        self,
+        query: str,
+        index: VectorIndex,
+        top_k: int = 5,
+        document_id: Optional[str] = None,
+        threshold: Optional[float] = None,
+        filters: Optional[Dict[str, List[str]]] = None
+    ) -> List[Dict[str, Any]]:
+        """Retrieve most relevant document chunks for the query, restricted to filters."""
+        if not len(index):
+            return []
         
-        # Get top k results
-        top_indices = np.argsort(similarities)[-top_k:][::-1]
+        # Generate (or reuse) the query embedding
+        query_embedding = self._encode_queries([query])[0]
         
-        result_chunks = []
-        for i in top_indices:
-            chunk = chunks[i].copy()
-            chunk["similarity"] = float(similarities[i])
-            result_chunks.append(chunk)
-            
-        return result_chunks
+        # Fuse dense scores against the pre-normalized matrix with BM25 on the query text
+        return index.search(
+            query_embedding,
+            top_k=top_k,
+            document_id=document_id,
+            threshold=threshold,
+            query_text=query,
+            filters=filters
+        )
+
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Encode queries, reusing cached embeddings and encoding the misses in one call."""
+        embeddings: List[Optional[np.ndarray]] = [
+            self.query_cache.get(normalize_question(query)) for query in queries
+        ]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            # Misses join the encoder's batch, together with other requests' queries
+            futures = [self.query_encoder.submit(queries[i]) for i in missing]
+            for i, future in zip(missing, futures):
+                embedding = future.result()
+                embeddings[i] = embedding
+                self.query_cache.set(normalize_question(queries[i]), embedding)
+        return np.stack(embeddings)
+
+    def _answer_cache_key(
+        self,
+        corpus_key: Optional[Hashable],
+        question: str,
+        top_k: int,
+        document_id: Optional[str],
+        filters: Optional[Dict[str, List[str]]] = None
+    ) -> Optional[Tuple]:
+        """Answer cache key, or None when the caller did not identify the corpus."""
+        if corpus_key is None:
+            return None
+        filter_key = tuple(sorted((key, tuple(sorted(values))) for key, values in (filters or {}).items()))
+        return (corpus_key, document_id, filter_key, normalize_question(question), top_k)
+
+    def _cache_answer(self, key: Optional[Tuple], result: Dict[str, Any]) -> None:
+        """Cache a result unless it is a fallback produced by a model error."""
+        if key is not None and result.get("confidence") is not None:
+            self.answer_cache.set(key, result)
+
+    def invalidate_corpus(self, user_id: str) -> None:
+        """Drop cached answers for a user whose corpus changed."""
+        self.answer_cache.invalidate(lambda key: key[0][0] == user_id)
+
+    def cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Hit/miss counters for the query embedding and answer caches."""
+        return {
+            "query_embeddings": self.query_cache.stats(),
+            "answers": self.answer_cache.stats()
+        }
 
     def _format_context(self, chunks: List[Dict[str, Any]]) -> str:
         """Format chunks into context string."""
@@ -62,109 +134,287 @@ class QAService:
         ])
         return context
 
-    def answer_question(self, question: str, chunks: List[Dict[str, Any]], top_k: int = 5) -> Dict[str, Any]:
-        """Answer a question using a local model with retrieved context."""
-        try:
-            # Get relevant chunks
-            relevant_chunks = self._get_relevant_chunks(question, chunks, top_k)
-            
-            if not relevant_chunks:
-                return {
-                    "answer": "I don't have enough information to answer this question. Please upload relevant documents first.",
-                    "sources": [],
-                    "context": "",
-                    "relevant_chunks": []
-                }
-                
-            # Format context
-            context = self._format_context(relevant_chunks)
-            
-            # If QA pipeline is not available, return a simple response
-            if self.qa_pipeline is None:
-                return {
-                    "answer": "I'm unable to process your question because the QA model is not available. Please check the server logs for more information.",
-                    "sources": [chunk["source"] for chunk in relevant_chunks],
-                    "context": context,
-                    "relevant_chunks": [
-                        {
-                            "text": chunk["text"],
-                            "source": chunk["source"],
-                            "similarity": chunk["similarity"]
-                        }
-                        for chunk in relevant_chunks
-                    ]
+    def _build_result(
+        self,
+        answer: str,
+        relevant_chunks: List[Dict[str, Any]],
+        context: str,
+        confidence: Optional[float] = None,
+        answer_span: Optional[Dict[str, int]] = None
+    ) -> Dict[str, Any]:
+        """
+        Build the result dictionary returned for a question.
+        
+        answer_span locates the answer as {"chunk", "start", "end"}: the index of
+        the chunk it was read from and character offsets into that chunk's text.
+        """
+        if answer_span is not None:
+            source = relevant_chunks[answer_span["chunk"]]["source"]
+        else:
+            source = relevant_chunks[0]["source"] if relevant_chunks else None
+        return {
+            "answer": answer,
+            "confidence": confidence,
+            "source": source,
+            "answer_span": answer_span,
+            "sources": [chunk["source"] for chunk in relevant_chunks],
+            "context": context,
+            "relevant_chunks": [
+                {
+                    "text": chunk["text"],
+                    "source": chunk["source"],
+                    "similarity": chunk["similarity"]
                 }
-            
-            # Use the local QA pipeline to get an answer
-            try:
-                # Combine all relevant chunks into a single context
-                combined_text = "\n\n".join([chunk["text"] for chunk in relevant_chunks])
-                
-                # Get answer from QA pipeline
-                result = self.qa_pipeline(
-                    question=question,
-                    context=combined_text,
-                )
-                
-                # Format the answer
-                answer = result["answer"]
-                confidence = result["score"]
-                
-                # Find the source chunk that contains the answer
-                source_chunk = None
-                for chunk in relevant_chunks:
-                    if answer in chunk["text"]:
-                        source_chunk = chunk
-                        break
-                
-                source = source_chunk["source"] if source_chunk else relevant_chunks[0]["source"]
-                
-                # Create a more comprehensive answer
-                comprehensive_answer = f"""
+                for chunk in relevant_chunks
+            ]
+        }
+
+    def _chunks_within_budget(self, question: str, chunks: List[Dict[str, Any]]) -> int:
+        """How many top-ranked chunks fit the reader token budget (always at least one)."""
+        encoded = self.qa_pipeline.tokenize(
+            [question] + [chunk["text"] for chunk in chunks], add_special_tokens=False
+        )["input_ids"]
+        question_tokens = len(encoded[0])
+        used = 0
+        for count, chunk_ids in enumerate(encoded[1:]):
+            # Each input is [CLS] question [SEP] chunk [SEP]
+            used += question_tokens + len(chunk_ids) + 3
+            if used > self.reader_token_budget and count:
+                return count
+        return len(chunks)
+
+    def _read_chunks(
+        self,
+        questions: List[str],
+        chunk_lists: List[List[Dict[str, Any]]]
+    ) -> List[Optional[Tuple[int, Dict[str, Any]]]]:
+        """
+        Read each question's chunks individually, stopping early on a confident span.
+        
+        Returns, per question, (chunk index, reader output) for the best span,
+        or None when the question has no chunks. The output's start and end are
+        character offsets into that chunk's text.
+        """
+        limits = [
+            self._chunks_within_budget(question, chunks) if chunks else 0
+            for question, chunks in zip(questions, chunk_lists)
+        ]
+        best: List[Optional[Tuple[int, Dict[str, Any]]]] = [None] * len(questions)
+        read = [0] * len(questions)
+        active = [i for i, limit in enumerate(limits) if limit]
+        while active:
+            # Submit the round for every active question before waiting, so they share batches
+            futures = []
+            for i in active:
+                round_end = min(read[i] + self.reader_round_size, limits[i])
+                for j in range(read[i], round_end):
+                    futures.append((i, j, self.reader.submit((questions[i], chunk_lists[i][j]["text"]))))
+                read[i] = round_end
+            for i, j, future in futures:
+                output = future.result()
+                if best[i] is None or output["score"] > best[i][1]["score"]:
+                    best[i] = (j, output)
+            active = [
+                i for i in active
+                if read[i] < limits[i] and best[i][1]["score"] < self.reader_early_exit
+            ]
+        return best
+
+    def _compose_answer(self, output: Dict[str, Any], source_chunk: Dict[str, Any]) -> str:
+        """Turn a reader output into the answer text shown to the user."""
+        # Create a more comprehensive answer
+        comprehensive_answer = f"""
 Based on the provided documents, the answer is:
 
-{answer}
+{output["answer"]}
 
-This information comes from: {source}
+This information comes from: {source_chunk["source"]}
 
-Confidence: {confidence:.2f}
+Confidence: {output["score"]:.2f}
                 """
-                
-                return {
-                    "answer": comprehensive_answer.strip(),
-                    "sources": [chunk["source"] for chunk in relevant_chunks],
-                    "context": context,
-                    "relevant_chunks": [
-                        {
-                            "text": chunk["text"],
-                            "source": chunk["source"],
-                            "similarity": chunk["similarity"]
-                        }
-                        for chunk in relevant_chunks
-                    ]
-                }
-            except Exception as model_error:
-                print(f"Model error: {str(model_error)}")
-                # Fallback to a simple response
-                return {
-                    "answer": f"I encountered an error while processing your question with the local model. Error: {str(model_error)}",
-                    "sources": [chunk["source"] for chunk in relevant_chunks],
-                    "context": context,
-                    "relevant_chunks": [
-                        {
-                            "text": chunk["text"],
-                            "source": chunk["source"],
-                            "similarity": chunk["similarity"]
-                        }
-                        for chunk in relevant_chunks
-                    ]
-                }
+        return comprehensive_answer.strip()
+
+    def _result_from_reading(
+        self,
+        reading: Tuple[int, Dict[str, Any]],
+        relevant_chunks: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Build the result for the best span, attributed to the chunk it was read from."""
+        chunk_index, output = reading
+        return self._build_result(
+            self._compose_answer(output, relevant_chunks[chunk_index]),
+            relevant_chunks,
+            self._format_context(relevant_chunks),
+            confidence=float(output["score"]),
+            answer_span={"chunk": chunk_index, "start": int(output["start"]), "end": int(output["end"])}
+        )
+
+    def _answer_from_chunks(self, question: str, relevant_chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Run the reader model over already retrieved chunks."""
+        if not relevant_chunks:
+            return self._build_result(NO_DOCUMENTS_ANSWER, [], "")
+            
+        # Format context
+        context = self._format_context(relevant_chunks)
+        
+        # If QA pipeline is not available, return a simple response
+        if not self.qa_pipeline.available():
+            return self._build_result(MODEL_UNAVAILABLE_ANSWER, relevant_chunks, context)
+        
+        # Use the local QA pipeline to get an answer
+        try:
+            # Score the chunks individually, batched with concurrent requests
+            return self._result_from_reading(self._read_chunks([question], [relevant_chunks])[0], relevant_chunks)
+        except Exception as model_error:
+            print(f"Model error: {str(model_error)}")
+            # Fallback to a simple response
+            return self._build_result(
+                f"I encountered an error while processing your question with the local model. Error: {str(model_error)}",
+                relevant_chunks,
+                context
+            )
+
+    def answer_question(
+        self,
+        question: str,
+        index: VectorIndex,
+        top_k: int = 5,
+        document_id: Optional[str] = None,
+        corpus_key: Optional[Hashable] = None,
+        filters: Optional[Dict[str, List[str]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Answer a question using a local model with retrieved context.
+        
+        corpus_key identifies the user's corpus version (see
+        DocumentService.get_corpus_key); when given, answers are cached.
+        filters restricts retrieval by facet (see VectorIndex.search).
+        """
+        try:
+            cache_key = self._answer_cache_key(corpus_key, question, top_k, document_id, filters)
+            if cache_key is not None:
+                cached = self.answer_cache.get(cache_key)
+                if cached is not None:
+                    return cached
+            
+            # Get relevant chunks
+            relevant_chunks = self._get_relevant_chunks(question, index, top_k, document_id, filters=filters)
+            result = self._answer_from_chunks(question, relevant_chunks)
+            self._cache_answer(cache_key, result)
+            return result
         except Exception as e:
             print(f"Error in answer_question: {str(e)}")
             import traceback
             traceback.print_exc()
             raise
 
+    def stream_answer(
+        self,
+        question: str,
+        index: VectorIndex,
+        top_k: int = 5,
+        document_id: Optional[str] = None,
+        corpus_key: Optional[Hashable] = None,
+        filters: Optional[Dict[str, List[str]]] = None
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Answer a question in two steps, yielding (event, payload) pairs.
+        
+        The ranked chunks are yielded as "chunks" as soon as retrieval
+        finishes; the reader's answer follows as "answer".
+        """
+        cache_key = self._answer_cache_key(corpus_key, question, top_k, document_id, filters)
+        result = self.answer_cache.get(cache_key) if cache_key is not None else None
+        
+        if result is None:
+            relevant_chunks = self._get_relevant_chunks(question, index, top_k, document_id, filters=filters)
+            retrieved = self._build_result("", relevant_chunks, "")
+            yield "chunks", {
+                "sources": retrieved["sources"],
+                "relevant_chunks": retrieved["relevant_chunks"]
+            }
+            
+            result = self._answer_from_chunks(question, relevant_chunks)
+            self._cache_answer(cache_key, result)
+        else:
+            yield "chunks", {
+                "sources": result["sources"],
+                "relevant_chunks": result["relevant_chunks"]
+            }
+        
+        yield "answer", {
+            "answer": result["answer"],
+            "confidence": result["confidence"],
+            "source": result["source"],
+            "answer_span": result["answer_span"]
+        }
+
+    def answer_questions(
+        self,
+        questions: List[str],
+        index: VectorIndex,
+        top_k: int = 5,
+        document_id: Optional[str] = None,
+        corpus_key: Optional[Hashable] = None,
+        filters: Optional[Dict[str, List[str]]] = None
+    ) -> List[Dict[str, Any]]:
+        """Answer several questions against the same index, sharing encoder and reader batches."""
+        if not questions:
+            return []
+        
+        results: List[Optional[Dict[str, Any]]] = [None] * len(questions)
+        cache_keys = [
+            self._answer_cache_key(corpus_key, question, top_k, document_id, filters)
+            for question in questions
+        ]
+        for i, cache_key in enumerate(cache_keys):
+            if cache_key is not None:
+                results[i] = self.answer_cache.get(cache_key)
+        misses = [i for i, result in enumerate(results) if result is None]
+        
+        # Encode every uncached question in one call, then run the hybrid search for each
+        all_chunks: List[List[Dict[str, Any]]] = [[] for _ in questions]
+        if misses and len(index):
+            query_embeddings = self._encode_queries([questions[i] for i in misses])
+            hits = index.search_batch(
+                query_embeddings,
+                top_k=top_k,
+                document_id=document_id,
+                query_texts=[questions[i] for i in misses],
+                filters=filters
+            )
+            for i, chunks in zip(misses, hits):
+                all_chunks[i] = chunks
+        
+        pending = [i for i in misses if all_chunks[i]]
+        for i in misses:
+            if not all_chunks[i]:
+                results[i] = self._build_result(NO_DOCUMENTS_ANSWER, [], "")
+        
+        if pending and not self.qa_pipeline.available():
+            for i in pending:
+                results[i] = self._build_result(
+                    MODEL_UNAVAILABLE_ANSWER, all_chunks[i], self._format_context(all_chunks[i])
+                )
+            pending = []
+        
+        if pending:
+            try:
+                # Read every question's chunks together, each round in shared batches
+                readings = self._read_chunks([questions[i] for i in pending], [all_chunks[i] for i in pending])
+                for i, reading in zip(pending, readings):
+                    results[i] = self._result_from_reading(reading, all_chunks[i])
+            except Exception as model_error:
+                print(f"Model error in batch: {str(model_error)}")
+                # Fall back to answering one question at a time
+                for i in pending:
+                    results[i] = self._answer_from_chunks(questions[i], all_chunks[i])
+        
+        for i in pending:
+            self._cache_answer(cache_keys[i], results[i])
+        
+        return results
+
     def get_sources(self, chunks: List[Dict[str, Any]]) -> List[str]:
         """Get list of all available document sources."""
         return list(set(chunk["source"] for chunk in chunks)) 
\ No newline at end of file
@@ -0,0 +1,144 @@
+import hashlib
+import uuid
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import anyio
+from fastapi.concurrency import run_in_threadpool
+from multipart.multipart import MultipartParser, parse_options_header
+
+# Upload requests are parsed here rather than by Starlette's form parser, which
+# spools every file part over 1 MB to a temporary file that would then be copied
+# again. The file part is written straight to a staging file as it arrives.
+
+# Largest accepted non-file form field (user_id and similar)
+MAX_FIELD_BYTES = 64 * 1024
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds the configured size limit."""
+
+class StreamedUpload:
+    """Form of an upload request whose file part was streamed to a staging file."""
+
+    def __init__(self):
+        """Initialize an empty form."""
+        self.fields: Dict[str, str] = {}
+        self.filename: Optional[str] = None
+        self.path: Optional[Path] = None
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+async def discard_staged_file(path: Optional[Path]) -> None:
+    """Delete a staging file, even from a request that is being cancelled."""
+    if path is None:
+        return
+    with anyio.CancelScope(shield=True):
+        await run_in_threadpool(path.unlink, missing_ok=True)
+
+async def receive_upload(
+    content_type: str,
+    stream: AsyncIterator[bytes],
+    staging_dir: Path,
+    max_bytes: int,
+    file_field: str = "file",
+    suffix: str = ".pdf"
+) -> StreamedUpload:
+    """
+    Parse a multipart/form-data body, writing its file part to staging_dir (which must exist).
+
+    Only file names ending in suffix are accepted, and the file part is hashed
+    on the way. The staging file is deleted if parsing fails.
+    """
+    media_type, params = parse_options_header(content_type)
+    if media_type != b"multipart/form-data" or b"boundary" not in params:
+        raise ValueError("Expected a multipart/form-data upload")
+
+    # The parser reports parts through callbacks; they are queued and handled
+    # between writes, where file I/O can be moved off the event loop
+    events: List[Tuple[str, Any]] = []
+    header_field = bytearray()
+    header_value = bytearray()
+
+    def on_header_field(data: bytes, start: int, end: int) -> None:
+        header_field.extend(data[start:end])
+
+    def on_header_value(data: bytes, start: int, end: int) -> None:
+        header_value.extend(data[start:end])
+
+    def on_header_end() -> None:
+        events.append(("header", (bytes(header_field).lower(), bytes(header_value))))
+        header_field.clear()
+        header_value.clear()
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": lambda: events.append(("headers_finished", None)),
+        "on_part_data": lambda data, start, end: events.append(("data", data[start:end])),
+        "on_part_end": lambda: events.append(("part_end", None)),
+    })
+
+    upload = StreamedUpload()
+    f = None
+    try:
+        disposition: Dict[bytes, bytes] = {}
+        field_name = None
+        field_value = bytearray()
+        writing = False
+        async for chunk in stream:
+            parser.write(chunk)
+            for event, value in events:
+                if event == "header":
+                    name, header = value
+                    if name == b"content-disposition":
+                        _, disposition = parse_options_header(header)
+                elif event == "headers_finished":
+                    field_name = disposition.get(b"name", b"").decode("utf-8", "replace")
+                    filename = disposition.get(b"filename")
+                    disposition = {}
+                    if filename is None:
+                        continue
+                    if field_name != file_field or upload.path is not None:
+                        raise ValueError(f"Unexpected file field: {field_name!r}")
+                    upload.filename = filename.decode("utf-8", "replace")
+                    if not upload.filename.lower().endswith(suffix):
+                        raise ValueError(f"Only {suffix[1:].upper()} files are supported")
+                    upload.path = staging_dir / f"{uuid.uuid4()}{suffix}.part"
+                    f = await run_in_threadpool(open, upload.path, "wb")
+                    writing = True
+                elif event == "data":
+                    if writing:
+                        upload.size += len(value)
+                        if upload.size > max_bytes:
+                            raise UploadTooLargeError(f"File exceeds the {max_bytes} byte upload limit")
+                        upload.sha256.update(value)
+                        await run_in_threadpool(f.write, value)
+                    else:
+                        field_value.extend(value)
+                        if len(field_value) > MAX_FIELD_BYTES:
+                            raise ValueError(f"Form field {field_name!r} is too large")
+                elif event == "part_end":
+                    if writing:
+                        await run_in_threadpool(f.close)
+                        f = None
+                        writing = False
+                    elif field_name is not None:
+                        upload.fields[field_name] = field_value.decode("utf-8", "replace")
+                    field_value.clear()
+            events.clear()
+        parser.finalize()
+
+        if f is not None:
+            raise ValueError("Upload ended in the middle of the file")
+        if upload.path is None:
+            raise ValueError(f"Missing {file_field!r} file field")
+        if upload.size == 0:
+            raise ValueError("Uploaded file is empty")
+    except BaseException:
+        if f is not None:
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(f.close)
+        await discard_staged_file(upload.path)
+        raise
+    return upload
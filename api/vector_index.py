@@ -0,0 +1,555 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from data.ann_index import DEFAULT_MIN_ROWS, ann_enabled, create_ann_index
+from data.lexical_index import LEXICAL_VERSION, LexicalIndex, document_postings
+from data.retrieval import (
+    exact_search,
+    exact_search_batch,
+    normalize_rows,
+    row_runs,
+    run_scores,
+    select_chunks,
+    top_k_indices,
+)
+
+class VectorIndex:
+    """In-memory embedding matrix and chunk metadata for one user's corpus."""
+
+    def __init__(self, ann_backend: Optional[str] = None, ann_min_rows: Optional[int] = None):
+        """
+        Initialize an empty index.
+
+        Above ann_min_rows (ANN_MIN_ROWS) whole-corpus searches use the
+        approximate ann_backend (ANN_BACKEND: "ivf", "hnsw" or "none");
+        smaller corpora, per-document and filtered searches are always exact.
+
+        Searches given the query text also score chunks with BM25 and rank by
+        a fusion of both scores (HYBRID_LEXICAL_WEIGHT, 0 for dense only).
+        From HYBRID_PREFILTER_MIN_ROWS rows on, the dense model only scores
+        the best HYBRID_CANDIDATES lexical matches when there are enough of them.
+        """
+        # Contiguous float32 matrix with L2-normalized rows
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        # Chunk metadata, parallel to the rows of the matrix (no embeddings)
+        self.chunks: List[Dict[str, Any]] = []
+        # Row range [start, end) occupied by each document
+        self.document_ranges: Dict[str, Tuple[int, int]] = {}
+        # Facets for filtered searches: each document's rows (relative to its
+        # range) per section type, and document-level values such as decision_type
+        self.section_rows: Dict[str, Dict[str, np.ndarray]] = {}
+        self.document_facets: Dict[str, Dict[str, str]] = {}
+        # Total length of the chunk texts, maintained as documents come and go
+        self._text_bytes = 0
+        self._lock = threading.Lock()
+
+        self.ann_backend = ann_backend if ann_backend is not None else os.getenv("ANN_BACKEND", "ivf")
+        if ann_min_rows is None:
+            ann_min_rows = int(os.getenv("ANN_MIN_ROWS", DEFAULT_MIN_ROWS))
+        self.ann_min_rows = ann_min_rows
+        # Built in the background after the first search above the threshold, then kept in sync
+        self.ann = None
+        self._ann_building = False
+
+        # BM25 postings of the same chunks, kept in sync with the matrix
+        self.lexical = LexicalIndex()
+        self.lexical_weight = float(os.getenv("HYBRID_LEXICAL_WEIGHT", 0.3))
+        self.prefilter_min_rows = int(os.getenv("HYBRID_PREFILTER_MIN_ROWS", 50000))
+        self.hybrid_candidates = int(os.getenv("HYBRID_CANDIDATES", 1000))
+
+    @classmethod
+    def from_chunks(cls, chunks: List[Dict[str, Any]], document_id: str = "default") -> "VectorIndex":
+        """Build an index from a list of chunks carrying an "embedding" field."""
+        index = cls()
+        index.add_document(document_id, chunks)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate resident size of the index in bytes (constant time)."""
+        return int(self.matrix.nbytes) + self._text_bytes + self.lexical.nbytes
+
+    def has_document(self, document_id: str) -> bool:
+        """Check whether a document is present in the index."""
+        return document_id in self.document_ranges
+
+    def snapshot(self) -> Tuple[np.ndarray, List[Dict[str, Any]], Dict[str, Tuple[int, int]]]:
+        """Return a consistent view of the matrix, metadata and document ranges."""
+        with self._lock:
+            return self.matrix, self.chunks, self.document_ranges
+
+    def add_document(
+        self,
+        document_id: str,
+        chunks: List[Dict[str, Any]],
+        postings: Optional[Dict[str, Any]] = None,
+        facets: Optional[Dict[str, str]] = None
+    ) -> None:
+        """Add (or replace) the chunks of a document."""
+        if not chunks:
+            self.remove_document(document_id)
+            return
+
+        embeddings = np.asarray([chunk["embedding"] for chunk in chunks], dtype=np.float32)
+        metadata = [
+            {key: value for key, value in chunk.items() if key != "embedding"}
+            for chunk in chunks
+        ]
+        self.add_embeddings(document_id, embeddings, metadata, postings, facets)
+
+    def add_embeddings(
+        self,
+        document_id: str,
+        embeddings: np.ndarray,
+        metadata: List[Dict[str, Any]],
+        postings: Optional[Dict[str, Any]] = None,
+        facets: Optional[Dict[str, str]] = None
+    ) -> None:
+        """
+        Add (or replace) a document from an embedding matrix and chunk metadata.
+
+        postings are the document's saved BM25 postings; they are rebuilt from
+        the chunk texts when missing or written by another tokenizer version.
+        facets are document-level values to filter on (e.g. decision_type).
+        """
+        if self.has_document(document_id):
+            self.remove_document(document_id)
+        if not metadata:
+            return
+
+        # Copies out of any memory-mapped source into the resident matrix
+        embeddings = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        if postings is None or postings.get("version") != LEXICAL_VERSION:
+            postings = document_postings([chunk.get("text", "") for chunk in metadata])
+
+        rows_by_section: Dict[str, List[int]] = {}
+        for row, chunk in enumerate(metadata):
+            rows_by_section.setdefault(chunk.get("section_type"), []).append(row)
+        document_sections = {
+            section: np.asarray(rows, dtype=np.int64) for section, rows in rows_by_section.items()
+        }
+        text_bytes = sum(len(chunk.get("text", "")) for chunk in metadata)
+
+        with self._lock:
+            start = len(self.chunks)
+            if self.matrix.shape[0] == 0:
+                matrix = np.ascontiguousarray(embeddings)
+            else:
+                matrix = np.vstack([self.matrix, embeddings])
+            ranges = dict(self.document_ranges)
+            ranges[document_id] = (start, start + len(metadata))
+
+            # Swap in new objects so concurrent readers keep a consistent snapshot
+            self.matrix = matrix
+            self.chunks = self.chunks + metadata
+            self.document_ranges = ranges
+            self.section_rows = {**self.section_rows, document_id: document_sections}
+            self.document_facets = {**self.document_facets, document_id: dict(facets or {})}
+            self._text_bytes += text_bytes
+            if self.ann is not None:
+                self.ann = self.ann.with_added(embeddings)
+            self.lexical.add_document(document_id, postings)
+
+    def remove_document(self, document_id: str) -> bool:
+        """Remove the chunks of a document from the index."""
+        with self._lock:
+            if document_id not in self.document_ranges:
+                return False
+
+            start, end = self.document_ranges[document_id]
+            removed = end - start
+            matrix = np.delete(self.matrix, np.s_[start:end], axis=0)
+            chunks = self.chunks[:start] + self.chunks[end:]
+
+            ranges = {}
+            for doc_id, (doc_start, doc_end) in self.document_ranges.items():
+                if doc_id == document_id:
+                    continue
+                if doc_start >= end:
+                    doc_start, doc_end = doc_start - removed, doc_end - removed
+                ranges[doc_id] = (doc_start, doc_end)
+
+            self._text_bytes -= sum(len(chunk.get("text", "")) for chunk in self.chunks[start:end])
+            self.matrix = np.ascontiguousarray(matrix)
+            self.chunks = chunks
+            self.document_ranges = ranges
+            self.section_rows = {
+                doc_id: rows for doc_id, rows in self.section_rows.items() if doc_id != document_id
+            }
+            self.document_facets = {
+                doc_id: facets for doc_id, facets in self.document_facets.items() if doc_id != document_id
+            }
+            if self.ann is not None:
+                self.ann = self.ann.with_removed(start, end)
+            self.lexical.remove_document(document_id)
+            return True
+
+    def search(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int = 5,
+        document_id: Optional[str] = None,
+        threshold: Optional[float] = None,
+        query_text: Optional[str] = None,
+        filters: Optional[Dict[str, List[str]]] = None
+    ) -> List[Dict[str, Any]]:
+        """Return the top_k chunks by cosine similarity (fused with BM25 given query_text)."""
+        return self.search_batch(
+            np.asarray(query_embedding)[np.newaxis, :],
+            top_k=top_k,
+            document_id=document_id,
+            threshold=threshold,
+            query_texts=[query_text] if query_text is not None else None,
+            filters=filters
+        )[0]
+
+    def search_batch(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int = 5,
+        document_id: Optional[str] = None,
+        threshold: Optional[float] = None,
+        query_texts: Optional[List[str]] = None,
+        filters: Optional[Dict[str, List[str]]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Return the top_k chunks for each row of a query embedding matrix.
+
+        With query_texts, results are ranked by the fused dense and BM25 score;
+        "similarity" stays the cosine similarity and "lexical_score" is added.
+        filters maps "document_id", "section_type" or a document facet name to
+        the accepted values; only the matching rows are scored.
+        """
+        with self._lock:
+            matrix, chunks, ranges = self.matrix, self.chunks, self.document_ranges
+            section_rows, document_facets = self.section_rows, self.document_facets
+        empty = [[] for _ in range(len(query_embeddings))]
+
+        # Searched rows are either a document's contiguous range (offset) or a filtered row list,
+        # scored through views of its contiguous runs rather than a per-query copy of the rows
+        offset = 0
+        row_ids = None
+        filtered = None
+        if filters:
+            if document_id is not None:
+                # document_id narrows any document_id filter rather than replacing it
+                allowed = filters.get("document_id")
+                filters = {**filters, "document_id": [document_id] if allowed is None or document_id in allowed else []}
+            row_ids, filtered_documents = self._filter_rows(filters, ranges, section_rows, document_facets)
+            if not len(row_ids):
+                return empty
+            filtered = (row_ids, row_runs(row_ids), filtered_documents)
+        elif document_id is not None:
+            if document_id not in ranges:
+                return empty
+            offset, end = ranges[document_id]
+            matrix = matrix[offset:end]
+        if matrix.shape[0] == 0:
+            return empty
+
+        queries = normalize_rows(query_embeddings)
+
+        # Rows are pre-normalized, so the dot product is the cosine similarity
+        ann = None
+        if document_id is None and row_ids is None and ann_enabled(self.ann_backend, matrix.shape[0], self.ann_min_rows):
+            ann = self._get_ann(matrix)
+        if query_texts is not None and self.lexical_weight > 0:
+            return [
+                self._hybrid_search(
+                    matrix, chunks, ranges, offset, filtered, query, query_text, top_k, document_id, threshold, ann
+                )
+                for query, query_text in zip(queries, query_texts)
+            ]
+        if ann is not None:
+            hits = []
+            for query in queries:
+                top_indices, similarities = ann.search(matrix, query, top_k)
+                if threshold is not None:
+                    keep = similarities >= threshold
+                    top_indices, similarities = top_indices[keep], similarities[keep]
+                hits.append((top_indices, similarities))
+        elif filtered is not None:
+            hits = []
+            for scores in run_scores(matrix, filtered[1], queries):
+                top_indices = top_k_indices(scores, top_k, threshold)
+                hits.append((top_indices, scores[top_indices]))
+        else:
+            hits = exact_search_batch(matrix, queries, top_k, threshold)
+
+        return [
+            select_chunks(chunks, row_ids[top_indices], similarities) if row_ids is not None
+            else select_chunks(chunks, top_indices, similarities, offset)
+            for top_indices, similarities in hits
+        ]
+
+    @staticmethod
+    def _filter_rows(
+        filters: Dict[str, List[str]],
+        ranges: Dict[str, Tuple[int, int]],
+        section_rows: Dict[str, Dict[str, np.ndarray]],
+        document_facets: Dict[str, Dict[str, str]]
+    ) -> Tuple[np.ndarray, List[str]]:
+        """Sorted matrix rows of the chunks matching every filter, and the documents holding them."""
+        document_ids = filters.get("document_id")
+        section_types = filters.get("section_type")
+        facet_filters = [
+            (name, set(values)) for name, values in filters.items()
+            if name not in ("document_id", "section_type")
+        ]
+
+        parts = []
+        matched = []
+        for doc_id in (ranges if document_ids is None else dict.fromkeys(document_ids)):
+            if doc_id not in ranges:
+                continue
+            facets = document_facets.get(doc_id, {})
+            if any(facets.get(name) not in values for name, values in facet_filters):
+                continue
+            start, end = ranges[doc_id]
+            if section_types is None:
+                doc_parts = [np.arange(start, end, dtype=np.int64)]
+            else:
+                sections = section_rows.get(doc_id, {})
+                doc_parts = [sections[section] + start for section in dict.fromkeys(section_types) if section in sections]
+            if doc_parts:
+                parts.extend(doc_parts)
+                matched.append(doc_id)
+        if not parts:
+            return np.zeros(0, dtype=np.int64), []
+        return np.sort(np.concatenate(parts)), matched
+
+    def _hybrid_search(
+        self,
+        matrix: np.ndarray,
+        chunks: List[Dict[str, Any]],
+        ranges: Dict[str, Tuple[int, int]],
+        offset: int,
+        filtered: Optional[Tuple[np.ndarray, List[Tuple[int, int]], List[str]]],
+        query: np.ndarray,
+        query_text: str,
+        top_k: int,
+        document_id: Optional[str],
+        threshold: Optional[float],
+        ann
+    ) -> List[Dict[str, Any]]:
+        """
+        Rank the union of dense and lexical candidates by their fused score.
+
+        filtered is (row_ids, their contiguous runs, their documents) for a
+        filtered search; candidates are then positions in row_ids.
+        """
+        row_ids = None
+        if filtered is None:
+            lexical_rows, lexical_scores = self.lexical.search(query_text, ranges, document_id)
+            num_rows = matrix.shape[0]
+        else:
+            row_ids, runs, filtered_documents = filtered
+            num_rows = len(row_ids)
+            # Score only the filtered documents, then keep the matches in the filtered
+            # sections, as positions in row_ids
+            lexical_rows, lexical_scores = self.lexical.search(query_text, ranges, document_ids=filtered_documents)
+            positions = np.minimum(np.searchsorted(row_ids, lexical_rows), len(row_ids) - 1)
+            keep = row_ids[positions] == lexical_rows
+            lexical_rows, lexical_scores = positions[keep], lexical_scores[keep]
+        if len(lexical_rows) > self.hybrid_candidates:
+            keep = np.argpartition(-lexical_scores, self.hybrid_candidates - 1)[:self.hybrid_candidates]
+            lexical_rows, lexical_scores = lexical_rows[keep], lexical_scores[keep]
+
+        if num_rows >= self.prefilter_min_rows and len(lexical_rows) >= top_k:
+            # Large corpus with enough exact-term matches: only score those densely
+            candidates = np.sort(lexical_rows)
+        else:
+            pool = max(top_k * 4, 20)
+            if ann is not None:
+                dense_rows, _ = ann.search(matrix, query, pool)
+            elif row_ids is not None:
+                dense_rows = top_k_indices(run_scores(matrix, runs, query), pool)
+            else:
+                dense_rows, _ = exact_search(matrix, query, pool)
+            candidates = np.union1d(dense_rows, lexical_rows)
+        if not len(candidates):
+            return []
+
+        similarities = (matrix[candidates] if row_ids is None else matrix[row_ids[candidates]]) @ query
+        lexical = np.zeros(len(candidates), dtype=np.float32)
+        lexical[np.searchsorted(candidates, lexical_rows)] = lexical_scores
+        max_lexical = lexical.max()
+        fused = similarities if max_lexical <= 0 else (
+            (1.0 - self.lexical_weight) * similarities + self.lexical_weight * lexical / max_lexical
+        )
+        if threshold is not None:
+            fused = np.where(similarities >= threshold, fused, -np.inf)
+
+        order = top_k_indices(fused, top_k)
+        order = order[np.isfinite(fused[order])]
+        if row_ids is not None:
+            results = select_chunks(chunks, row_ids[candidates[order]], similarities[order])
+        else:
+            results = select_chunks(chunks, candidates[order], similarities[order], offset)
+        for chunk, score in zip(results, lexical[order]):
+            chunk["lexical_score"] = float(score)
+        return results
+
+    def _get_ann(self, matrix: np.ndarray):
+        """
+        Get the ANN structure matching a matrix snapshot, or None to search exactly.
+
+        A missing or stale structure is (re)built once, on a background
+        thread; searches keep using the current one (or exact search) meanwhile.
+        """
+        with self._lock:
+            if self.matrix is not matrix:
+                # A document was added or removed since the snapshot was taken
+                return None
+            ann = self.ann
+            if (ann is None or ann.needs_retrain(matrix.shape[0])) and not self._ann_building:
+                self._ann_building = True
+                threading.Thread(
+                    target=self._build_ann, args=(matrix,), name="ann-build", daemon=True
+                ).start()
+        return ann
+
+    def _build_ann(self, matrix: np.ndarray) -> None:
+        """Build the ANN structure for a matrix snapshot; dropped if the matrix changed meanwhile."""
+        try:
+            ann = create_ann_index(self.ann_backend)
+            ann.build(matrix)
+            with self._lock:
+                if self.matrix is matrix:
+                    self.ann = ann
+        except Exception as e:
+            print(f"Error building {self.ann_backend} index: {str(e)}")
+        finally:
+            with self._lock:
+                self._ann_building = False
+
+    def get_sources(self) -> List[str]:
+        """Get list of all document sources in the index."""
+        _, chunks, _ = self.snapshot()
+        return list(set(chunk["source"] for chunk in chunks))
+
+class VectorIndexCache:
+    """Per-user VectorIndex cache with LRU eviction bounded by total bytes and entry count."""
+
+    # Attempts at building an index that no upload or delete raced with
+    MAX_BUILD_ATTEMPTS = 3
+
+    def __init__(self, max_bytes: Optional[int] = None, max_entries: Optional[int] = None):
+        """
+        Initialize the cache with a byte budget (VECTOR_INDEX_CACHE_BYTES) and
+        a cap on resident indexes (VECTOR_INDEX_CACHE_ENTRIES, default 1000).
+        """
+        if max_bytes is None:
+            max_bytes = int(os.getenv("VECTOR_INDEX_CACHE_BYTES", 512 * 1024 * 1024))
+        if max_entries is None:
+            max_entries = int(os.getenv("VECTOR_INDEX_CACHE_ENTRIES", 1000))
+        self.max_bytes = max_bytes
+        self.max_entries = max(1, max_entries)
+        self._indexes: "OrderedDict[str, VectorIndex]" = OrderedDict()
+        # Size of each cached index as of its last change, and their sum
+        self._sizes: Dict[str, int] = {}
+        self._total_bytes = 0
+        # Bumped on every document change, so builds that raced with one are discarded
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def total_bytes(self) -> int:
+        """Total resident size of all cached indexes."""
+        with self._lock:
+            return self._total_bytes
+
+    def get(self, user_id: str, loader: Callable[[str], VectorIndex]) -> VectorIndex:
+        """Get a user's index, building it with loader on a miss."""
+        for _ in range(self.MAX_BUILD_ATTEMPTS):
+            with self._lock:
+                index = self._indexes.get(user_id)
+                if index is not None:
+                    self._indexes.move_to_end(user_id)
+                    return index
+                generation = self._generations.get(user_id, 0)
+
+            # Build outside the lock so other users are not blocked by disk reads
+            index = loader(user_id)
+
+            with self._lock:
+                # Another request may have built it concurrently; keep the first one
+                existing = self._indexes.get(user_id)
+                if existing is not None:
+                    self._indexes.move_to_end(user_id)
+                    return existing
+                if self._generations.get(user_id, 0) != generation:
+                    # A document was added or removed while the files were being read
+                    continue
+                self._indexes[user_id] = index
+                self._resize(user_id)
+                self._evict()
+            return index
+
+        # The corpus kept changing; serve the latest build without caching it
+        return index
+
+    def add_document(
+        self,
+        user_id: str,
+        document_id: str,
+        chunks: List[Dict[str, Any]],
+        postings: Optional[Dict[str, Any]] = None,
+        facets: Optional[Dict[str, str]] = None
+    ) -> None:
+        """Add a document to a user's index if it is resident."""
+        with self._lock:
+            self._bump(user_id)
+            index = self._indexes.get(user_id)
+        if index is not None:
+            index.add_document(document_id, chunks, postings, facets)
+            with self._lock:
+                self._resize(user_id)
+                self._evict()
+
+    def remove_document(self, user_id: str, document_id: str) -> None:
+        """Remove a document from a user's index if it is resident."""
+        with self._lock:
+            self._bump(user_id)
+            index = self._indexes.get(user_id)
+        if index is not None:
+            index.remove_document(document_id)
+            with self._lock:
+                self._resize(user_id)
+
+    def invalidate(self, user_id: str) -> None:
+        """Drop a user's index so it is rebuilt on next access."""
+        with self._lock:
+            self._bump(user_id)
+            if self._indexes.pop(user_id, None) is not None:
+                self._total_bytes -= self._sizes.pop(user_id)
+
+    def _bump(self, user_id: str) -> None:
+        """Record a change to a user's documents (lock held)."""
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+    def _resize(self, user_id: str) -> None:
+        """Refresh the recorded size of a user's cached index (lock held)."""
+        index = self._indexes.get(user_id)
+        if index is None:
+            return
+        size = index.nbytes
+        self._total_bytes += size - self._sizes.get(user_id, 0)
+        self._sizes[user_id] = size
+
+    def _evict(self) -> None:
+        """Evict least recently used indexes until under the byte budget and entry cap (lock held)."""
+        # Always keep the most recently used index, even if it alone exceeds the budget
+        while (
+            (self._total_bytes > self.max_bytes or len(self._indexes) > self.max_entries)
+            and len(self._indexes) > 1
+        ):
+            evicted_user, _ = self._indexes.popitem(last=False)
+            self._total_bytes -= self._sizes.pop(evicted_user)
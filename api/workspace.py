@@ -0,0 +1,101 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+# User and document ids become path components, so only plain tokens are allowed
+# (UUIDs and similar); anything with separators, dots or control characters is rejected.
+_ID_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9_-]{0,127}")
+
+class InvalidUserIdError(ValueError):
+    """Raised when a user id cannot be used as a workspace name."""
+
+def is_valid_id(value: str) -> bool:
+    """Whether a user or document id is safe to use as a path component."""
+    return isinstance(value, str) and _ID_PATTERN.fullmatch(value) is not None
+
+class UserWorkspace:
+    """Resolved paths of one user's storage directories."""
+
+    def __init__(self, root: Path, recheck_seconds: float = 30.0):
+        """Resolve the workspace paths without touching the filesystem."""
+        self.root = root
+        self.raw_dir = root / "raw"
+        self.processed_dir = root / "processed"
+        self.embeddings_dir = root / "embeddings"
+        self.recheck_seconds = recheck_seconds
+        # Whether the root was seen on disk, and whether this process created every subdirectory;
+        # an existing workspace can still lack one (older layouts had no embeddings/)
+        self._exists = False
+        self._created = False
+        self._missing_until = 0.0
+
+    def exists(self) -> bool:
+        """
+        Whether the workspace exists on disk.
+
+        A positive answer is cached for good; a negative one for recheck_seconds,
+        after which a workspace created by another process is noticed.
+        """
+        if self._exists:
+            return True
+        now = time.monotonic()
+        if now < self._missing_until:
+            return False
+        if self.root.is_dir():
+            self._exists = True
+        else:
+            self._missing_until = now + self.recheck_seconds
+        return self._exists
+
+    def ensure(self) -> "UserWorkspace":
+        """Create the workspace directories, once per process."""
+        if not self._created:
+            for directory in (self.raw_dir, self.processed_dir, self.embeddings_dir):
+                directory.mkdir(parents=True, exist_ok=True)
+            self._exists = True
+            self._created = True
+        return self
+
+class WorkspaceManager:
+    """Hands out cached workspace handles; directories are only created on write paths."""
+
+    def __init__(self, user_data_dir: Path, max_cached: int = 10000, recheck_seconds: Optional[float] = None):
+        """
+        Initialize the manager for workspaces under user_data_dir.
+
+        Missing workspaces are looked up again after recheck_seconds
+        (WORKSPACE_RECHECK_SECONDS, default 30).
+        """
+        if recheck_seconds is None:
+            recheck_seconds = float(os.getenv("WORKSPACE_RECHECK_SECONDS", 30))
+        self.user_data_dir = user_data_dir
+        self.max_cached = max_cached
+        self.recheck_seconds = recheck_seconds
+        self._workspaces: "OrderedDict[str, UserWorkspace]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Optional[UserWorkspace]:
+        """Get a user's workspace handle for reading, or None if the id is invalid."""
+        if not is_valid_id(user_id):
+            return None
+        with self._lock:
+            workspace = self._workspaces.get(user_id)
+            if workspace is None:
+                workspace = UserWorkspace(self.user_data_dir / user_id, self.recheck_seconds)
+                self._workspaces[user_id] = workspace
+                while len(self._workspaces) > self.max_cached:
+                    self._workspaces.popitem(last=False)
+            else:
+                self._workspaces.move_to_end(user_id)
+            return workspace
+
+    def ensure(self, user_id: str) -> UserWorkspace:
+        """Get a user's workspace for writing, creating its directories if needed."""
+        workspace = self.get(user_id)
+        if workspace is None:
+            raise InvalidUserIdError(f"Invalid user id: {user_id!r}")
+        return workspace.ensure()
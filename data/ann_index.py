@@ -0,0 +1,230 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+import numpy as np
+
+from data.retrieval import exact_search, top_k_indices
+
+# Corpora smaller than this are always searched exactly
+DEFAULT_MIN_ROWS = 20000
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest-neighbour index in pure NumPy.
+
+    Rows are partitioned with spherical k-means; a query only scores the
+    rows in its n_probe closest partitions. Vectors must be L2-normalized.
+    """
+
+    name = "ivf"
+
+    def __init__(
+        self,
+        n_lists: Optional[int] = None,
+        n_probe: int = 8,
+        n_iter: int = 10,
+        sample_size: int = 50000,
+        seed: int = 0
+    ):
+        """Initialize an untrained index."""
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.sample_size = sample_size
+        self.seed = seed
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.trained_rows = 0
+        self._lists = []
+
+    def build(self, matrix: np.ndarray) -> None:
+        """Train centroids on the matrix and assign every row to a partition."""
+        n_rows = matrix.shape[0]
+        n_lists = self.n_lists or max(1, int(np.sqrt(n_rows)))
+        n_lists = min(n_lists, n_rows)
+        rng = np.random.default_rng(self.seed)
+
+        # Train on a sample to bound build time on large corpora
+        if n_rows > self.sample_size:
+            sample = matrix[rng.choice(n_rows, self.sample_size, replace=False)]
+        else:
+            sample = matrix
+        centroids = sample[rng.choice(sample.shape[0], n_lists, replace=False)].copy()
+
+        for _ in range(self.n_iter):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for list_id in range(n_lists):
+                members = sample[labels == list_id]
+                if len(members):
+                    centroids[list_id] = members.sum(axis=0)
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids /= norms
+
+        self.centroids = centroids.astype(np.float32)
+        self.assignments = self._assign(matrix)
+        self.trained_rows = n_rows
+        self._rebuild_lists()
+
+    def with_added(self, rows: np.ndarray) -> "IVFIndex":
+        """Copy of the index with rows appended (assigned without retraining)."""
+        index = self._copy()
+        index.assignments = np.concatenate([self.assignments, self._assign(rows)])
+        index._rebuild_lists()
+        return index
+
+    def with_removed(self, start: int, end: int) -> "IVFIndex":
+        """Copy of the index without rows [start, end); later row ids shift down."""
+        index = self._copy()
+        index.assignments = np.delete(self.assignments, np.s_[start:end])
+        index._rebuild_lists()
+        return index
+
+    def needs_retrain(self, n_rows: int) -> bool:
+        """Partitions drift as rows are added; retrain once the corpus has doubled."""
+        return n_rows > 2 * self.trained_rows
+
+    def candidates(self, query: np.ndarray) -> np.ndarray:
+        """Row ids in the partitions closest to the query."""
+        centroid_scores = self.centroids @ query
+        n_probe = min(self.n_probe, len(centroid_scores))
+        probe = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+        return np.concatenate([self._lists[list_id] for list_id in probe])
+
+    def search(self, matrix: np.ndarray, query: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate top_k rows by inner product, as (row ids, scores)."""
+        rows = self.candidates(query)
+        if len(rows) < top_k:
+            # Too few candidates; fall back to exact search
+            return exact_search(matrix, query, top_k)
+        scores = matrix[rows] @ query
+        order = top_k_indices(scores, top_k)
+        return rows[order], scores[order]
+
+    def _copy(self) -> "IVFIndex":
+        """Shallow copy sharing the trained centroids."""
+        index = IVFIndex(self.n_lists, self.n_probe, self.n_iter, self.sample_size, self.seed)
+        index.centroids = self.centroids
+        index.trained_rows = self.trained_rows
+        return index
+
+    def _assign(self, rows: np.ndarray) -> np.ndarray:
+        """Assign rows to their nearest centroid."""
+        if rows.shape[0] == 0:
+            return np.zeros(0, dtype=np.int32)
+        return np.argmax(rows @ self.centroids.T, axis=1).astype(np.int32)
+
+    def _rebuild_lists(self) -> None:
+        """Group row ids by partition."""
+        order = np.argsort(self.assignments, kind="stable")
+        bounds = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+        self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+
+class _ReadWriteLock:
+    """Many concurrent readers or one writer."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+
+    @contextmanager
+    def reading(self):
+        with self._condition:
+            while self._writing:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self._condition:
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+class HNSWIndex:
+    """HNSW graph index backed by the optional hnswlib package."""
+
+    name = "hnsw"
+
+    def __init__(self, m: int = 16, ef_construction: int = 200, ef_search: int = 64):
+        """Initialize an empty graph; requires hnswlib."""
+        import hnswlib  # noqa: F401  (fail early if the backend is unavailable)
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.graph = None
+        self.trained_rows = 0
+        # hnswlib cannot resize a graph while it is being queried
+        self._graph_lock = _ReadWriteLock()
+
+    def build(self, matrix: np.ndarray) -> None:
+        """Insert every row into a new graph."""
+        import hnswlib
+        self.graph = hnswlib.Index(space="ip", dim=matrix.shape[1])
+        self.graph.init_index(
+            max_elements=max(1, matrix.shape[0]),
+            ef_construction=self.ef_construction,
+            M=self.m
+        )
+        self.graph.add_items(matrix, np.arange(matrix.shape[0]))
+        # Set once: queries use max(ef, k), so no per-query change of shared state is needed
+        self.graph.set_ef(self.ef_search)
+        self.trained_rows = matrix.shape[0]
+
+    def with_added(self, rows: np.ndarray) -> "HNSWIndex":
+        """Insert rows after the current ones (the graph is updated in place, excluding queries)."""
+        with self._graph_lock.writing():
+            start = self.graph.get_current_count()
+            self.graph.resize_index(start + rows.shape[0])
+            self.graph.add_items(rows, np.arange(start, start + rows.shape[0]))
+        return self
+
+    def with_removed(self, start: int, end: int) -> Optional["HNSWIndex"]:
+        """HNSW labels cannot be renumbered in place, so the graph must be rebuilt."""
+        return None
+
+    def needs_retrain(self, n_rows: int) -> bool:
+        return False
+
+    def search(self, matrix: np.ndarray, query: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate top_k rows by inner product, as (row ids, scores)."""
+        with self._graph_lock.reading():
+            labels, distances = self.graph.knn_query(query, k=min(top_k, self.graph.get_current_count()))
+        labels = labels[0].astype(np.int64)
+        # hnswlib's "ip" space returns 1 - inner product
+        scores = (1.0 - distances[0]).astype(np.float32)
+        # Rows added after the caller's snapshot are not part of its matrix
+        valid = labels < matrix.shape[0]
+        return labels[valid], scores[valid]
+
+def ann_enabled(backend: str, n_rows: int, min_rows: int) -> bool:
+    """Whether a corpus of this size should use approximate search."""
+    return backend not in ("", "none", "exact") and n_rows >= min_rows
+
+def create_ann_index(backend: str):
+    """Create an ANN index for a backend name ("ivf" or "hnsw")."""
+    if backend == "ivf":
+        return IVFIndex(n_probe=int(os.getenv("ANN_IVF_PROBES", 8)))
+    if backend == "hnsw":
+        try:
+            return HNSWIndex()
+        except ImportError:
+            print("hnswlib is not installed; falling back to the IVF backend")
+            return IVFIndex(n_probe=int(os.getenv("ANN_IVF_PROBES", 8)))
+    raise ValueError(f"Unknown ANN backend: {backend}")
@@ -0,0 +1,129 @@
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+# Allow running as a script from the data directory
+sys.path.append(str(Path(__file__).parent.parent))
+from data import embedding_store
+from data.ann_index import HNSWIndex, IVFIndex, exact_search
+from data.processed_store import load_processed_document
+
+SAMPLE_QUESTIONS = [
+    "What is the dispositive portion of the decision?",
+    "Who is the ponente of the case?",
+    "What are the facts of the case?",
+    "What did the Court of Appeals rule?",
+    "Was the petition for review on certiorari granted?",
+    "What are the elements of the crime charged?",
+    "What damages were awarded?",
+    "What is the issue before the Court?",
+    "Did the accused invoke self-defense?",
+    "What is the ruling on the motion for reconsideration?",
+]
+
+def load_corpus(processed_dir: str, embeddings_dir: str = None) -> Tuple[np.ndarray, object]:
+    """Load chunk embeddings for the bundled corpus, embedding it if needed."""
+    from data.document_embeddings import DocumentEmbedder
+    embedder = DocumentEmbedder()
+
+    if embeddings_dir and embedding_store.list_document_ids(embeddings_dir):
+        matrices = [
+            embedding_store.load_document_embeddings(embeddings_dir, doc_id)[0]
+            for doc_id in embedding_store.list_document_ids(embeddings_dir)
+        ]
+        return np.concatenate(matrices).astype(np.float32), embedder
+
+    chunks = []
+    for json_file in sorted(os.listdir(processed_dir)):
+        if not json_file.endswith(".json"):
+            continue
+        document = load_processed_document(os.path.join(processed_dir, json_file))
+        chunks.extend(embedder.create_document_chunks(document))
+
+    embeddings = embedder.model.encode([chunk["text"] for chunk in chunks], batch_size=32)
+    return np.asarray(embeddings, dtype=np.float32), embedder
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+def scale_corpus(matrix: np.ndarray, target_rows: int, seed: int = 0) -> np.ndarray:
+    """Grow the corpus to target_rows by adding jittered copies of real chunks."""
+    if target_rows <= matrix.shape[0]:
+        return matrix
+    rng = np.random.default_rng(seed)
+    copies = [matrix]
+    total = matrix.shape[0]
+    while total < target_rows:
+        noise = rng.normal(scale=0.02, size=matrix.shape).astype(np.float32)
+        copies.append(normalize(matrix + noise))
+        total += matrix.shape[0]
+    return np.concatenate(copies)[:target_rows]
+
+def measure(search, queries: np.ndarray, truth: List[set], top_k: int) -> Tuple[float, float]:
+    """Mean recall@k against exact results and mean latency in milliseconds."""
+    recalls = []
+    start = time.perf_counter()
+    for query, expected in zip(queries, truth):
+        rows, _ = search(query)
+        recalls.append(len(expected & set(rows.tolist())) / len(expected))
+    latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    return float(np.mean(recalls)), latency_ms
+
+def run_benchmark(matrix: np.ndarray, queries: np.ndarray, top_k: int) -> None:
+    """Print a recall-vs-latency table for the exact and ANN backends."""
+    truth = [set(exact_search(matrix, query, top_k)[0].tolist()) for query in queries]
+
+    print(f"\nCorpus: {matrix.shape[0]} chunks x {matrix.shape[1]} dims, "
+          f"{len(queries)} queries, top_k={top_k}")
+    print(f"{'backend':<28}{'build (s)':>12}{'recall@k':>12}{'latency (ms)':>15}")
+
+    recall, latency = measure(lambda q: exact_search(matrix, q, top_k), queries, truth, top_k)
+    print(f"{'exact':<28}{0.0:>12.2f}{recall:>12.3f}{latency:>15.3f}")
+
+    start = time.perf_counter()
+    ivf = IVFIndex()
+    ivf.build(matrix)
+    build_seconds = time.perf_counter() - start
+    for n_probe in (1, 2, 4, 8, 16, 32):
+        ivf.n_probe = n_probe
+        recall, latency = measure(lambda q: ivf.search(matrix, q, top_k), queries, truth, top_k)
+        label = f"ivf (lists={len(ivf.centroids)}, probe={n_probe})"
+        print(f"{label:<28}{build_seconds:>12.2f}{recall:>12.3f}{latency:>15.3f}")
+
+    try:
+        hnsw = HNSWIndex()
+    except ImportError:
+        print("hnsw: skipped (hnswlib not installed)")
+        return
+    start = time.perf_counter()
+    hnsw.build(matrix)
+    build_seconds = time.perf_counter() - start
+    for ef in (16, 32, 64, 128):
+        hnsw.ef_search = ef
+        recall, latency = measure(lambda q: hnsw.search(matrix, q, top_k), queries, truth, top_k)
+        print(f"{f'hnsw (ef={ef})':<28}{build_seconds:>12.2f}{recall:>12.3f}{latency:>15.3f}")
+
+if __name__ == "__main__":
+    root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    arg_parser = argparse.ArgumentParser(description="Recall vs latency of the ANN backends")
+    arg_parser.add_argument("--processed-dir", default=os.path.join(root_dir, "processed"))
+    arg_parser.add_argument("--embeddings-dir", default=None,
+                            help="Use precomputed embeddings instead of embedding the processed corpus")
+    arg_parser.add_argument("--top-k", type=int, default=5)
+    arg_parser.add_argument("--sizes", default="0,20000,100000",
+                            help="Corpus sizes to test; 0 means the real corpus only")
+    args = arg_parser.parse_args()
+
+    corpus, embedder = load_corpus(args.processed_dir, args.embeddings_dir)
+    corpus = normalize(corpus)
+    queries = normalize(np.asarray(embedder.model.encode(SAMPLE_QUESTIONS), dtype=np.float32))
+
+    for size in (int(s) for s in args.sizes.split(",")):
+        run_benchmark(scale_corpus(corpus, size), queries, args.top_k)
@@ -0,0 +1,132 @@
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+# Allow running as a script from the data directory
+sys.path.append(str(Path(__file__).parent.parent))
+from data.benchmark_ann import SAMPLE_QUESTIONS
+from data.document_embeddings import DocumentEmbedder
+from data.model_registry import registry
+from data.processed_store import load_processed_document
+from data.retrieval import exact_search, normalize_rows
+from data.text_splitter import sentence_spans
+
+def load_documents(processed_dir: str) -> List[Dict[str, Any]]:
+    """Load every processed document."""
+    documents = []
+    for json_file in sorted(os.listdir(processed_dir)):
+        if json_file.endswith(".json"):
+            documents.append(load_processed_document(os.path.join(processed_dir, json_file)))
+    return documents
+
+def sample_sentences(documents: List[Dict[str, Any]], n: int, seed: int = 0) -> List[Tuple[str, str]]:
+    """Sample (source, sentence) pairs of 8-40 words to use as known-item queries."""
+    candidates = []
+    for document in documents:
+        text = document["full_text"]
+        for start, end in sentence_spans(text):
+            if 8 <= len(text[start:end].split()) <= 40:
+                candidates.append((document["filename"], text[start:end]))
+    random.Random(seed).shuffle(candidates)
+    return candidates[:n]
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+def evaluate_mode(
+    embedder: DocumentEmbedder,
+    documents: List[Dict[str, Any]],
+    queries: List[Tuple[str, str]],
+    top_k: int,
+    reader_questions: int
+) -> Dict[str, float]:
+    """Chunk, embed and query the corpus with one chunker, returning its measurements."""
+    limit = embedder.max_chunk_tokens()
+
+    start = time.perf_counter()
+    chunks = [chunk for document in documents for chunk in embedder.create_document_chunks(document)]
+    chunk_seconds = time.perf_counter() - start
+
+    token_counts = np.asarray([
+        len(embedder.model.tokenize(chunk["text"], add_special_tokens=False, verbose=False)["input_ids"])
+        for chunk in chunks
+    ])
+
+    start = time.perf_counter()
+    matrix = normalize_rows(embedder.encode_texts([chunk["text"] for chunk in chunks]))
+    embed_seconds = time.perf_counter() - start
+
+    # Known-item retrieval: a hit when a top-k chunk from the right document contains the sentence
+    query_matrix = normalize_rows(embedder.encode_texts([sentence for _, sentence in queries]))
+    chunk_texts = [_normalize(chunk["text"]) for chunk in chunks]
+    hits = 0
+    reciprocal_ranks = []
+    for (source, sentence), query in zip(queries, query_matrix):
+        rows, _ = exact_search(matrix, query, top_k)
+        sentence = _normalize(sentence)
+        rank = next(
+            (i + 1 for i, row in enumerate(rows)
+             if chunks[row]["source"] == source and sentence in chunk_texts[row]),
+            None
+        )
+        hits += rank is not None
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+
+    # Reader latency over the same top-k contexts QAService builds
+    reader = registry.qa_pipeline("distilbert-base-cased-distilled-squad")
+    questions = SAMPLE_QUESTIONS[:reader_questions]
+    reader_ms = 0.0
+    if questions and reader.available():
+        question_matrix = normalize_rows(embedder.encode_texts(questions))
+        start = time.perf_counter()
+        for question, query in zip(questions, question_matrix):
+            rows, _ = exact_search(matrix, query, top_k)
+            context = "\n\n".join(f"Source: {chunks[row]['source']}\n{chunks[row]['text']}" for row in rows)
+            reader(question=question, context=context)
+        reader_ms = (time.perf_counter() - start) * 1000 / len(questions)
+
+    return {
+        "chunks": len(chunks),
+        "mean_tokens": float(token_counts.mean()) if len(chunks) else 0.0,
+        "truncated": float((token_counts > limit).mean()) if len(chunks) else 0.0,
+        "chunk_s": chunk_seconds,
+        "embed_s": embed_seconds,
+        "hit_at_k": hits / len(queries) if queries else 0.0,
+        "mrr": float(np.mean(reciprocal_ranks)) if queries else 0.0,
+        "reader_ms": reader_ms
+    }
+
+if __name__ == "__main__":
+    root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    arg_parser = argparse.ArgumentParser(description="Character vs token chunking: latency and retrieval quality")
+    arg_parser.add_argument("--processed-dir", default=os.path.join(root_dir, "processed"))
+    arg_parser.add_argument("--queries", type=int, default=200, help="Known-item sentence queries")
+    arg_parser.add_argument("--top-k", type=int, default=3)
+    arg_parser.add_argument("--overlap-tokens", type=int, default=32)
+    arg_parser.add_argument("--reader-questions", type=int, default=len(SAMPLE_QUESTIONS),
+                            help="Sample questions to time the reader on (0 to skip)")
+    args = arg_parser.parse_args()
+
+    documents = load_documents(args.processed_dir)
+    queries = sample_sentences(documents, args.queries)
+    print(f"{len(documents)} documents, {len(queries)} known-item queries, top_k={args.top_k}")
+
+    results = {}
+    for mode in ("chars", "tokens"):
+        embedder = DocumentEmbedder(chunking=mode, overlap_tokens=args.overlap_tokens)
+        results[mode] = evaluate_mode(embedder, documents, queries, args.top_k, args.reader_questions)
+
+    columns = ["chunks", "mean_tokens", "truncated", "chunk_s", "embed_s", "hit_at_k", "mrr", "reader_ms"]
+    print(f"\n{'mode':<8}" + "".join(f"{column:>13}" for column in columns))
+    for mode, result in results.items():
+        print(f"{mode:<8}" + "".join(
+            f"{result[column]:>13d}" if isinstance(result[column], int) else f"{result[column]:>13.3f}"
+            for column in columns
+        ))
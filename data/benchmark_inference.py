@@ -0,0 +1,146 @@
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+# Allow running as a script from the data directory
+sys.path.append(str(Path(__file__).parent.parent))
+from data.benchmark_ann import SAMPLE_QUESTIONS
+from data.benchmark_chunking import load_documents, sample_sentences
+from data.inference_backend import BACKENDS, EMBEDDING_MODELS, QA_MODELS
+from data.model_registry import registry
+from data.retrieval import exact_search, normalize_rows
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def run_backend(backend: str, passages: List[str], questions: List[str], top_k: int) -> Dict[str, Any]:
+    """Embed passages and questions with one backend, recording outputs and latencies."""
+    encoder = registry.sentence_transformer(EMBEDDING_MODELS[0], backend)
+    encoder.get()  # load outside the timings
+
+    passage_embeddings, passage_seconds = _timed(encoder.encode, passages, batch_size=32)
+    passage_matrix = normalize_rows(np.asarray(passage_embeddings, dtype=np.float32))
+    query_seconds = []
+    query_rows = []
+    for question in questions:
+        embedding, seconds = _timed(encoder.encode, [question])
+        query_rows.append(embedding[0])
+        query_seconds.append(seconds)
+    query_matrix = normalize_rows(np.asarray(query_rows, dtype=np.float32))
+
+    return {
+        "passages": passage_matrix,
+        "queries": query_matrix,
+        "rankings": [exact_search(passage_matrix, query, top_k)[0] for query in query_matrix],
+        "embed_passages_per_s": len(passages) / passage_seconds if passage_seconds else 0.0,
+        "embed_query_ms": float(np.median(query_seconds)) * 1000 if query_seconds else 0.0
+    }
+
+def run_readers(backend: str, questions: List[str], contexts: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Answer every question over a fixed context with each reader model."""
+    readers = {}
+    for model_name in QA_MODELS:
+        reader = registry.qa_pipeline(model_name, backend=backend)
+        reader.get()  # a reader that cannot load on this backend fails the run
+        outputs = []
+        seconds = []
+        for question, context in zip(questions, contexts):
+            output, elapsed = _timed(reader, question=question, context=context)
+            outputs.append(output)
+            seconds.append(elapsed)
+        readers[model_name] = {
+            "answers": [output["answer"] for output in outputs],
+            "scores": np.asarray([output["score"] for output in outputs]),
+            "reader_ms": float(np.median(seconds)) * 1000 if seconds else 0.0
+        }
+    return readers
+
+def compare(reference: Dict[str, Any], candidate: Dict[str, Any], top_k: int) -> Dict[str, float]:
+    """Drift of a candidate backend's outputs against the reference backend."""
+    cosines = np.concatenate([
+        np.sum(reference["passages"] * candidate["passages"], axis=1),
+        np.sum(reference["queries"] * candidate["queries"], axis=1)
+    ])
+    overlaps = [
+        len(set(ref_rows.tolist()) & set(rows.tolist())) / max(1, min(top_k, len(ref_rows)))
+        for ref_rows, rows in zip(reference["rankings"], candidate["rankings"])
+    ]
+    drift = {
+        "mean_cosine": float(cosines.mean()),
+        "min_cosine": float(cosines.min()),
+        "overlap_at_k": float(np.mean(overlaps)) if overlaps else 1.0
+    }
+    for model_name, ref_reader in reference["readers"].items():
+        reader = candidate["readers"].get(model_name)
+        if reader is None:
+            continue
+        agreement = np.mean([a == b for a, b in zip(ref_reader["answers"], reader["answers"])])
+        drift[f"{model_name}:answer_agreement"] = float(agreement)
+        drift[f"{model_name}:score_diff"] = float(np.abs(ref_reader["scores"] - reader["scores"]).mean())
+    return drift
+
+if __name__ == "__main__":
+    root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    arg_parser = argparse.ArgumentParser(
+        description="Accuracy drift and latency of the inference backends against fp32 PyTorch"
+    )
+    arg_parser.add_argument("--processed-dir", default=os.path.join(root_dir, "processed"))
+    arg_parser.add_argument("--backends", nargs="+", choices=BACKENDS[1:], default=list(BACKENDS[1:]))
+    arg_parser.add_argument("--passages", type=int, default=500, help="Sampled sentences to embed and search")
+    arg_parser.add_argument("--top-k", type=int, default=3)
+    arg_parser.add_argument("--min-cosine", type=float, default=0.99,
+                            help="Fail when the mean embedding cosine to torch drops below this")
+    arg_parser.add_argument("--min-agreement", type=float, default=0.8,
+                            help="Fail when a reader's exact answer agreement with torch drops below this")
+    args = arg_parser.parse_args()
+
+    documents = load_documents(args.processed_dir)
+    passages = [sentence for _, sentence in sample_sentences(documents, args.passages)]
+    questions = SAMPLE_QUESTIONS
+    print(f"{len(passages)} passages, {len(questions)} questions, top_k={args.top_k}")
+
+    results = {"torch": run_backend("torch", passages, questions, args.top_k)}
+    # Every backend reads the same contexts: the passages torch retrieves
+    contexts = ["\n\n".join(passages[row] for row in rows) for rows in results["torch"]["rankings"]]
+    results["torch"]["readers"] = run_readers("torch", questions, contexts)
+    failed = False
+    for backend in args.backends:
+        try:
+            results[backend] = run_backend(backend, passages, questions, args.top_k)
+            results[backend]["readers"] = run_readers(backend, questions, contexts)
+        except Exception as e:
+            # Never report another backend's numbers under this one's name
+            print(f"FAIL {backend}: could not run on this backend: {str(e)}")
+            results.pop(backend, None)
+            failed = True
+
+    print(f"\n{'backend':<12}{'passages/s':>12}{'query_ms':>10}" + "".join(
+        f"{model_name.split('/')[-1][:24] + ' ms':>30}" for model_name in QA_MODELS
+    ))
+    for backend, result in results.items():
+        print(f"{backend:<12}{result['embed_passages_per_s']:>12.1f}{result['embed_query_ms']:>10.2f}" + "".join(
+            f"{result['readers'][model_name]['reader_ms']:>30.1f}" if model_name in result["readers"] else f"{'-':>30}"
+            for model_name in QA_MODELS
+        ))
+
+    print("\nDrift against torch:")
+    for backend in [backend for backend in args.backends if backend in results]:
+        drift = compare(results["torch"], results[backend], args.top_k)
+        for metric, value in drift.items():
+            print(f"  {backend:<12}{metric:<60}{value:.4f}")
+        if drift["mean_cosine"] < args.min_cosine:
+            print(f"  FAIL {backend}: mean cosine {drift['mean_cosine']:.4f} < {args.min_cosine}")
+            failed = True
+        for metric, value in drift.items():
+            if metric.endswith(":answer_agreement") and value < args.min_agreement:
+                print(f"  FAIL {backend}: {metric} {value:.2f} < {args.min_agreement}")
+                failed = True
+
+    sys.exit(1 if failed else 0)
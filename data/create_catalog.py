@@ -1,9 +1,16 @@
 import os
+import sys
 import json
 import pandas as pd
 from datetime import datetime
+from pathlib import Path
 import pdfplumber
 
+# Allow running as a script from the data directory
+sys.path.append(str(Path(__file__).parent.parent))
+from data.document_parser import decision_type
+from data.manifest import IngestManifest, file_hash
+
 def extract_metadata(pdf_path):
     """Extract basic metadata from PDF file."""
     try:
@@ -24,14 +31,14 @@ def extract_metadata(pdf_path):
                 'File Name': os.path.basename(pdf_path),
                 'Date Modified': modified_date.strftime('%Y-%m-%d'),
                 'Size (KB)': round(size_kb, 2),
-                'Type': 'Supreme Court Decision' if not '-' in os.path.basename(pdf_path) else 'Separate Opinion',
+                'Type': decision_type(pdf_path),
                 'Source URL': 'https://sc.judiciary.gov.ph/jurisprudence/'
             }
     except Exception as e:
         print(f"Error processing {pdf_path}: {str(e)}")
         return None
 
-def create_catalog(raw_dir=None):
+def create_catalog(raw_dir=None, manifest_path=None):
     """Create a catalog of all PDF documents in the raw directory."""
     # Set up paths
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -52,14 +59,24 @@ def create_catalog(raw_dir=None):
         print(f"No PDF files found in: {raw_dir}")
         return None
     
-    # Extract metadata for each file
+    # Extract metadata for each file, reusing it for PDFs whose contents are unchanged
+    manifest = IngestManifest(manifest_path)
     metadata_list = []
     for pdf_file in pdf_files:
         pdf_path = os.path.join(raw_dir, pdf_file)
-        metadata = extract_metadata(pdf_path)
+        doc_id = os.path.splitext(pdf_file)[0]
+        source_hash = file_hash(pdf_path)
+        metadata = manifest.cached_catalog_metadata(doc_id, source_hash)
+        if metadata is None:
+            metadata = extract_metadata(pdf_path)
+            if metadata:
+                manifest.record_catalog_metadata(doc_id, source_hash, metadata)
         if metadata:
             metadata_list.append(metadata)
     
+    manifest.forget_catalog_metadata([os.path.splitext(f)[0] for f in pdf_files])
+    manifest.save()
+    
     if not metadata_list:
         print("No metadata could be extracted from the PDF files")
         return None
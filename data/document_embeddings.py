@@ -1,110 +1,242 @@
-import json
 import os
+import sys
 import numpy as np
-from typing import List, Dict, Any
-from sentence_transformers import SentenceTransformer
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
 from tqdm import tqdm
 
+# Allow running as a script from the data directory
+sys.path.append(str(Path(__file__).parent.parent))
+from data import embedding_store
+from data.embedding_cache import EmbeddingCache
+from data.manifest import IngestManifest, file_hash
+from data.inference_backend import inference_backend
+from data.lexical_index import document_postings
+from data.model_registry import registry
+from data import processed_store
+from data.text_splitter import paragraph_spans, sentence_spans, split_long_span
+
+# Bump when chunk boundaries or chunk metadata change, so stored embeddings are rebuilt
+CHUNKER_VERSION = "3"
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_OVERLAP = 100
+DEFAULT_OVERLAP_TOKENS = 32
+
 class DocumentEmbedder:
-    def __init__(self, model_name: str = 'all-MiniLM-L6-v2'):
-        """Initialize the document embedder with a sentence transformer model."""
-        self.model = SentenceTransformer(model_name)
+    def __init__(
+        self,
+        model_name: str = 'all-MiniLM-L6-v2',
+        cache: Optional[EmbeddingCache] = None,
+        chunking: Optional[str] = None,
+        chunk_tokens: Optional[int] = None,
+        overlap_tokens: Optional[int] = None,
+        backend: Optional[str] = None
+    ):
+        """
+        Initialize the document embedder with a shared sentence transformer model.
+        
+        With a cache, chunks whose text was already embedded by this model are
+        not encoded again. chunking (CHUNKING_MODE) selects "chars" (500-character
+        chunks) or "tokens": chunks of chunk_tokens tokenizer tokens (CHUNK_TOKENS,
+        default: the model's maximum sequence length) overlapping by
+        overlap_tokens (CHUNK_OVERLAP_TOKENS). backend selects the inference
+        backend (INFERENCE_BACKEND, see data/inference_backend.py).
+        """
+        self.model_name = model_name
+        self.backend = inference_backend(backend)
+        self.model = registry.sentence_transformer(model_name, self.backend)
+        self.cache = cache
+        
+        self.chunking = chunking or os.getenv("CHUNKING_MODE", "chars")
+        if self.chunking not in ("chars", "tokens"):
+            raise ValueError(f"Unknown chunking mode: {self.chunking}")
+        self.chunk_tokens = chunk_tokens or int(os.getenv("CHUNK_TOKENS", 0)) or None
+        if overlap_tokens is None:
+            overlap_tokens = int(os.getenv("CHUNK_OVERLAP_TOKENS", DEFAULT_OVERLAP_TOKENS))
+        self.overlap_tokens = overlap_tokens
+    
+    def embedding_config(self, input_hash: str) -> Dict[str, Any]:
+        """Everything that determines a document's embeddings, for the ingestion manifest."""
+        config = {
+            "input_hash": input_hash,
+            "chunker_version": CHUNKER_VERSION,
+            "chunk_size": DEFAULT_CHUNK_SIZE,
+            "overlap": DEFAULT_OVERLAP,
+            "model": self.model_name
+        }
+        if self.backend != "torch":
+            config["backend"] = self.backend
+        if self.chunking == "tokens":
+            config.update({
+                "chunking": "tokens",
+                "chunk_tokens": self.chunk_tokens or "auto",
+                "overlap_tokens": self.overlap_tokens
+            })
+        return config
     
     def create_document_chunks(
         self,
         document: Dict[str, Any],
-        chunk_size: int = 500,  # Smaller chunks
-        overlap: int = 100
+        chunk_size: int = DEFAULT_CHUNK_SIZE,  # Smaller chunks
+        overlap: int = DEFAULT_OVERLAP
     ) -> List[Dict[str, Any]]:
         """Split document into overlapping chunks for processing."""
+        if self.chunking == "tokens":
+            return self.create_token_chunks(document)
+        
         if not document.get("full_text"):
             print(f"Warning: No text found in document {document.get('filename')}")
             return []
             
         text = document["full_text"]
+        section_spans = processed_store.section_spans(document)
         chunks = []
         
-        # Split text into paragraphs first
-        paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
-        
-        current_chunk = []
-        current_text = ""
-        
-        for para in paragraphs:
-            # Split long paragraphs into sentences
-            if len(para) > chunk_size:
-                sentences = [s.strip() + "." for s in para.split(".") if s.strip()]
-                for sentence in sentences:
-                    if len(current_text + " " + sentence) > chunk_size and current_chunk:
-                        # Store current chunk
-                        chunk_text = " ".join(current_chunk)
-                        chunks.append({
-                            "id": f"{document['filename']}-chunk-{len(chunks)}",
-                            "text": chunk_text,
-                            "source": document['filename'],
-                            "section_type": self._determine_section_type(chunk_text, document)
-                        })
-                        
-                        # Start new chunk with overlap
-                        if len(current_chunk) > 1:
-                            current_chunk = current_chunk[-1:] + [sentence]
-                            current_text = " ".join(current_chunk)
-                        else:
-                            current_chunk = [sentence]
-                            current_text = sentence
-                    else:
-                        current_chunk.append(sentence)
-                        current_text = current_text + " " + sentence if current_text else sentence
+        # Chunks are built from units (paragraphs, or sentences of long paragraphs)
+        # tracked as offsets into the text, with the joined length kept as a running total
+        current_units: List[Tuple[int, int]] = []
+        current_length = 0
+        
+        def emit() -> None:
+            chunk_text = " ".join(text[start:end] for start, end in current_units)
+            chunks.append({
+                "id": f"{document['filename']}-chunk-{len(chunks)}",
+                "text": chunk_text,
+                "source": document['filename'],
+                "section_type": self._section_type(current_units[0][0], current_units[-1][1], section_spans)
+            })
+        
+        for para_start, para_end in paragraph_spans(text):
+            # Split long paragraphs into sentences, and overlong sentences at word boundaries
+            if para_end - para_start > chunk_size:
+                units = [
+                    piece
+                    for start, end in sentence_spans(text, para_start, para_end)
+                    for piece in split_long_span(text, start, end, chunk_size)
+                ]
             else:
-                # Handle regular paragraphs
-                if len(current_text + " " + para) > chunk_size and current_chunk:
-                    # Store current chunk
-                    chunk_text = " ".join(current_chunk)
-                    chunks.append({
-                        "id": f"{document['filename']}-chunk-{len(chunks)}",
-                        "text": chunk_text,
-                        "source": document['filename'],
-                        "section_type": self._determine_section_type(chunk_text, document)
-                    })
+                units = [(para_start, para_end)]
+            
+            for unit in units:
+                unit_length = unit[1] - unit[0]
+                if current_units and current_length + 1 + unit_length > chunk_size:
+                    emit()
                     
                     # Start new chunk with overlap
-                    if len(current_chunk) > 1:
-                        current_chunk = current_chunk[-1:] + [para]
-                        current_text = " ".join(current_chunk)
+                    if len(current_units) > 1:
+                        last = current_units[-1]
+                        current_units = [last]
+                        current_length = last[1] - last[0]
                     else:
-                        current_chunk = [para]
-                        current_text = para
-                else:
-                    current_chunk.append(para)
-                    current_text = current_text + " " + para if current_text else para
+                        current_units = []
+                        current_length = 0
+                
+                current_length += unit_length + (1 if current_units else 0)
+                current_units.append(unit)
         
         # Add final chunk if it exists
-        if current_chunk:
-            chunk_text = " ".join(current_chunk)
+        if current_units:
+            emit()
+        
+        print(f"Created {len(chunks)} chunks from {document['filename']}")
+        return chunks
+    
+    def max_chunk_tokens(self) -> int:
+        """Largest chunk, in tokens, the embedding model encodes without truncation."""
+        # Leave room for the [CLS] and [SEP] tokens added by the model
+        return int(self.model.max_seq_length) - 2
+    
+    def create_token_chunks(
+        self,
+        document: Dict[str, Any],
+        chunk_tokens: Optional[int] = None,
+        overlap_tokens: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Split document into chunks of at most chunk_tokens tokenizer tokens.
+        
+        Chunks end on sentence boundaries where possible and repeat up to
+        overlap_tokens tokens of trailing sentences from the previous chunk.
+        """
+        if not document.get("full_text"):
+            print(f"Warning: No text found in document {document.get('filename')}")
+            return []
+        
+        chunk_tokens = chunk_tokens or self.chunk_tokens or self.max_chunk_tokens()
+        overlap_tokens = self.overlap_tokens if overlap_tokens is None else overlap_tokens
+        
+        text = document["full_text"]
+        section_spans = processed_store.section_spans(document)
+        
+        # Tokenize the whole document once; sentence offsets map to token ranges by binary search.
+        # tokenize() holds the model lock: the query encoder shares this fast tokenizer
+        encoding = self.model.tokenize(
+            text,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            verbose=False
+        )
+        offsets = encoding["offset_mapping"]
+        token_starts = np.asarray([start for start, _ in offsets], dtype=np.int64)
+        
+        # Units are (first token, end token) ranges; overlong sentences become token windows
+        units: List[Tuple[int, int]] = []
+        for para_start, para_end in paragraph_spans(text):
+            for start, end in sentence_spans(text, para_start, para_end):
+                first = int(np.searchsorted(token_starts, start, side="left"))
+                last = int(np.searchsorted(token_starts, end, side="left"))
+                for window_start in range(first, last, chunk_tokens):
+                    units.append((window_start, min(window_start + chunk_tokens, last)))
+        
+        chunks = []
+        current: List[Tuple[int, int]] = []
+        
+        def emit() -> None:
+            start, end = offsets[current[0][0]][0], offsets[current[-1][1] - 1][1]
             chunks.append({
                 "id": f"{document['filename']}-chunk-{len(chunks)}",
-                "text": chunk_text,
+                "text": text[start:end],
                 "source": document['filename'],
-                "section_type": self._determine_section_type(chunk_text, document)
+                "section_type": self._section_type(start, end, section_spans)
             })
         
-        print(f"Created {len(chunks)} chunks from {document['filename']}")
+        for unit in units:
+            # Units are contiguous in token order, so a chunk's size is its token span
+            if current and unit[1] - current[0][0] > chunk_tokens:
+                emit()
+                
+                # Start new chunk with the trailing sentences that fit in the overlap
+                carried = []
+                carried_tokens = 0
+                for previous in reversed(current):
+                    size = previous[1] - previous[0]
+                    if carried_tokens + size > overlap_tokens or unit[1] - previous[0] > chunk_tokens:
+                        break
+                    carried.insert(0, previous)
+                    carried_tokens += size
+                current = carried
+            current.append(unit)
+        
+        if current:
+            emit()
+        
+        print(f"Created {len(chunks)} token chunks from {document['filename']}")
         return chunks
     
-    def _determine_section_type(self, chunk_text: str, document: Dict[str, Any]) -> str:
-        """Determine which section of the document this chunk belongs to."""
-        chunk_text = chunk_text.upper()
-        sections = document.get("sections", {})
-        
-        # Check if chunk belongs to a specific section
-        if sections.get("header") and chunk_text.startswith(sections["header"][:100].upper()):
+    def _section_type(self, start: int, end: int, spans: Dict[str, Tuple[int, int]]) -> str:
+        """Determine which section a chunk spanning text[start:end] belongs to."""
+        header = spans.get("header")
+        if header and header[0] < header[1] and start == header[0]:
             return "header"
-        elif sections.get("syllabus") and chunk_text in sections["syllabus"].upper():
-            return "syllabus"
-        elif sections.get("dispositive") and chunk_text in sections["dispositive"].upper():
-            return "dispositive"
-        else:
-            return "decision"
+        # A chunk belongs to a section holding most of it, or covering all of a short one
+        for name in ("syllabus", "dispositive"):
+            span = spans.get(name)
+            if not span or span[0] >= span[1]:
+                continue
+            overlap = min(end, span[1]) - max(start, span[0])
+            if 2 * overlap >= end - start or (start <= span[0] and span[1] <= end):
+                return name
+        return "decision"
     
     def generate_embeddings(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Generate embeddings for document chunks."""
@@ -113,23 +245,42 @@ class DocumentEmbedder:
             
         texts = [chunk["text"] for chunk in chunks]
         
+        # Reuse embeddings of chunks seen before; only encode the rest
+        embeddings = self.cache.lookup(texts) if self.cache else [None] * len(texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        
         # Generate embeddings in batches
-        embeddings = []
         batch_size = 32
         
-        for i in tqdm(range(0, len(texts), batch_size), desc="Generating embeddings"):
-            batch_texts = texts[i:i + batch_size]
-            batch_embeddings = self.model.encode(batch_texts)
-            embeddings.extend(batch_embeddings.tolist())
+        for start in tqdm(range(0, len(missing), batch_size), desc="Generating embeddings"):
+            batch = missing[start:start + batch_size]
+            encoded = self.encode_texts([texts[i] for i in batch])
+            for i, embedding in zip(batch, encoded):
+                embeddings[i] = embedding
         
         # Add embeddings to chunks
         for i, chunk in enumerate(chunks):
-            chunk["embedding"] = embeddings[i]
+            chunk["embedding"] = np.asarray(embeddings[i], dtype=np.float32).tolist()
         
         return chunks
+    
+    def encode_texts(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """Encode a list of texts into a float32 embedding matrix."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.asarray(self.model.encode(texts, batch_size=batch_size), dtype=np.float32)
+    
+    def lexical_postings(self, chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Build the BM25 postings of a document's chunks, saved next to its embeddings."""
+        return document_postings([chunk["text"] for chunk in chunks])
 
-def process_documents(processed_dir: str = None, embeddings_dir: str = None) -> None:
-    """Process all documents and generate embeddings."""
+def process_documents(
+    processed_dir: str = None,
+    embeddings_dir: str = None,
+    manifest_path: str = None,
+    force: bool = False
+) -> None:
+    """Generate embeddings for new or changed processed documents."""
     # Set up paths
     script_dir = os.path.dirname(os.path.abspath(__file__))
     if processed_dir is None:
@@ -147,22 +298,34 @@ def process_documents(processed_dir: str = None, embeddings_dir: str = None) ->
     
     # Initialize embedder
     embedder = DocumentEmbedder()
+    manifest = IngestManifest(manifest_path)
     
     # Process all JSON files
-    all_chunks = []
+    total_chunks = 0
     json_files = [f for f in os.listdir(processed_dir) if f.endswith('.json')]
     
+    # Remove embeddings whose processed document was deleted
+    manifest.collect_garbage([os.path.splitext(f)[0] for f in json_files], owner="embedding")
+    manifest.save()
+    
     if not json_files:
         print(f"No JSON files found in: {processed_dir}")
         return
     
-    print(f"Found {len(json_files)} JSON files to process")
+    # Only re-embed documents whose contents, chunker or model changed
+    pending = []
+    for json_file in json_files:
+        doc_id = os.path.splitext(json_file)[0]
+        config = embedder.embedding_config(file_hash(os.path.join(processed_dir, json_file)))
+        if force or manifest.needs_embed(doc_id, config, embeddings_dir):
+            pending.append((json_file, config))
+    
+    print(f"Found {len(json_files)} JSON files, {len(pending)} to embed")
     
-    for json_file in tqdm(json_files, desc="Processing documents"):
+    for json_file, config in tqdm(pending, desc="Processing documents"):
         try:
             # Load processed document
-            with open(os.path.join(processed_dir, json_file), 'r', encoding='utf-8') as f:
-                document = json.load(f)
+            document = processed_store.load_processed_document(os.path.join(processed_dir, json_file))
             
             # Create chunks
             chunks = embedder.create_document_chunks(document)
@@ -171,25 +334,29 @@ def process_documents(processed_dir: str = None, embeddings_dir: str = None) ->
                 # Generate embeddings
                 chunks_with_embeddings = embedder.generate_embeddings(chunks)
                 
-                # Add to collection
-                all_chunks.extend(chunks_with_embeddings)
+                # Save this document's embeddings as soon as they are ready
+                doc_id = os.path.splitext(json_file)[0]
+                embedding_store.save_document_embeddings(
+                    embeddings_dir,
+                    doc_id,
+                    chunks_with_embeddings,
+                    postings=embedder.lexical_postings(chunks_with_embeddings)
+                )
+                manifest.record_embed(doc_id, config, embeddings_dir)
+                manifest.save()
+                total_chunks += len(chunks_with_embeddings)
             else:
                 print(f"Warning: No chunks created for {json_file}")
         except Exception as e:
             print(f"Error processing {json_file}: {str(e)}")
             continue
     
-    if not all_chunks:
-        print("No chunks were created from any documents")
+    if not total_chunks:
+        print("No new chunks were created")
         return
     
-    # Save all chunks with embeddings
-    output_file = os.path.join(embeddings_dir, "document_chunks.json")
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(all_chunks, f, ensure_ascii=False, indent=2)
-    
-    print(f"Processed {len(json_files)} documents into {len(all_chunks)} chunks")
-    print(f"Saved embeddings to: {output_file}")
+    print(f"Processed {len(pending)} documents into {total_chunks} chunks")
+    print(f"Saved embeddings to: {embeddings_dir}")
 
 if __name__ == "__main__":
-    process_documents() 
\ No newline at end of file
+    process_documents(force="--force" in sys.argv)
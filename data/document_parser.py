@@ -1,27 +1,139 @@
 import pdfplumber
 import re
-import json
 import os
-from typing import Dict, List, Optional
-import spacy
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import sys
+from pathlib import Path
 from tqdm import tqdm
 
+# Allow running as a script from the data directory
+sys.path.append(str(Path(__file__).parent.parent))
+from data.manifest import IngestManifest, file_hash
+from data.model_registry import registry
+from data.processed_store import save_processed_document
+from data.text_splitter import sentence_spans
+
+# Bump when extraction, cleaning or sectioning changes, so processed documents are rebuilt
+PARSER_VERSION = "4"
+
+DECISION_TYPES = ("Supreme Court Decision", "Separate Opinion")
+
+# Section anchors in cleaned text; headings and dispositive openings are upper case
+HEADER_SEARCH_CHARS = 3000
+_TITLE = re.compile(
+    r"\b(?:D ?E ?C ?I ?S ?I ?O ?N|R ?E ?S ?O ?L ?U ?T ?I ?O ?N"
+    r"|(?:CONCURRING|DISSENTING|SEPARATE)(?: AND (?:CONCURRING|DISSENTING))? OPINION)\b"
+)
+_SYLLABUS = re.compile(r"\b(?:SYLLABUS|SYNOPSIS|SUMMARY)\b")
+_DISPOSITIVE = re.compile(
+    r"\b(?:WHEREFORE|ACCORDINGLY|FOR THESE REASONS|FOR ALL THE FOREGOING|PREMISES CONSIDERED"
+    r"|IN VIEW (?:OF THE FOREGOING|WHEREOF|THEREOF))\b"
+)
+_SO_ORDERED = re.compile(r"\bSO ORDERED\b\.?")
+
+def decision_type(filename: str) -> str:
+    """Infer the decision type from a bundled corpus file name (separate opinions carry a suffix, e.g. 12345-1.pdf)."""
+    return DECISION_TYPES[1] if "-" in os.path.basename(filename) else DECISION_TYPES[0]
+
+def decision_type_from_text(text: str) -> Optional[str]:
+    """Infer the decision type from the title on a cleaned document's first page, or None without one."""
+    title = _TITLE.search(text, 0, HEADER_SEARCH_CHARS)
+    if title is None:
+        return None
+    return DECISION_TYPES[1] if title.group().endswith("OPINION") else DECISION_TYPES[0]
+
+def _load_spacy_model():
+    import spacy
+    return spacy.load("en_core_web_sm")
+
+def _extract_page_range(pdf_path: str, start: int, end: int) -> List[Tuple[int, str, float]]:
+    """Extract (page number, text, seconds) for pages [start, end); runs in a worker process."""
+    pages = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for page_number in range(start, end):
+            page_start = time.perf_counter()
+            page_text = pdf.pages[page_number].extract_text() or ""
+            pages.append((page_number, page_text, time.perf_counter() - page_start))
+    return pages
+
+_page_pool: Optional[ProcessPoolExecutor] = None
+_page_pool_lock = threading.Lock()
+
+def _get_page_pool(workers: int) -> ProcessPoolExecutor:
+    """Get the process pool shared by all parsers, creating it on first use."""
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is None:
+            # Spawn rather than fork: the API process runs threads and holds torch models
+            _page_pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _page_pool
+
 class DocumentParser:
-    def __init__(self):
-        """Initialize the document parser with spaCy model."""
-        self.nlp = spacy.load("en_core_web_sm")
+    def __init__(self, workers: Optional[int] = None, parallel_min_pages: Optional[int] = None):
+        """
+        Initialize the document parser with a shared spaCy model (loaded on first use).
+        
+        PDFs with at least parallel_min_pages pages (PDF_PARALLEL_MIN_PAGES) are
+        extracted on a pool of workers (PDF_WORKERS, default: all cores).
+        """
+        self.nlp = registry.get("spacy:en_core_web_sm", _load_spacy_model)
+        self.workers = workers or int(os.getenv("PDF_WORKERS", os.cpu_count() or 1))
+        if parallel_min_pages is None:
+            parallel_min_pages = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 16))
+        self.parallel_min_pages = parallel_min_pages
+    
+    def extract_pages(self, pdf_path: str, parallel: Optional[bool] = None) -> List[Dict[str, Any]]:
+        """
+        Extract text page by page, in page order.
+        
+        Returns one {"page", "text", "seconds"} entry per page. Page ranges are
+        fanned out to the process pool when parallel is True, or when it is None
+        and the PDF is large enough.
+        """
+        with pdfplumber.open(pdf_path) as pdf:
+            num_pages = len(pdf.pages)
+        
+        if parallel is None:
+            parallel = self.workers > 1 and num_pages >= self.parallel_min_pages
+        
+        if not parallel or num_pages == 0:
+            pages = _extract_page_range(pdf_path, 0, num_pages)
+        else:
+            # A few ranges per worker keeps the pool busy when pages vary in cost
+            range_size = max(1, -(-num_pages // (self.workers * 2)))
+            pool = _get_page_pool(self.workers)
+            futures = [
+                pool.submit(_extract_page_range, pdf_path, start, min(start + range_size, num_pages))
+                for start in range(0, num_pages, range_size)
+            ]
+            pages = [page for future in futures for page in future.result()]
+        
+        return [
+            {"page": page_number, "text": page_text, "seconds": seconds}
+            for page_number, page_text, seconds in pages
+        ]
     
-    def extract_text_from_pdf(self, pdf_path: str) -> str:
+    def extract_text_from_pdf(self, pdf_path: str, parallel: Optional[bool] = None) -> str:
         """Extract text from PDF while preserving basic structure."""
-        text = ""
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                print(f"Processing {pdf_path}: {len(pdf.pages)} pages")
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n\n"
-                print(f"Extracted {len(text)} characters")
+            start = time.perf_counter()
+            pages = self.extract_pages(pdf_path, parallel=parallel)
+            
+            # Join once instead of growing the string page by page
+            text = "".join(page["text"] + "\n\n" for page in pages if page["text"])
+            
+            elapsed = time.perf_counter() - start
+            slowest = max(pages, key=lambda page: page["seconds"], default=None)
+            print(f"Processing {pdf_path}: {len(pages)} pages in {elapsed:.2f}s"
+                  + (f" (slowest: page {slowest['page'] + 1}, {slowest['seconds']:.2f}s)" if slowest else ""))
+            print(f"Extracted {len(text)} characters")
         except Exception as e:
             print(f"Error extracting text from {pdf_path}: {str(e)}")
             return ""
@@ -49,49 +161,71 @@ class DocumentParser:
         
         return text.strip()
 
-    def extract_sections(self, text: str) -> Dict[str, str]:
+    def extract_sections(self, text: str, spans: Optional[Dict[str, Tuple[int, int]]] = None) -> Dict[str, str]:
         """Split document into logical sections based on headings."""
-        if not text.strip():
-            return {
-                "header": "",
-                "syllabus": "",
-                "decision": "",
-                "dispositive": ""
-            }
+        if spans is None:
+            spans = self.extract_section_spans(text)
+        return {name: text[start:end] for name, (start, end) in spans.items()}
+
+    def extract_section_spans(self, text: str) -> Dict[str, Tuple[int, int]]:
+        """
+        Locate the logical sections as (start, end) character offsets into the text.
         
-        sections = {
-            "header": "",
-            "syllabus": "",
-            "decision": "",
-            "dispositive": ""
+        Cleaning collapses line breaks, so sections are found from anchors in
+        the running text: the header runs up to the DECISION/RESOLUTION (or
+        opinion) title, a syllabus from its heading to that title, and the
+        dispositive portion from its opening word (WHEREFORE, ACCORDINGLY, ...)
+        through the last "SO ORDERED". The rest is the decision.
+        """
+        spans = {
+            "header": (0, 0),
+            "syllabus": (0, 0),
+            "decision": (0, 0),
+            "dispositive": (0, 0)
         }
+        if not text.strip():
+            return spans
         
-        # Split into paragraphs
-        paragraphs = text.split("\n\n")
-        
-        # Extract header (first few paragraphs)
-        header_end = min(3, len(paragraphs))
-        sections["header"] = "\n\n".join(paragraphs[:header_end])
+        # The title sits in the first page; later mentions are part of the body
+        title = _TITLE.search(text, 0, HEADER_SEARCH_CHARS)
+        if title:
+            body_start = title.start()
+        else:
+            # No recognizable title: the first few sentences form the header
+            sentences = sentence_spans(text)
+            body_start = sentences[min(3, len(sentences)) - 1][1]
         
-        # Look for syllabus section
-        for i, para in enumerate(paragraphs):
-            if any(keyword in para.upper() for keyword in ["SYLLABUS", "SYNOPSIS", "SUMMARY"]):
-                sections["syllabus"] = para
-                break
+        syllabus = _SYLLABUS.search(text, 0, body_start) if title else None
+        if syllabus:
+            spans["syllabus"] = (syllabus.start(), body_start)
+            spans["header"] = (0, syllabus.start())
+        else:
+            spans["header"] = (0, body_start)
         
-        # Look for dispositive portion (from the end)
-        for i, para in enumerate(reversed(paragraphs)):
-            if any(keyword in para.upper() for keyword in ["WHEREFORE", "SO ORDERED"]):
-                sections["dispositive"] = para
-                break
+        # Decisions quote lower courts' dispositive portions, so only the opening
+        # before the final "SO ORDERED" (or, without it, in the second half) counts
+        orders = list(_SO_ORDERED.finditer(text, body_start))
+        search_end = orders[-1].start() if orders else len(text)
+        openings = [match.start() for match in _DISPOSITIVE.finditer(text, body_start, search_end)]
+        if openings and (orders or openings[-1] >= len(text) // 2):
+            # Signatures, footnotes and appended opinions follow "SO ORDERED."
+            spans["dispositive"] = (openings[-1], orders[-1].end() if orders else len(text))
         
-        # The rest is considered the decision
-        sections["decision"] = text
+        spans["decision"] = (body_start, spans["dispositive"][0] if spans["dispositive"][1] else len(text))
         
-        return sections
+        return spans
 
     def process_document(self, pdf_path: str, output_dir: str) -> Optional[Dict]:
         """Process a single document and save the results."""
+        output = self.parse_document(pdf_path)
+        if output is None:
+            return None
+        
+        self.save_document(output, output_dir)
+        return output
+    
+    def parse_document(self, pdf_path: str) -> Optional[Dict]:
+        """Extract, clean, section and analyze a single document without saving it."""
         print(f"\nProcessing document: {pdf_path}")
         
         # Extract text
@@ -108,8 +242,8 @@ class DocumentParser:
         
         print(f"Cleaned text length: {len(cleaned_text)} characters")
         
-        # Extract sections
-        sections = self.extract_sections(cleaned_text)
+        # Locate sections as offsets into the cleaned text
+        section_spans = self.extract_section_spans(cleaned_text)
         
         # Process with spaCy for additional analysis
         doc = self.nlp(cleaned_text[:1000000])  # Limit to 1M chars to avoid memory issues
@@ -129,7 +263,7 @@ class DocumentParser:
         output = {
             "filename": os.path.basename(pdf_path),
             "full_text": cleaned_text,
-            "sections": sections,
+            "section_spans": {name: list(span) for name, span in section_spans.items()},
             "entities": entities,
             "metadata": {
                 "num_tokens": len(doc),
@@ -138,19 +272,27 @@ class DocumentParser:
             }
         }
         
-        # Save to JSON
+        return output
+    
+    def save_document(self, output: Dict, output_dir: str) -> str:
+        """Save a processed document as JSON, returning its path."""
         output_path = os.path.join(
             output_dir,
-            os.path.basename(pdf_path).replace(".pdf", ".json")
+            output["filename"].replace(".pdf", ".json")
         )
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(output, f, indent=2, ensure_ascii=False)
+        
+        save_processed_document(output_path, output)
         
         print(f"Saved processed document to: {output_path}")
-        return output
+        return output_path
 
-def process_all_documents(raw_dir: str = None, processed_dir: str = None) -> None:
-    """Process all PDF documents in the raw directory."""
+def process_all_documents(
+    raw_dir: str = None,
+    processed_dir: str = None,
+    manifest_path: str = None,
+    force: bool = False
+) -> None:
+    """Process new or changed PDF documents in the raw directory."""
     # Set up paths
     script_dir = os.path.dirname(os.path.abspath(__file__))
     if raw_dir is None:
@@ -166,22 +308,41 @@ def process_all_documents(raw_dir: str = None, processed_dir: str = None) -> Non
     # Create output directory if it doesn't exist
     os.makedirs(processed_dir, exist_ok=True)
     
-    # Initialize parser
-    parser = DocumentParser()
+    manifest = IngestManifest(manifest_path)
     
     # Get all PDF files
     pdf_files = [f for f in os.listdir(raw_dir) if f.endswith(".pdf")]
     
+    # Remove outputs of PDFs that were deleted from the raw directory
+    manifest.collect_garbage([os.path.splitext(f)[0] for f in pdf_files], owner="source")
+    manifest.save()
+    
     if not pdf_files:
         print(f"No PDF files found in: {raw_dir}")
         return
     
-    print(f"Found {len(pdf_files)} PDF files to process")
+    # Only reparse PDFs whose contents or the parser changed
+    pending = []
+    for pdf_file in pdf_files:
+        pdf_path = os.path.join(raw_dir, pdf_file)
+        source_hash = file_hash(pdf_path)
+        if force or manifest.needs_parse(os.path.splitext(pdf_file)[0], source_hash, PARSER_VERSION):
+            pending.append((pdf_file, source_hash))
+    
+    print(f"Found {len(pdf_files)} PDF files, {len(pending)} to process")
+    
+    # Initialize parser
+    parser = DocumentParser()
     
     # Process each document
-    for pdf_file in tqdm(pdf_files, desc="Processing documents"):
+    for pdf_file, source_hash in tqdm(pending, desc="Processing documents"):
         pdf_path = os.path.join(raw_dir, pdf_file)
-        parser.process_document(pdf_path, processed_dir)
+        output = parser.parse_document(pdf_path)
+        if output is None:
+            continue
+        processed_path = parser.save_document(output, processed_dir)
+        manifest.record_parse(os.path.splitext(pdf_file)[0], pdf_path, source_hash, PARSER_VERSION, processed_path)
+        manifest.save()
     
     print(f"Processed documents saved to: {processed_dir}")
 
@@ -190,4 +351,4 @@ if __name__ == "__main__":
     os.system("python -m spacy download en_core_web_sm")
     
     # Process all documents
-    process_all_documents() 
\ No newline at end of file
+    process_all_documents(force="--force" in sys.argv)
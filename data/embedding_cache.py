@@ -0,0 +1,146 @@
+import hashlib
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Content-addressed chunk embeddings shared by every user's corpus.
+#
+#   vectors(key, dim, vector, refcount)  key = sha256(model + chunk text)
+#   refs(owner, key)                     one row per chunk of each owning document
+#
+# A vector lives as long as some document references it; releasing a
+# document decrements its vectors' refcounts and drops those that reach zero.
+# User documents keep only their vectors' keys on disk (see embedding_store),
+# so a PDF uploaded by many users is stored once and read from here.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS vectors (
+    key TEXT PRIMARY KEY,
+    dim INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    refcount INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS refs (
+    owner TEXT NOT NULL,
+    key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS refs_owner ON refs (owner);
+"""
+
+# Stay under SQLite's default limit on bound parameters
+_LOOKUP_BATCH = 500
+
+class EmbeddingCache:
+    """SQLite-backed, reference-counted store of chunk embeddings keyed by content hash."""
+
+    def __init__(self, path: str, model_name: str):
+        """Open (or create) the store at path for embeddings produced by model_name."""
+        self.path = path
+        self.model_name = model_name
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, text: str) -> str:
+        """Content hash of a chunk text under this cache's model."""
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def _fetch(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Stored vectors of the keys that exist; the caller holds the lock."""
+        found: Dict[str, np.ndarray] = {}
+        unique = list(dict.fromkeys(keys))
+        for i in range(0, len(unique), _LOOKUP_BATCH):
+            batch = unique[i:i + _LOOKUP_BATCH]
+            rows = self._conn.execute(
+                f"SELECT key, vector FROM vectors WHERE key IN ({','.join('?' * len(batch))})",
+                batch
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def lookup(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Cached embedding for each text, or None where the text has not been embedded."""
+        keys = [self.key(text) for text in texts]
+        with self._lock:
+            found = self._fetch(keys)
+            results = [found.get(key) for key in keys]
+            hits = sum(result is not None for result in results)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def vectors(self, keys: List[str]) -> np.ndarray:
+        """Matrix of the stored vectors of keys, in order; raises KeyError if one is missing."""
+        with self._lock:
+            found = self._fetch(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            raise KeyError(f"{len(missing)} of {len(keys)} vectors are not stored")
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
+
+    def retain(self, owner: str, texts: List[str], embeddings: np.ndarray) -> List[str]:
+        """Store a document's chunk embeddings and take one reference per chunk for owner; returns their keys."""
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        keys = [self.key(text) for text in texts]
+        with self._lock, self._conn:
+            # Re-processing a document replaces its previous references
+            self._release(owner)
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO vectors (key, dim, vector, refcount) VALUES (?, ?, ?, 0)",
+                [(key, int(row.shape[0]), row.tobytes()) for key, row in zip(keys, embeddings)]
+            )
+            self._conn.executemany(
+                "UPDATE vectors SET refcount = refcount + 1 WHERE key = ?",
+                [(key,) for key in keys]
+            )
+            self._conn.executemany("INSERT INTO refs (owner, key) VALUES (?, ?)", [(owner, key) for key in keys])
+        return keys
+
+    def release(self, owner: str) -> int:
+        """Drop owner's references, deleting vectors no longer used; returns vectors deleted."""
+        with self._lock, self._conn:
+            return self._release(owner)
+
+    def _release(self, owner: str) -> int:
+        """Release owner's references; the caller holds the lock and transaction."""
+        keys = [row[0] for row in self._conn.execute("SELECT key FROM refs WHERE owner = ?", (owner,))]
+        if not keys:
+            return 0
+        self._conn.executemany("UPDATE vectors SET refcount = refcount - 1 WHERE key = ?", [(key,) for key in keys])
+        self._conn.execute("DELETE FROM refs WHERE owner = ?", (owner,))
+        # Only the released keys can have dropped to zero; looked up by primary key
+        deleted = 0
+        for key in dict.fromkeys(keys):
+            deleted += self._conn.execute(
+                "DELETE FROM vectors WHERE key = ? AND refcount <= 0", (key,)
+            ).rowcount
+        return deleted
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry count, stored bytes, references and lookup hit rate."""
+        with self._lock:
+            entries, stored_bytes, references = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0), COALESCE(SUM(refcount), 0) FROM vectors"
+            ).fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "bytes": stored_bytes,
+                "references": references,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,272 @@
+import argparse
+import json
+import os
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# On-disk layout per document in an embeddings directory:
+#   <doc_id>.npy    float32 matrix (num_chunks x dim), loadable with mmap_mode="r"
+#   <doc_id>.jsonl  one metadata record per chunk (id, source, section_type, start, end)
+#   <doc_id>.txt    chunk texts concatenated; start/end are offsets into this blob
+#   <doc_id>.postings  BM25 postings of the chunk texts (JSON, see data/lexical_index.py)
+#   <doc_id>.keys   instead of the .npy matrix: one key per chunk into a shared vector
+#                   store (see data/embedding_cache.py), for documents whose vectors live there
+EMBEDDING_SUFFIX = ".npy"
+METADATA_SUFFIX = ".jsonl"
+TEXT_SUFFIX = ".txt"
+POSTINGS_SUFFIX = ".postings"
+KEYS_SUFFIX = ".keys"
+LEGACY_SUFFIX = ".json"
+LEGACY_COMBINED_FILE = "document_chunks.json"
+
+def _paths(embeddings_dir: str, doc_id: str) -> Tuple[str, str, str]:
+    """Get the matrix, metadata and text paths for a document."""
+    base = os.path.join(embeddings_dir, doc_id)
+    return base + EMBEDDING_SUFFIX, base + METADATA_SUFFIX, base + TEXT_SUFFIX
+
+def save_document_embeddings(
+    embeddings_dir: str,
+    doc_id: str,
+    chunks: List[Dict[str, Any]],
+    embeddings: Optional[np.ndarray] = None,
+    postings: Optional[Dict[str, Any]] = None,
+    vector_keys: Optional[List[str]] = None
+) -> None:
+    """
+    Save a document's chunk embeddings and metadata (and lexical postings) in the binary layout.
+
+    With vector_keys, the vectors are held in a shared store and only their
+    keys are written, in place of the matrix.
+    """
+    if vector_keys is not None:
+        if len(vector_keys) != len(chunks):
+            raise ValueError("Number of vector keys does not match number of chunks")
+    else:
+        if embeddings is None:
+            embeddings = np.asarray([chunk["embedding"] for chunk in chunks], dtype=np.float32)
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if len(embeddings) != len(chunks):
+            raise ValueError("Number of embeddings does not match number of chunks")
+
+    os.makedirs(embeddings_dir, exist_ok=True)
+    matrix_path, metadata_path, text_path = _paths(embeddings_dir, doc_id)
+    keys_path = os.path.join(embeddings_dir, doc_id + KEYS_SUFFIX)
+
+    texts = []
+    records = []
+    offset = 0
+    for chunk in chunks:
+        text = chunk["text"]
+        record = {
+            key: value for key, value in chunk.items()
+            if key not in ("text", "embedding", "similarity")
+        }
+        record["start"] = offset
+        record["end"] = offset + len(text)
+        records.append(record)
+        texts.append(text)
+        offset += len(text)
+
+    # Write to temporary files first so readers never see a partial document;
+    # the matrix (or keys) file marks a stored document, so it is replaced last
+    if vector_keys is not None:
+        vectors_path, stale_path = keys_path, matrix_path
+        with open(keys_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write("".join(key + "\n" for key in vector_keys))
+    else:
+        vectors_path, stale_path = matrix_path, keys_path
+        with open(matrix_path + ".tmp", "wb") as f:
+            np.save(f, embeddings)
+    # newline="" keeps "\r" and "\r\n" intact, so the offsets stay exact
+    with open(text_path + ".tmp", "w", encoding="utf-8", newline="") as f:
+        f.write("".join(texts))
+    with open(metadata_path + ".tmp", "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    os.replace(text_path + ".tmp", text_path)
+    os.replace(metadata_path + ".tmp", metadata_path)
+    os.replace(vectors_path + ".tmp", vectors_path)
+    if os.path.exists(stale_path):
+        # A previous version of the document stored its vectors the other way
+        os.remove(stale_path)
+
+    postings_path = os.path.join(embeddings_dir, doc_id + POSTINGS_SUFFIX)
+    if postings is not None:
+        with open(postings_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(postings, f, separators=(",", ":"))
+        os.replace(postings_path + ".tmp", postings_path)
+    elif os.path.exists(postings_path):
+        # Stale postings of a previous version of the document
+        os.remove(postings_path)
+
+def load_document_embeddings(
+    embeddings_dir: str,
+    doc_id: str,
+    mmap: bool = True,
+    vectors: Optional[Callable[[List[str]], np.ndarray]] = None
+) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+    """
+    Load a document's embedding matrix and chunk metadata (with text).
+
+    vectors resolves the keys of a document stored with vector_keys into its
+    matrix; loading such a document without it raises ValueError.
+    """
+    matrix_path, metadata_path, text_path = _paths(embeddings_dir, doc_id)
+    keys_path = os.path.join(embeddings_dir, doc_id + KEYS_SUFFIX)
+
+    if os.path.exists(matrix_path):
+        embeddings = np.load(matrix_path, mmap_mode="r" if mmap else None)
+    elif os.path.exists(keys_path):
+        if vectors is None:
+            raise ValueError(f"Embeddings of {doc_id} are held in a shared vector store")
+        with open(keys_path, "r", encoding="utf-8") as f:
+            embeddings = vectors(f.read().split())
+    else:
+        # Fall back to the legacy per-document JSON format
+        legacy_path = os.path.join(embeddings_dir, doc_id + LEGACY_SUFFIX)
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        embeddings = np.asarray([chunk.pop("embedding") for chunk in chunks], dtype=np.float32)
+        return embeddings, chunks
+
+    with open(text_path, "r", encoding="utf-8", newline="") as f:
+        blob = f.read()
+
+    chunks = []
+    with open(metadata_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            start = record.pop("start")
+            end = record.pop("end")
+            record["text"] = blob[start:end]
+            chunks.append(record)
+
+    return embeddings, chunks
+
+def load_document_postings(embeddings_dir: str, doc_id: str) -> Optional[Dict[str, Any]]:
+    """Load a document's lexical postings, or None if they were not saved."""
+    postings_path = os.path.join(embeddings_dir, doc_id + POSTINGS_SUFFIX)
+    if not os.path.exists(postings_path):
+        return None
+    with open(postings_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def load_document_chunks(
+    embeddings_dir: str,
+    doc_id: str,
+    vectors: Optional[Callable[[List[str]], np.ndarray]] = None
+) -> List[Dict[str, Any]]:
+    """Load a document's chunks with embeddings inlined as lists."""
+    embeddings, chunks = load_document_embeddings(embeddings_dir, doc_id, mmap=False, vectors=vectors)
+    for chunk, embedding in zip(chunks, embeddings.tolist()):
+        chunk["embedding"] = embedding
+    return chunks
+
+def list_document_ids(embeddings_dir: str) -> List[str]:
+    """List the documents stored in an embeddings directory (binary or legacy)."""
+    if not os.path.isdir(embeddings_dir):
+        return []
+
+    doc_ids = set()
+    for filename in os.listdir(embeddings_dir):
+        if filename.endswith(EMBEDDING_SUFFIX):
+            doc_ids.add(filename[:-len(EMBEDDING_SUFFIX)])
+        elif filename.endswith(KEYS_SUFFIX):
+            doc_ids.add(filename[:-len(KEYS_SUFFIX)])
+        elif filename.endswith(LEGACY_SUFFIX) and filename != LEGACY_COMBINED_FILE:
+            doc_ids.add(filename[:-len(LEGACY_SUFFIX)])
+    return sorted(doc_ids)
+
+def has_document(embeddings_dir: str, doc_id: str) -> bool:
+    """Check whether a document has stored embeddings."""
+    matrix_path, _, _ = _paths(embeddings_dir, doc_id)
+    keys_path = os.path.join(embeddings_dir, doc_id + KEYS_SUFFIX)
+    legacy_path = os.path.join(embeddings_dir, doc_id + LEGACY_SUFFIX)
+    return os.path.exists(matrix_path) or os.path.exists(keys_path) or os.path.exists(legacy_path)
+
+def delete_document_embeddings(embeddings_dir: str, doc_id: str) -> bool:
+    """Delete all stored files for a document."""
+    paths = list(_paths(embeddings_dir, doc_id))
+    paths.append(os.path.join(embeddings_dir, doc_id + LEGACY_SUFFIX))
+    paths.append(os.path.join(embeddings_dir, doc_id + POSTINGS_SUFFIX))
+    paths.append(os.path.join(embeddings_dir, doc_id + KEYS_SUFFIX))
+
+    deleted = False
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+            deleted = True
+    return deleted
+
+def migrate_embeddings(embeddings_dir: str, keep_legacy: bool = False) -> int:
+    """Convert legacy JSON embeddings in a directory to the binary layout."""
+    migrated = 0
+
+    # Per-document files written by DocumentService
+    for filename in sorted(os.listdir(embeddings_dir)):
+        if not filename.endswith(LEGACY_SUFFIX) or filename == LEGACY_COMBINED_FILE:
+            continue
+        doc_id = filename[:-len(LEGACY_SUFFIX)]
+        legacy_path = os.path.join(embeddings_dir, filename)
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        save_document_embeddings(embeddings_dir, doc_id, chunks)
+        if not keep_legacy:
+            os.remove(legacy_path)
+        migrated += 1
+        print(f"Migrated {legacy_path} ({len(chunks)} chunks)")
+
+    # Combined file written by process_documents, split by source document
+    combined_path = os.path.join(embeddings_dir, LEGACY_COMBINED_FILE)
+    if os.path.exists(combined_path):
+        with open(combined_path, "r", encoding="utf-8") as f:
+            all_chunks = json.load(f)
+
+        by_source: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        for chunk in all_chunks:
+            by_source.setdefault(chunk["source"], []).append(chunk)
+
+        for source, chunks in by_source.items():
+            save_document_embeddings(embeddings_dir, os.path.splitext(source)[0], chunks)
+            migrated += 1
+        if not keep_legacy:
+            os.remove(combined_path)
+        print(f"Migrated {combined_path} ({len(by_source)} documents)")
+
+    return migrated
+
+def _default_embedding_dirs() -> List[str]:
+    """Get the shared embeddings directory and every user's embeddings directory."""
+    root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    dirs = [os.path.join(root_dir, "embeddings")]
+
+    user_data_dir = os.path.join(root_dir, "user_data")
+    if os.path.isdir(user_data_dir):
+        for user_id in sorted(os.listdir(user_data_dir)):
+            dirs.append(os.path.join(user_data_dir, user_id, "embeddings"))
+
+    return [d for d in dirs if os.path.isdir(d)]
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(
+        description="Migrate JSON embeddings to the binary .npy + .jsonl layout"
+    )
+    arg_parser.add_argument(
+        "dirs", nargs="*",
+        help="Embeddings directories (default: embeddings/ and user_data/*/embeddings)"
+    )
+    arg_parser.add_argument(
+        "--keep-legacy", action="store_true",
+        help="Keep the original JSON files after conversion"
+    )
+    args = arg_parser.parse_args()
+
+    total = 0
+    for embeddings_dir in args.dirs or _default_embedding_dirs():
+        total += migrate_embeddings(embeddings_dir, keep_legacy=args.keep_legacy)
+    print(f"Migrated {total} documents")
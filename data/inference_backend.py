@@ -0,0 +1,235 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, List, Optional, Union
+
+import numpy as np
+
+# CPU inference backends for the embedding and QA models, chosen with INFERENCE_BACKEND:
+#
+#   torch       fp32 PyTorch (default)
+#   torch-int8  PyTorch with dynamic int8 quantization of the Linear layers, applied at load
+#   onnx        ONNX Runtime on a model exported with the optional optimum[onnxruntime] package
+#   onnx-int8   ONNX Runtime on the exported model with dynamic int8 quantization
+#
+# ONNX models are exported once into ONNX_MODEL_DIR (default models/onnx) by
+# `python data/inference_backend.py`; a missing export is created on first load.
+# Loading an ONNX backend without optimum[onnxruntime] raises BackendUnavailableError.
+
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+QA_MODELS = ("distilbert-base-cased-distilled-squad", "deepset/roberta-base-squad2")
+EMBEDDING_MODELS = ("all-MiniLM-L6-v2",)
+
+def inference_backend(backend: Optional[str] = None) -> str:
+    """Resolve a backend name, defaulting to INFERENCE_BACKEND."""
+    backend = backend or os.getenv("INFERENCE_BACKEND", "torch")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    return backend
+
+def model_variant(model_name: str, backend: Optional[str] = None) -> str:
+    """Name identifying a model's outputs under a backend; plain model_name for torch."""
+    backend = inference_backend(backend)
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+def onnx_model_dir(model_name: str) -> Path:
+    """Directory holding a model's ONNX export."""
+    root_dir = Path(__file__).parent.parent
+    base_dir = Path(os.getenv("ONNX_MODEL_DIR", root_dir / "models" / "onnx"))
+    return base_dir / model_name.replace("/", "__")
+
+class BackendUnavailableError(ImportError):
+    """Raised when the packages a selected inference backend needs are not installed."""
+
+def _onnx_unavailable(backend: str, error: ImportError) -> BackendUnavailableError:
+    return BackendUnavailableError(
+        f"Inference backend {backend} needs optimum[onnxruntime] "
+        f"(pip install optimum[onnxruntime]): {str(error)}"
+    )
+
+def _onnx_file(backend: str) -> str:
+    return "model_quantized.onnx" if backend == "onnx-int8" else "model.onnx"
+
+def _quantize_torch(model: Any) -> Any:
+    """Dynamically quantize a torch module's Linear layers to int8."""
+    import torch
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def _quantize_onnx(export_dir: Path) -> None:
+    """Write model_quantized.onnx next to an exported model.onnx."""
+    from optimum.onnxruntime import ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    quantizer = ORTQuantizer.from_pretrained(str(export_dir), file_name="model.onnx")
+    quantizer.quantize(
+        save_dir=str(export_dir),
+        quantization_config=AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+    )
+
+class OnnxSentenceEncoder:
+    """ONNX Runtime replacement for SentenceTransformer.encode (pooling and normalization included)."""
+
+    def __init__(self, export_dir: Path, file_name: str):
+        """Load an encoder exported by export_sentence_transformer."""
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+
+        with open(export_dir / "sentence_config.json", "r", encoding="utf-8") as f:
+            config = json.load(f)
+        self.pooling_mode = config["pooling_mode"]
+        self.normalize = config["normalize"]
+        self.max_seq_length = config["max_seq_length"]
+        self.tokenizer = AutoTokenizer.from_pretrained(str(export_dir))
+        self.model = ORTModelForFeatureExtraction.from_pretrained(str(export_dir), file_name=file_name)
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        """Embed sentences like SentenceTransformer.encode (numpy output only)."""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        embeddings = np.zeros((len(texts), 0), dtype=np.float32)
+
+        # Encode longest first so each batch pads to similar lengths
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            inputs = self.tokenizer(
+                [texts[i] for i in rows],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np"
+            )
+            hidden = np.asarray(self.model(**inputs).last_hidden_state, dtype=np.float32)
+            if self.pooling_mode == "cls":
+                pooled = hidden[:, 0]
+            else:
+                mask = inputs["attention_mask"][..., None].astype(np.float32)
+                pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            if self.normalize:
+                pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            if embeddings.shape[1] == 0:
+                embeddings = np.zeros((len(texts), pooled.shape[1]), dtype=np.float32)
+            embeddings[rows] = pooled
+
+        return embeddings[0] if single else embeddings
+
+def export_sentence_transformer(model_name: str, quantize: bool = False) -> Path:
+    """Export a sentence transformer's encoder to ONNX with its pooling settings."""
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from sentence_transformers import SentenceTransformer
+
+    export_dir = onnx_model_dir(model_name)
+    if not (export_dir / "model.onnx").exists():
+        print(f"Exporting {model_name} to ONNX...")
+        model = SentenceTransformer(model_name)
+        pooling = model[1].get_pooling_mode_str()
+        if pooling not in ("mean", "cls"):
+            raise ValueError(f"Unsupported pooling mode for ONNX export: {pooling}")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            model[0].auto_model.save_pretrained(tmp_dir)
+            model.tokenizer.save_pretrained(tmp_dir)
+            ort_model = ORTModelForFeatureExtraction.from_pretrained(tmp_dir, export=True)
+            ort_model.save_pretrained(str(export_dir))
+        model.tokenizer.save_pretrained(str(export_dir))
+
+        with open(export_dir / "sentence_config.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "pooling_mode": pooling,
+                "normalize": any(type(module).__name__ == "Normalize" for module in model),
+                "max_seq_length": model.max_seq_length
+            }, f, indent=2)
+
+    if quantize and not (export_dir / "model_quantized.onnx").exists():
+        print(f"Quantizing {model_name} to int8...")
+        _quantize_onnx(export_dir)
+    return export_dir
+
+def export_qa_model(model_name: str, quantize: bool = False) -> Path:
+    """Export a question-answering model to ONNX."""
+    from optimum.onnxruntime import ORTModelForQuestionAnswering
+    from transformers import AutoTokenizer
+
+    export_dir = onnx_model_dir(model_name)
+    if not (export_dir / "model.onnx").exists():
+        print(f"Exporting {model_name} to ONNX...")
+        ort_model = ORTModelForQuestionAnswering.from_pretrained(model_name, export=True)
+        ort_model.save_pretrained(str(export_dir))
+        AutoTokenizer.from_pretrained(model_name).save_pretrained(str(export_dir))
+
+    if quantize and not (export_dir / "model_quantized.onnx").exists():
+        print(f"Quantizing {model_name} to int8...")
+        _quantize_onnx(export_dir)
+    return export_dir
+
+def load_sentence_transformer(model_name: str, backend: Optional[str] = None) -> Any:
+    """Load an embedding model for a backend."""
+    backend = inference_backend(backend)
+    if backend in ("onnx", "onnx-int8"):
+        try:
+            export_dir = export_sentence_transformer(model_name, quantize=backend == "onnx-int8")
+            return OnnxSentenceEncoder(export_dir, _onnx_file(backend))
+        except ImportError as e:
+            # Outputs are keyed by backend, so a silent torch fallback would mislabel them
+            raise _onnx_unavailable(backend, e) from e
+
+    from sentence_transformers import SentenceTransformer
+    if backend == "torch-int8":
+        # Quantized kernels are CPU-only
+        return _quantize_torch(SentenceTransformer(model_name, device="cpu"))
+    return SentenceTransformer(model_name)
+
+def load_qa_pipeline(model_name: str, device: Optional[int] = None, backend: Optional[str] = None) -> Any:
+    """Load a question-answering pipeline for a backend."""
+    from transformers import pipeline
+
+    backend = inference_backend(backend)
+    if backend in ("onnx", "onnx-int8"):
+        try:
+            from optimum.onnxruntime import ORTModelForQuestionAnswering
+            from transformers import AutoTokenizer
+
+            export_dir = export_qa_model(model_name, quantize=backend == "onnx-int8")
+            return pipeline(
+                "question-answering",
+                model=ORTModelForQuestionAnswering.from_pretrained(str(export_dir), file_name=_onnx_file(backend)),
+                tokenizer=AutoTokenizer.from_pretrained(str(export_dir))
+            )
+        except ImportError as e:
+            raise _onnx_unavailable(backend, e) from e
+
+    # Quantized kernels are CPU-only
+    kwargs = {"device": device} if device is not None and backend == "torch" else {}
+    qa_pipeline = pipeline(
+        "question-answering",
+        model=model_name,
+        tokenizer=model_name,
+        **kwargs
+    )
+    if backend == "torch-int8":
+        qa_pipeline.model = _quantize_torch(qa_pipeline.model)
+    return qa_pipeline
+
+def export_models(backend: str) -> None:
+    """Export every serving model ahead of time for an ONNX backend."""
+    quantize = backend == "onnx-int8"
+    for model_name in EMBEDDING_MODELS:
+        export_sentence_transformer(model_name, quantize=quantize)
+    for model_name in QA_MODELS:
+        export_qa_model(model_name, quantize=quantize)
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Export the serving models for an ONNX inference backend")
+    arg_parser.add_argument("--backend", choices=("onnx", "onnx-int8"), default="onnx-int8")
+    args = arg_parser.parse_args()
+
+    try:
+        export_models(args.backend)
+    except ImportError as e:
+        print(f"The ONNX backends need optimum[onnxruntime]: {str(e)}")
+        sys.exit(1)
+    print(f"Models exported to {onnx_model_dir('')}")
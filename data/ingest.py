@@ -0,0 +1,225 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from tqdm import tqdm
+
+# Allow running as a script from the data directory
+sys.path.append(str(Path(__file__).parent.parent))
+from data import embedding_store
+from data.document_embeddings import DocumentEmbedder
+from data.document_parser import PARSER_VERSION, DocumentParser
+from data.manifest import IngestManifest, file_hash
+from data.processed_store import load_processed_document
+
+_worker_parser: Optional[DocumentParser] = None
+
+def _parse_in_worker(pdf_path: str) -> Optional[Dict[str, Any]]:
+    """Parse stage: extract, clean, section and analyze one PDF in a worker process."""
+    global _worker_parser
+    if _worker_parser is None:
+        # Pages are extracted serially here; documents are the unit of parallelism
+        _worker_parser = DocumentParser(workers=1)
+    return _worker_parser.parse_document(pdf_path)
+
+class IngestionPipeline:
+    """
+    Pipelined parse -> clean -> section -> chunk -> embed ingestion.
+
+    PDFs are parsed on a process pool while the main process chunks finished
+    documents and feeds their chunks, across document boundaries, to a single
+    embedding model in fixed-size batches. Each document's outputs are written
+    as soon as its last chunk is embedded, so an interrupted run can resume.
+    The ingestion manifest decides which documents need reparsing or only
+    re-embedding, and removes the outputs of deleted PDFs.
+    """
+
+    def __init__(
+        self,
+        raw_dir: str,
+        processed_dir: str,
+        embeddings_dir: str,
+        workers: Optional[int] = None,
+        batch_size: int = 64,
+        manifest_path: Optional[str] = None
+    ):
+        """Initialize the pipeline's directories and stage settings."""
+        self.raw_dir = raw_dir
+        self.processed_dir = processed_dir
+        self.embeddings_dir = embeddings_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.parser = DocumentParser(workers=1)
+        self.embedder = DocumentEmbedder()
+        self.manifest = IngestManifest(manifest_path)
+
+        # Chunks waiting to be embedded, and per-document embedding progress
+        self._pending_chunks: List[Dict[str, Any]] = []
+        self._documents: Dict[str, Dict[str, Any]] = {}
+        self._source_hashes: Dict[str, str] = {}
+
+    def plan(self, pdf_files: List[str], force: bool = False) -> Dict[str, List[str]]:
+        """Split PDFs into those that need parsing, only re-embedding, or nothing."""
+        plan = {"parse": [], "embed": [], "skip": []}
+        for pdf_file in pdf_files:
+            doc_id = os.path.splitext(pdf_file)[0]
+            source_hash = file_hash(os.path.join(self.raw_dir, pdf_file))
+            self._source_hashes[doc_id] = source_hash
+            if force or self.manifest.needs_parse(doc_id, source_hash, PARSER_VERSION):
+                plan["parse"].append(pdf_file)
+            elif self.manifest.needs_embed(doc_id, self._embedding_config(doc_id), self.embeddings_dir):
+                plan["embed"].append(pdf_file)
+            else:
+                plan["skip"].append(pdf_file)
+        return plan
+
+    def run(self, force: bool = False) -> int:
+        """Ingest new or changed PDFs in the raw directory, returning the number of documents written."""
+        os.makedirs(self.processed_dir, exist_ok=True)
+        os.makedirs(self.embeddings_dir, exist_ok=True)
+
+        pdf_files = sorted(f for f in os.listdir(self.raw_dir) if f.endswith(".pdf"))
+        self.manifest.collect_garbage([os.path.splitext(f)[0] for f in pdf_files], owner="source")
+        self.manifest.save()
+
+        plan = self.plan(pdf_files, force)
+        print(f"Found {len(pdf_files)} PDF files: {len(plan['parse'])} to parse, "
+              f"{len(plan['embed'])} to re-embed, {len(plan['skip'])} unchanged")
+        if not plan["parse"] and not plan["embed"]:
+            return 0
+
+        start = time.perf_counter()
+        written = 0
+        progress = tqdm(total=len(plan["parse"]) + len(plan["embed"]), desc="Ingesting documents")
+
+        # Documents whose processed JSON is current only need chunking and embedding
+        for pdf_file in plan["embed"]:
+            doc_id = os.path.splitext(pdf_file)[0]
+            document = load_processed_document(self.manifest.get(doc_id)["processed_path"])
+            if not self._enqueue(doc_id, document, save=False):
+                progress.update(1)
+
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            queue = list(plan["parse"])
+            in_flight = {}
+
+            while queue or in_flight:
+                # Keep a bounded number of documents in the parse stage
+                while queue and len(in_flight) < 2 * self.workers:
+                    pdf_file = queue.pop(0)
+                    future = pool.submit(_parse_in_worker, os.path.join(self.raw_dir, pdf_file))
+                    in_flight[future] = pdf_file
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pdf_file = in_flight.pop(future)
+                    try:
+                        document = future.result()
+                    except Exception as e:
+                        print(f"Error parsing {pdf_file}: {str(e)}")
+                        document = None
+                    if document is None or not self._enqueue(os.path.splitext(pdf_file)[0], document):
+                        progress.update(1)
+
+                # Embed full batches while the pool keeps parsing
+                while len(self._pending_chunks) >= self.batch_size:
+                    written += self._embed_batch(progress)
+
+            # Flush the last partial batch
+            while self._pending_chunks:
+                written += self._embed_batch(progress)
+
+        progress.close()
+        print(f"Ingested {written} documents in {time.perf_counter() - start:.1f}s")
+        return written
+
+    def _embedding_config(self, doc_id: str) -> Dict[str, Any]:
+        """Embedding inputs for a document whose processed JSON is recorded in the manifest."""
+        return self.embedder.embedding_config(self.manifest.get(doc_id)["processed_hash"])
+
+    def _enqueue(self, doc_id: str, document: Dict[str, Any], save: bool = True) -> bool:
+        """Chunk stage: save the processed document and queue its chunks for embedding."""
+        if save:
+            processed_path = self.parser.save_document(document, self.processed_dir)
+            self.manifest.record_parse(
+                doc_id,
+                os.path.join(self.raw_dir, document["filename"]),
+                self._source_hashes[doc_id],
+                PARSER_VERSION,
+                processed_path
+            )
+
+        chunks = self.embedder.create_document_chunks(document)
+        if not chunks:
+            print(f"Warning: No chunks created for {doc_id}")
+            return False
+        self._documents[doc_id] = {"chunks": chunks, "embeddings": [None] * len(chunks), "remaining": len(chunks)}
+        for position, chunk in enumerate(chunks):
+            self._pending_chunks.append({"doc_id": doc_id, "position": position, "text": chunk["text"]})
+        return True
+
+    def _embed_batch(self, progress: tqdm) -> int:
+        """Embed stage: encode one cross-document batch and write any completed documents."""
+        batch = self._pending_chunks[:self.batch_size]
+        self._pending_chunks = self._pending_chunks[self.batch_size:]
+
+        embeddings = self.embedder.encode_texts([item["text"] for item in batch], batch_size=self.batch_size)
+
+        written = 0
+        for item, embedding in zip(batch, embeddings):
+            state = self._documents[item["doc_id"]]
+            state["embeddings"][item["position"]] = embedding
+            state["remaining"] -= 1
+            if state["remaining"] == 0:
+                self._write(item["doc_id"])
+                progress.update(1)
+                written += 1
+        return written
+
+    def _write(self, doc_id: str) -> None:
+        """Write a completed document's embeddings and lexical postings."""
+        state = self._documents.pop(doc_id)
+        embedding_store.save_document_embeddings(
+            self.embeddings_dir,
+            doc_id,
+            state["chunks"],
+            embeddings=state["embeddings"],
+            postings=self.embedder.lexical_postings(state["chunks"])
+        )
+        self.manifest.record_embed(doc_id, self._embedding_config(doc_id), self.embeddings_dir)
+        self.manifest.save()
+
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    root_dir = os.path.dirname(script_dir)
+
+    arg_parser = argparse.ArgumentParser(description="Parse, chunk and embed all raw PDFs")
+    arg_parser.add_argument("--raw-dir", default=os.path.join(script_dir, "raw"))
+    arg_parser.add_argument("--processed-dir", default=os.path.join(root_dir, "processed"))
+    arg_parser.add_argument("--embeddings-dir", default=os.path.join(root_dir, "embeddings"))
+    arg_parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: all cores)")
+    arg_parser.add_argument("--batch-size", type=int, default=64, help="Chunks per embedding batch")
+    arg_parser.add_argument("--manifest", default=None, help="Ingestion manifest (default: ingest_manifest.json)")
+    arg_parser.add_argument("--force", action="store_true", help="Re-ingest documents even if unchanged")
+    args = arg_parser.parse_args()
+
+    if not os.path.exists(args.raw_dir):
+        print(f"Raw directory not found at: {args.raw_dir}")
+        sys.exit(1)
+
+    IngestionPipeline(
+        raw_dir=args.raw_dir,
+        processed_dir=args.processed_dir,
+        embeddings_dir=args.embeddings_dir,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        manifest_path=args.manifest
+    ).run(force=args.force)
@@ -0,0 +1,259 @@
+import math
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# BM25 over chunk text, kept as an inverted index per document so documents can
+# be added and removed without touching the others.
+#
+# A document's postings map each term to the chunk rows (local to the document)
+# that contain it and the term frequency in each; "lengths" holds every chunk's
+# token count. Corpus statistics (document frequencies, average length) are
+# maintained incrementally as documents come and go.
+
+# Bump when tokenization changes so persisted postings are rebuilt
+LEXICAL_VERSION = "1"
+
+# Bound on the merged per-term postings cached between index changes
+MERGED_CACHE_TERMS = 4096
+
+# Searches restricted to at most this many documents read each document's postings;
+# wider restrictions keep the in-range rows of the cached merged postings instead
+PER_DOCUMENT_MAX_DOCUMENTS = 64
+
+# Letters and digits only: "G.R. No. 254046" -> g, r, no, 254046
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have",
+    "in", "is", "it", "its", "of", "on", "or", "that", "the", "this", "to", "was",
+    "were", "which", "with",
+})
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased alphanumeric tokens without stopwords."""
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+def document_postings(texts: List[str]) -> Dict[str, Any]:
+    """Build the postings of one document from its chunk texts (JSON-serializable)."""
+    terms: Dict[str, Tuple[List[int], List[int]]] = {}
+    lengths = []
+    for row, text in enumerate(texts):
+        counts = Counter(tokenize(text))
+        lengths.append(sum(counts.values()))
+        for term, count in counts.items():
+            rows, frequencies = terms.setdefault(term, ([], []))
+            rows.append(row)
+            frequencies.append(count)
+    return {
+        "version": LEXICAL_VERSION,
+        "lengths": lengths,
+        "terms": {term: [rows, frequencies] for term, (rows, frequencies) in terms.items()}
+    }
+
+class LexicalIndex:
+    """Incrementally maintained BM25 index over the chunks of many documents."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        """Initialize an empty index with the BM25 parameters."""
+        self.k1 = k1
+        self.b = b
+        # term -> {document_id: (local rows, term frequencies)}
+        self._postings: Dict[str, Dict[str, Tuple[np.ndarray, np.ndarray]]] = {}
+        self._lengths: Dict[str, np.ndarray] = {}
+        self._document_terms: Dict[str, List[str]] = {}
+        self._document_frequency: Counter = Counter()
+        self._total_length = 0
+        self._num_chunks = 0
+        self._nbytes = 0
+        # Per-term postings merged across documents for one ranges snapshot
+        self._merged: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        self._merged_ranges: Optional[Dict[str, Tuple[int, int]]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def num_chunks(self) -> int:
+        """Number of indexed chunks."""
+        return self._num_chunks
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate resident size of the postings arrays in bytes."""
+        return self._nbytes
+
+    @staticmethod
+    def _document_nbytes(terms: Dict[str, Tuple[np.ndarray, np.ndarray]], lengths: np.ndarray) -> int:
+        return int(lengths.nbytes) + sum(int(rows.nbytes + frequencies.nbytes) for rows, frequencies in terms.values())
+
+    def add_document(self, document_id: str, postings: Dict[str, Any]) -> None:
+        """Add (or replace) a document's postings."""
+        terms = {
+            term: (np.asarray(rows, dtype=np.int64), np.asarray(frequencies, dtype=np.float32))
+            for term, (rows, frequencies) in postings["terms"].items()
+        }
+        lengths = np.asarray(postings["lengths"], dtype=np.float32)
+        with self._lock:
+            self._remove(document_id)
+            self._merged_ranges = None
+            for term, entry in terms.items():
+                self._postings.setdefault(term, {})[document_id] = entry
+                self._document_frequency[term] += len(entry[0])
+            self._lengths[document_id] = lengths
+            self._document_terms[document_id] = list(terms)
+            self._total_length += int(lengths.sum())
+            self._num_chunks += len(lengths)
+            self._nbytes += self._document_nbytes(terms, lengths)
+
+    def remove_document(self, document_id: str) -> None:
+        """Remove a document's postings."""
+        with self._lock:
+            self._remove(document_id)
+            self._merged_ranges = None
+
+    def _remove(self, document_id: str) -> None:
+        lengths = self._lengths.pop(document_id, None)
+        if lengths is None:
+            return
+        self._total_length -= int(lengths.sum())
+        self._num_chunks -= len(lengths)
+        self._nbytes -= int(lengths.nbytes)
+        for term in self._document_terms.pop(document_id):
+            entry = self._postings[term].pop(document_id)
+            self._document_frequency[term] -= len(entry[0])
+            self._nbytes -= int(entry[0].nbytes + entry[1].nbytes)
+            if not self._postings[term]:
+                del self._postings[term]
+                del self._document_frequency[term]
+
+    def _merged_postings(
+        self,
+        term: str,
+        ranges: Dict[str, Tuple[int, int]]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """A term's (matrix rows, frequencies, chunk lengths) over all documents in ranges."""
+        if ranges is not self._merged_ranges or len(self._merged) >= MERGED_CACHE_TERMS:
+            # Ranges are replaced, not mutated, whenever the matrix changes
+            self._merged = {}
+            self._merged_ranges = ranges
+        merged = self._merged.get(term)
+        if merged is None:
+            parts = []
+            for doc_id, (rows, frequencies) in self._postings.get(term, {}).items():
+                if doc_id not in ranges:
+                    continue
+                start, end = ranges[doc_id]
+                # A document replaced since the snapshot may have more rows than its range
+                valid = rows < end - start
+                parts.append((rows[valid] + start, frequencies[valid], self._lengths[doc_id][rows[valid]]))
+            if parts:
+                merged = tuple(np.concatenate(arrays) for arrays in zip(*parts))
+            else:
+                merged = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32))
+            self._merged[term] = merged
+        return merged
+
+    def search(
+        self,
+        query: str,
+        ranges: Dict[str, Tuple[int, int]],
+        document_id: Optional[str] = None,
+        document_ids: Optional[List[str]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        BM25 scores of every chunk matching a query term, as (rows, scores).
+
+        Rows index a VectorIndex matrix through its document ranges, or
+        document_id's rows when given. document_ids restricts scoring to those
+        documents' postings. Documents missing from ranges (added after the
+        caller's snapshot) are skipped.
+        """
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+        if document_id is not None:
+            if document_id not in ranges:
+                return empty
+            # Score the one document as if its range were the whole matrix
+            start, end = ranges[document_id]
+            ranges = {document_id: (0, end - start)}
+            document_ids = [document_id]
+
+        terms = set(tokenize(query))
+        with self._lock:
+            n_chunks = self._num_chunks
+            if not terms or not n_chunks:
+                return empty
+            average_length = max(self._total_length / n_chunks, 1.0)
+            idfs = {}
+            for term in terms:
+                frequency = self._document_frequency.get(term, 0)
+                if frequency:
+                    idfs[term] = math.log(1.0 + (n_chunks - frequency + 0.5) / (frequency + 0.5))
+
+            if document_ids is None:
+                num_rows = max((end for _, end in ranges.values()), default=0)
+                scores = np.zeros(num_rows, dtype=np.float32)
+                for term, idf in idfs.items():
+                    rows, frequencies, lengths = self._merged_postings(term, ranges)
+                    # Rows are unique within a term, so plain fancy-index addition is safe
+                    scores[rows] += self._score(idf, frequencies, lengths, average_length)
+                rows = np.flatnonzero(scores)
+                return rows, scores[rows]
+
+            # Matrix order, so rows come out sorted
+            document_ids = sorted(
+                (doc_id for doc_id in set(document_ids) if doc_id in ranges and doc_id in self._lengths),
+                key=lambda doc_id: ranges[doc_id][0]
+            )
+            if len(document_ids) > PER_DOCUMENT_MAX_DOCUMENTS:
+                return self._search_ranges(idfs, ranges, document_ids, average_length)
+
+            # Only the listed documents' postings are read
+            all_rows, all_scores = [], []
+            for doc_id in document_ids:
+                start, end = ranges[doc_id]
+                scores = np.zeros(end - start, dtype=np.float32)
+                for term, idf in idfs.items():
+                    rows, frequencies = self._postings[term].get(doc_id, empty)
+                    # A document replaced since the snapshot may have more rows than its range
+                    valid = rows < end - start
+                    rows, frequencies = rows[valid], frequencies[valid]
+                    scores[rows] += self._score(idf, frequencies, self._lengths[doc_id][rows], average_length)
+                rows = np.flatnonzero(scores)
+                all_rows.append(rows + start)
+                all_scores.append(scores[rows])
+        if not all_rows:
+            return empty
+        return np.concatenate(all_rows), np.concatenate(all_scores)
+
+    def _search_ranges(
+        self,
+        idfs: Dict[str, float],
+        ranges: Dict[str, Tuple[int, int]],
+        document_ids: List[str],
+        average_length: float
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Score the merged postings that fall in the ranges of document_ids, sorted by start (lock held)."""
+        starts = np.asarray([ranges[doc_id][0] for doc_id in document_ids], dtype=np.int64)
+        ends = np.asarray([ranges[doc_id][1] for doc_id in document_ids], dtype=np.int64)
+        all_rows, all_scores = [], []
+        for term, idf in idfs.items():
+            rows, frequencies, lengths = self._merged_postings(term, ranges)
+            slots = np.searchsorted(starts, rows, side="right") - 1
+            keep = (slots >= 0) & (rows < ends[np.maximum(slots, 0)])
+            all_rows.append(rows[keep])
+            all_scores.append(self._score(idf, frequencies[keep], lengths[keep], average_length))
+        if not all_rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        # Sum each row's term scores without an array spanning the whole matrix
+        rows = np.unique(np.concatenate(all_rows))
+        scores = np.zeros(len(rows), dtype=np.float32)
+        for term_rows, term_scores in zip(all_rows, all_scores):
+            scores[np.searchsorted(rows, term_rows)] += term_scores
+        return rows, scores
+
+    def _score(self, idf: float, frequencies: np.ndarray, lengths: np.ndarray, average_length: float) -> np.ndarray:
+        """BM25 term scores for the given term frequencies and chunk lengths."""
+        norm = self.k1 * (1.0 - self.b + self.b * lengths / average_length)
+        return idf * frequencies * (self.k1 + 1.0) / (frequencies + norm)
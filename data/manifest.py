@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+# Ingestion manifest: one entry per document id recording what each stage
+# last produced and from which inputs, so re-runs only redo stale work.
+#
+#   {
+#     "<doc_id>": {
+#       "source": "<pdf path>", "source_hash": "...", "parser_version": "...",
+#       "processed_path": "...", "processed_hash": "...",
+#       "embedding": {"input_hash": "...", "chunker_version": "...", "chunk_size": 500,
+#                     "overlap": 100, "model": "..."},
+#       "embeddings_dir": "...",
+#       "catalog": {"source_hash": "...", "metadata": {...}}
+#     }
+#   }
+
+MANIFEST_FILE = "ingest_manifest.json"
+
+def default_manifest_path() -> str:
+    """Manifest location for the bundled corpus (next to processed/ and embeddings/)."""
+    root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(root_dir, MANIFEST_FILE)
+
+def file_hash(path: str, block_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's contents, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class IngestManifest:
+    """Per-document record of ingestion inputs, versions and outputs."""
+
+    def __init__(self, path: Optional[str] = None):
+        """Load the manifest at path, starting empty if it does not exist."""
+        self.path = path or default_manifest_path()
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def save(self) -> None:
+        """Write the manifest atomically."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(self.path + ".tmp", self.path)
+
+    def get(self, doc_id: str) -> Dict[str, Any]:
+        """The entry for a document (empty if it was never ingested)."""
+        return self.entries.get(doc_id, {})
+
+    def needs_parse(self, doc_id: str, source_hash: str, parser_version: str) -> bool:
+        """Whether the processed JSON is missing or was built from other inputs."""
+        entry = self.get(doc_id)
+        return (
+            entry.get("source_hash") != source_hash
+            or entry.get("parser_version") != parser_version
+            or not os.path.exists(entry.get("processed_path", ""))
+        )
+
+    def record_parse(
+        self,
+        doc_id: str,
+        source: str,
+        source_hash: str,
+        parser_version: str,
+        processed_path: str
+    ) -> None:
+        """Record a completed parse and the hash of its output."""
+        entry = self.entries.setdefault(doc_id, {})
+        entry.update({
+            "source": source,
+            "source_hash": source_hash,
+            "parser_version": parser_version,
+            "processed_path": processed_path,
+            "processed_hash": file_hash(processed_path)
+        })
+
+    def needs_embed(self, doc_id: str, embedding_config: Dict[str, Any], embeddings_dir: str) -> bool:
+        """Whether embeddings are missing or were built from another input, chunker or model."""
+        # Imported here so the manifest can be used without NumPy
+        from data import embedding_store
+
+        entry = self.get(doc_id)
+        return (
+            entry.get("embedding") != embedding_config
+            or entry.get("embeddings_dir") != embeddings_dir
+            or not embedding_store.has_document(embeddings_dir, doc_id)
+        )
+
+    def record_embed(self, doc_id: str, embedding_config: Dict[str, Any], embeddings_dir: str) -> None:
+        """Record completed embeddings and the configuration that produced them."""
+        entry = self.entries.setdefault(doc_id, {})
+        entry["embedding"] = dict(embedding_config)
+        entry["embeddings_dir"] = embeddings_dir
+
+    def cached_catalog_metadata(self, doc_id: str, source_hash: str) -> Optional[Dict[str, Any]]:
+        """Catalog metadata extracted from the same source contents, if any."""
+        catalog = self.get(doc_id).get("catalog", {})
+        if catalog.get("source_hash") == source_hash:
+            return catalog.get("metadata")
+        return None
+
+    def record_catalog_metadata(self, doc_id: str, source_hash: str, metadata: Dict[str, Any]) -> None:
+        """Remember catalog metadata extracted from a source."""
+        entry = self.entries.setdefault(doc_id, {})
+        entry["catalog"] = {"source_hash": source_hash, "metadata": metadata}
+
+    def forget_catalog_metadata(self, live_ids: List[str]) -> None:
+        """Drop cached catalog metadata for sources that no longer exist."""
+        for doc_id in set(self.entries) - set(live_ids):
+            self.entries[doc_id].pop("catalog", None)
+            if not self.entries[doc_id]:
+                del self.entries[doc_id]
+
+    def collect_garbage(self, live_ids: List[str], owner: str = "source") -> List[str]:
+        """
+        Delete the outputs of documents whose input no longer exists.
+
+        Only entries produced by the given stage are considered: "source" for
+        documents parsed from a raw PDF, "embedding" for documents embedded from
+        a processed JSON. Returns the removed document ids.
+        """
+        from data import embedding_store
+
+        removed = []
+        for doc_id in sorted(set(self.entries) - set(live_ids)):
+            if owner not in self.entries[doc_id]:
+                continue
+            entry = self.entries.pop(doc_id)
+            processed_path = entry.get("processed_path")
+            if owner == "source" and processed_path and os.path.exists(processed_path):
+                os.remove(processed_path)
+            if entry.get("embeddings_dir"):
+                embedding_store.delete_document_embeddings(entry["embeddings_dir"], doc_id)
+            removed.append(doc_id)
+
+        if removed:
+            print(f"Removed outputs for {len(removed)} deleted inputs: {', '.join(removed)}")
+        return removed
@@ -0,0 +1,200 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from data.model_registry import SharedModel
+
+# Dynamic batching for the query-path models.
+#
+# Concurrent requests submit single items (a query to encode, a question and
+# context to read); a worker thread per model collects them for up to
+# BATCH_MAX_WAIT_MS milliseconds or BATCH_MAX_SIZE items, runs one batched
+# forward pass and resolves each caller's future with its own result.
+
+_batchers: Dict[str, "MicroBatcher"] = {}
+_batchers_lock = threading.Lock()
+
+class MicroBatcher:
+    """Collects single requests into batches for one batched model call."""
+
+    def __init__(
+        self,
+        name: str,
+        run_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None
+    ):
+        """
+        Create a batcher; run_batch maps a list of items to a list of results.
+
+        The worker thread is started on the first submit.
+        """
+        self.name = name
+        self._run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size or int(os.getenv("BATCH_MAX_SIZE", 16)))
+        self.max_wait = (
+            max_wait_ms if max_wait_ms is not None else float(os.getenv("BATCH_MAX_WAIT_MS", 5))
+        ) / 1000
+        self._queue: "queue.Queue[Tuple[Any, Future, float]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        # Throughput counters
+        self._requests = 0
+        self._batches = 0
+        self._errors = 0
+        self._split_batches = 0
+        self._largest_batch = 0
+        self._queue_seconds = 0.0
+        self._run_seconds = 0.0
+
+    def submit(self, item: Any) -> Future:
+        """Queue one item, returning a future resolved with its result."""
+        future: Future = Future()
+        self._ensure_worker()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def run(self, item: Any) -> Any:
+        """Submit one item and wait for its result."""
+        return self.submit(item).result()
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._loop, name=f"batcher-{self.name}", daemon=True
+                )
+                self._worker.start()
+
+    def _collect(self) -> List[Tuple[Any, Future, float]]:
+        """Block for the first item, then gather more until the batch is full or the wait expires."""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._collect()
+            # Skip callers that gave up before their batch ran
+            batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            start = time.perf_counter()
+            split = False
+            try:
+                results = self._call([item for item, _, _ in batch])
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+                failed = 0
+            except Exception as e:
+                if len(batch) == 1:
+                    print(f"Error in batcher {self.name}: {str(e)}")
+                    batch[0][1].set_exception(e)
+                    failed = 1
+                else:
+                    # One bad input must not fail the other callers: retry each item alone
+                    print(f"Error in batcher {self.name}: {str(e)}; retrying {len(batch)} items one by one")
+                    split = True
+                    failed = self._run_singly(batch)
+            finished = time.perf_counter()
+
+            with self._lock:
+                self._requests += len(batch)
+                self._batches += 1
+                self._split_batches += split
+                self._errors += failed
+                self._largest_batch = max(self._largest_batch, len(batch))
+                self._queue_seconds += sum(start - queued for _, _, queued in batch)
+                self._run_seconds += finished - start
+
+    def _call(self, items: List[Any]) -> List[Any]:
+        """Run one batch, checking that every item got a result."""
+        results = self._run_batch(items)
+        if len(results) != len(items):
+            raise RuntimeError(f"Batcher {self.name} got {len(results)} results for {len(items)} items")
+        return results
+
+    def _run_singly(self, batch: List[Tuple[Any, Future, float]]) -> int:
+        """Run each item of a failed batch on its own, failing only those that raise; returns the failures."""
+        failed = 0
+        for item, future, _ in batch:
+            try:
+                future.set_result(self._call([item])[0])
+            except Exception as e:
+                print(f"Error in batcher {self.name}: {str(e)}")
+                future.set_exception(e)
+                failed += 1
+        return failed
+
+    def stats(self) -> Dict[str, Any]:
+        """Batch sizes, queueing delay and model throughput so far."""
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "requests": self._requests,
+                "batches": self._batches,
+                "errors": self._errors,
+                "split_batches": self._split_batches,
+                "pending": self._queue.qsize(),
+                "mean_batch_size": self._requests / self._batches if self._batches else 0.0,
+                "largest_batch": self._largest_batch,
+                "mean_queue_ms": self._queue_seconds * 1000 / self._requests if self._requests else 0.0,
+                "mean_batch_ms": self._run_seconds * 1000 / self._batches if self._batches else 0.0,
+                "items_per_second": self._requests / self._run_seconds if self._run_seconds else 0.0
+            }
+
+def _shared_batcher(name: str, run_batch: Callable[[List[Any]], List[Any]]) -> MicroBatcher:
+    """Get the process-wide batcher registered under name, creating it if needed."""
+    with _batchers_lock:
+        batcher = _batchers.get(name)
+        if batcher is None:
+            batcher = MicroBatcher(name, run_batch)
+            _batchers[name] = batcher
+        return batcher
+
+def encoder_batcher(model: SharedModel) -> MicroBatcher:
+    """
+    Batch single query texts into one encode call; each result is one embedding row.
+
+    Callers sharing a model share its batcher, so their queries are batched together.
+    """
+    def run_batch(texts: List[str]) -> List[Any]:
+        return list(model.encode(texts))
+
+    return _shared_batcher(model.key, run_batch)
+
+def reader_batcher(model: SharedModel, **pipeline_kwargs) -> MicroBatcher:
+    """Batch (question, context) pairs into one question-answering pipeline call."""
+    def run_batch(pairs: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        outputs = model(
+            question=[question for question, _ in pairs],
+            context=[context for _, context in pairs],
+            batch_size=len(pairs),
+            **pipeline_kwargs
+        )
+        # The pipeline unwraps single-item batches
+        return [outputs] if isinstance(outputs, dict) else list(outputs)
+
+    # Calls with different pipeline arguments cannot share a batch
+    name = model.key + "".join(f" {key}={value}" for key, value in sorted(pipeline_kwargs.items()))
+    return _shared_batcher(name, run_batch)
+
+def batching_stats() -> Dict[str, Dict[str, Any]]:
+    """Stats of every batcher created in this process, by model key."""
+    with _batchers_lock:
+        batchers = list(_batchers.values())
+    return {batcher.name: batcher.stats() for batcher in batchers}
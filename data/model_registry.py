@@ -0,0 +1,149 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from data.inference_backend import (
+    inference_backend,
+    load_qa_pipeline,
+    load_sentence_transformer,
+    model_variant
+)
+
+class SharedModel:
+    """Thread-safe, lazily loaded handle to a model shared across the process."""
+
+    def __init__(self, key: str, loader: Callable[[], Any]):
+        """Create a handle; the model is loaded on first use."""
+        self.key = key
+        self._loader = loader
+        self._model = None
+        self._lock = threading.RLock()
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the underlying model has been loaded."""
+        return self._model is not None
+
+    def get(self) -> Any:
+        """Get the underlying model, loading it if necessary."""
+        if self._model is not None:
+            return self._model
+
+        with self._lock:
+            if self._model is None:
+                if self.error is not None:
+                    raise RuntimeError(f"Model {self.key} failed to load: {self.error}")
+                start = time.perf_counter()
+                try:
+                    self._model = self._loader()
+                except Exception as e:
+                    self.error = str(e)
+                    print(f"Error loading model {self.key}: {str(e)}")
+                    raise
+                self.load_seconds = time.perf_counter() - start
+                print(f"Loaded model {self.key} in {self.load_seconds:.1f}s "
+                      f"({self.nbytes() / (1024 * 1024):.0f} MB)")
+        return self._model
+
+    def available(self) -> bool:
+        """Try to load the model, returning False if it cannot be loaded."""
+        try:
+            self.get()
+            return True
+        except Exception:
+            return False
+
+    def encode(self, *args, **kwargs) -> Any:
+        """Call the model's encode method (sentence transformers)."""
+        model = self.get()
+        with self._lock:
+            return model.encode(*args, **kwargs)
+
+    def tokenize(self, *args, **kwargs) -> Any:
+        """Call the model's tokenizer (fast tokenizers must not be used concurrently)."""
+        model = self.get()
+        with self._lock:
+            return model.tokenizer(*args, **kwargs)
+
+    def __call__(self, *args, **kwargs) -> Any:
+        """Call the model (transformers pipelines)."""
+        model = self.get()
+        with self._lock:
+            return model(*args, **kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for attributes not defined on the handle itself
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+    def nbytes(self) -> int:
+        """Size of the model's parameters and buffers in bytes (0 if not loaded)."""
+        if self._model is None:
+            return 0
+
+        # Pipelines wrap the torch module in .model; sentence transformers are modules
+        module = getattr(self._model, "model", self._model)
+        total = 0
+        for attr in ("parameters", "buffers"):
+            tensors = getattr(module, attr, None)
+            if tensors is None:
+                continue
+            for tensor in tensors():
+                total += tensor.numel() * tensor.element_size()
+        return total
+
+class ModelRegistry:
+    """Process-wide registry handing out shared model handles."""
+
+    def __init__(self):
+        """Initialize an empty registry."""
+        self._models: Dict[str, SharedModel] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str, loader: Callable[[], Any]) -> SharedModel:
+        """Get the handle registered under key, creating it with loader if needed."""
+        with self._lock:
+            handle = self._models.get(key)
+            if handle is None:
+                handle = SharedModel(key, loader)
+                self._models[key] = handle
+            return handle
+
+    def sentence_transformer(self, model_name: str = "all-MiniLM-L6-v2", backend: Optional[str] = None) -> SharedModel:
+        """Get a shared SentenceTransformer handle for an inference backend (INFERENCE_BACKEND)."""
+        backend = inference_backend(backend)
+
+        def load():
+            return load_sentence_transformer(model_name, backend)
+
+        return self.get(f"sentence-transformers:{model_variant(model_name, backend)}", load)
+
+    def qa_pipeline(self, model_name: str, device: Optional[int] = None, backend: Optional[str] = None) -> SharedModel:
+        """Get a shared question-answering pipeline handle for an inference backend (INFERENCE_BACKEND)."""
+        backend = inference_backend(backend)
+
+        def load():
+            return load_qa_pipeline(model_name, device, backend)
+
+        return self.get(f"question-answering:{model_variant(model_name, backend)}", load)
+
+    def memory_footprint(self) -> Dict[str, Dict[str, Any]]:
+        """Report load state and memory footprint of every registered model."""
+        with self._lock:
+            handles = list(self._models.values())
+
+        return {
+            handle.key: {
+                "loaded": handle.loaded,
+                "bytes": handle.nbytes(),
+                "load_seconds": handle.load_seconds,
+                "error": handle.error
+            }
+            for handle in handles
+        }
+
+# Shared by the api and data modules
+registry = ModelRegistry()
@@ -0,0 +1,92 @@
+import argparse
+import json
+import os
+from typing import Any, Dict, List, Tuple
+
+# Processed documents are stored as compact JSON holding the cleaned text once:
+#   {"filename", "full_text", "section_spans": {name: [start, end]}, "entities", "metadata"}
+# Section texts are slices of full_text, resolved on demand with section_text().
+# Older files stored every section as a copy of its text under "sections".
+
+SECTION_NAMES = ("header", "syllabus", "decision", "dispositive")
+
+def save_processed_document(path: str, document: Dict[str, Any]) -> str:
+    """Write a processed document atomically, storing sections as offsets only."""
+    document = dict(document)
+    if "section_spans" not in document:
+        document["section_spans"] = section_spans(document)
+    document["section_spans"] = {name: list(span) for name, span in document["section_spans"].items()}
+    document.pop("sections", None)
+
+    # Write to a temporary file first so an interrupted run never leaves a partial document
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(document, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+    return path
+
+def load_processed_document(path: str) -> Dict[str, Any]:
+    """Load a processed document (either layout)."""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def section_spans(document: Dict[str, Any]) -> Dict[str, Tuple[int, int]]:
+    """Character spans of a document's sections, locating legacy section texts once."""
+    if document.get("section_spans"):
+        return {name: tuple(span) for name, span in document["section_spans"].items()}
+
+    text = document.get("full_text", "")
+    spans = {}
+    for name, section in document.get("sections", {}).items():
+        start = text.find(section) if section else -1
+        spans[name] = (start, start + len(section)) if start >= 0 else (0, 0)
+    return spans
+
+def section_text(document: Dict[str, Any], name: str) -> str:
+    """Text of one section, sliced from full_text."""
+    if "section_spans" not in document and name in document.get("sections", {}):
+        return document["sections"][name]
+    start, end = section_spans(document).get(name, (0, 0))
+    return document.get("full_text", "")[start:end]
+
+def convert_processed_documents(processed_dir: str) -> int:
+    """Rewrite legacy processed documents in a directory to the offset layout."""
+    converted = 0
+    for filename in sorted(os.listdir(processed_dir)):
+        if not filename.endswith(".json"):
+            continue
+        path = os.path.join(processed_dir, filename)
+        document = load_processed_document(path)
+        if "sections" not in document:
+            continue
+        before = os.path.getsize(path)
+        save_processed_document(path, document)
+        converted += 1
+        print(f"Converted {path} ({before // 1024} KB -> {os.path.getsize(path) // 1024} KB)")
+    return converted
+
+def _default_processed_dirs() -> List[str]:
+    """Get the shared processed directory and every user's processed directory."""
+    root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    dirs = [os.path.join(root_dir, "processed")]
+
+    user_data_dir = os.path.join(root_dir, "user_data")
+    if os.path.isdir(user_data_dir):
+        for user_id in sorted(os.listdir(user_data_dir)):
+            dirs.append(os.path.join(user_data_dir, user_id, "processed"))
+
+    return [d for d in dirs if os.path.isdir(d)]
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(
+        description="Convert processed documents to offset-based sections"
+    )
+    arg_parser.add_argument(
+        "dirs", nargs="*",
+        help="Processed directories (default: processed/ and user_data/*/processed)"
+    )
+    args = arg_parser.parse_args()
+
+    total = 0
+    for processed_dir in args.dirs or _default_processed_dirs():
+        total += convert_processed_documents(processed_dir)
+    print(f"Converted {total} documents")
@@ -1,12 +1,22 @@
 import json
 import os
+import sys
 import numpy as np
+from pathlib import Path
 from typing import List, Dict, Any, Tuple
 from sentence_transformers import SentenceTransformer
-from transformers import AutoTokenizer, AutoModelForQuestionAnswering, pipeline
+from transformers import AutoTokenizer, AutoModelForQuestionAnswering
 import torch
 from tqdm import tqdm
 
+# Allow running as a script from the data directory
+sys.path.append(str(Path(__file__).parent.parent))
+from data import embedding_store
+from data.inference_backend import export_models, inference_backend
+from data.micro_batcher import encoder_batcher, reader_batcher
+from data.model_registry import registry
+from data.retrieval import exact_search, normalize_rows, select_chunks
+
 class LegalQASystem:
     def __init__(
         self,
@@ -18,27 +28,48 @@ class LegalQASystem:
         # Set up paths
         if embeddings_path is None:
             script_dir = os.path.dirname(os.path.abspath(__file__))
-            embeddings_dir = os.path.join(os.path.dirname(script_dir), 'embeddings')
-            embeddings_path = os.path.join(embeddings_dir, 'document_chunks.json')
+            embeddings_path = os.path.join(os.path.dirname(script_dir), 'embeddings')
         
         if not os.path.exists(embeddings_path):
-            raise FileNotFoundError(f"Embeddings file not found at: {embeddings_path}")
+            raise FileNotFoundError(f"Embeddings not found at: {embeddings_path}")
         
-        # Load models
-        self.qa_pipeline = pipeline(
-            "question-answering",
-            model=qa_model_name,
-            tokenizer=qa_model_name,
+        # Shared models, loaded on first use
+        self.qa_pipeline = registry.qa_pipeline(
+            qa_model_name,
             device=0 if torch.cuda.is_available() else -1
         )
-        self.embedding_model = SentenceTransformer(embedding_model_name)
+        self.embedding_model = registry.sentence_transformer(embedding_model_name)
+        
+        # Concurrent queries share batched forward passes
+        self.query_encoder = encoder_batcher(self.embedding_model)
+        self.reader = reader_batcher(
+            self.qa_pipeline,
+            handle_impossible_answer=True,
+            max_answer_len=200  # Increased max answer length
+        )
         
         # Load document chunks
-        with open(embeddings_path, 'r', encoding='utf-8') as f:
-            self.chunks = json.load(f)
+        if os.path.isdir(embeddings_path):
+            # Binary layout: one float32 matrix per document
+            matrices = []
+            self.chunks = []
+            for doc_id in embedding_store.list_document_ids(embeddings_path):
+                embeddings, chunks = embedding_store.load_document_embeddings(embeddings_path, doc_id)
+                matrices.append(embeddings)
+                self.chunks.extend(chunks)
+            if not matrices:
+                raise FileNotFoundError(f"No document embeddings found in: {embeddings_path}")
+            self.embeddings = np.concatenate(matrices)
+        else:
+            # Legacy combined document_chunks.json
+            with open(embeddings_path, 'r', encoding='utf-8') as f:
+                self.chunks = json.load(f)
+            
+            # Convert embeddings to numpy array for faster processing
+            self.embeddings = np.array([chunk.pop("embedding") for chunk in self.chunks], dtype=np.float32)
         
-        # Convert embeddings to numpy array for faster processing
-        self.embeddings = np.array([chunk["embedding"] for chunk in self.chunks])
+        # Normalize once so each query is a single matrix-vector product
+        self.embeddings = normalize_rows(self.embeddings)
         
         print(f"Loaded {len(self.chunks)} document chunks from: {embeddings_path}")
     
@@ -50,27 +81,11 @@ class LegalQASystem:
     ) -> List[Dict[str, Any]]:
         """Find the most relevant document chunks for a given query."""
         # Generate query embedding
-        query_embedding = self.embedding_model.encode(query)
+        query_embedding = normalize_rows(self.query_encoder.run(query))
         
-        # Calculate cosine similarity
-        similarities = np.dot(self.embeddings, query_embedding) / (
-            np.linalg.norm(self.embeddings, axis=1) * np.linalg.norm(query_embedding)
-        )
-        
-        # Get top k results above threshold
-        top_indices = np.argsort(similarities)[-top_k:][::-1]
-        relevant_chunks = []
-        
-        for idx in top_indices:
-            similarity = float(similarities[idx])
-            if similarity >= threshold:
-                chunk = self.chunks[idx].copy()
-                chunk["similarity"] = similarity
-                relevant_chunks.append(chunk)
-        
-        # Sort by similarity
-        relevant_chunks.sort(key=lambda x: x["similarity"], reverse=True)
-        return relevant_chunks
+        # Get top k results above threshold, sorted by similarity
+        top_indices, similarities = exact_search(self.embeddings, query_embedding, top_k, threshold)
+        return select_chunks(self.chunks, top_indices, similarities)
     
     def answer_question(
         self,
@@ -108,12 +123,7 @@ class LegalQASystem:
         
         # Get answer from QA model
         try:
-            qa_result = self.qa_pipeline(
-                question=question,
-                context=context,
-                handle_impossible_answer=True,
-                max_answer_len=200  # Increased max answer length
-            )
+            qa_result = self.reader.run((question, context))
             
             # Find source chunk for the answer
             source_chunk = None
@@ -165,6 +175,11 @@ def setup_qa_system() -> None:
     print("Downloading embedding model...")
     SentenceTransformer('all-MiniLM-L6-v2')
     
+    # Export the ONNX models now rather than on the first query
+    backend = inference_backend()
+    if backend in ("onnx", "onnx-int8"):
+        export_models(backend)
+    
     print("Setup complete!")
 
 if __name__ == "__main__":
@@ -0,0 +1,81 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Retrieval kernel shared by QAService (via VectorIndex) and LegalQASystem.
+# Embedding matrices are normalized once when the index is built, so cosine
+# similarity reduces to a single matrix-vector (or matrix-matrix) product.
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize the rows of a matrix (or a single vector), leaving zero rows untouched."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+def top_k_indices(scores: np.ndarray, top_k: int, threshold: Optional[float] = None) -> np.ndarray:
+    """Indices of the top_k scores (at or above threshold) in descending order."""
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # O(n) partial selection, then sort only the k survivors
+    partition = np.argpartition(-scores, top_k - 1)[:top_k]
+    order = partition[np.argsort(-scores[partition], kind="stable")]
+    if threshold is not None:
+        order = order[scores[order] >= threshold]
+    return order
+
+def exact_search(
+    matrix: np.ndarray,
+    query: np.ndarray,
+    top_k: int,
+    threshold: Optional[float] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Brute-force top_k (row ids, scores) for one normalized query."""
+    scores = matrix @ query
+    order = top_k_indices(scores, top_k, threshold)
+    return order, scores[order]
+
+def exact_search_batch(
+    matrix: np.ndarray,
+    queries: np.ndarray,
+    top_k: int,
+    threshold: Optional[float] = None
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Brute-force top_k (row ids, scores) for each row of a normalized query matrix."""
+    # One matrix-matrix product for the whole batch
+    scores = queries @ matrix.T
+    results = []
+    for row in scores:
+        order = top_k_indices(row, top_k, threshold)
+        results.append((order, row[order]))
+    return results
+
+def row_runs(rows: np.ndarray) -> List[Tuple[int, int]]:
+    """Split sorted, unique row ids into their contiguous [start, end) runs."""
+    if not len(rows):
+        return []
+    breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+    starts = rows[np.concatenate(([0], breaks))]
+    ends = rows[np.concatenate((breaks - 1, [len(rows) - 1]))] + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+def run_scores(matrix: np.ndarray, runs: List[Tuple[int, int]], queries: np.ndarray) -> np.ndarray:
+    """Scores of a query (or query matrix) against the rows in runs, in row order."""
+    # Slices are views, so the selected rows are never copied
+    return np.concatenate([queries @ matrix[start:end].T for start, end in runs], axis=-1)
+
+def select_chunks(
+    chunks: List[Dict[str, Any]],
+    indices: np.ndarray,
+    scores: np.ndarray,
+    offset: int = 0
+) -> List[Dict[str, Any]]:
+    """Copy the selected chunks, adding their "similarity" score."""
+    result_chunks = []
+    for i, score in zip(indices, scores):
+        chunk = chunks[offset + int(i)].copy()
+        chunk["similarity"] = float(score)
+        result_chunks.append(chunk)
+    return result_chunks
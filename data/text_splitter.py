@@ -0,0 +1,95 @@
+import re
+from typing import List, Tuple
+
+# Paragraph and sentence segmentation for Philippine court decisions.
+# Everything works on (start, end) character offsets into the original text,
+# so callers can slice, measure and map spans back to sections cheaply.
+
+# Lower-cased abbreviations that end in a period but do not end a sentence
+LEGAL_ABBREVIATIONS = frozenset({
+    "no.", "nos.", "vs.", "v.", "art.", "arts.", "sec.", "secs.", "par.", "pars.",
+    "rep.", "phil.", "scra.", "id.", "ibid.", "supra.", "cf.", "et.", "al.", "etc.",
+    "inc.", "co.", "corp.", "ltd.", "jr.", "sr.", "atty.", "attys.", "hon.", "mr.",
+    "mrs.", "ms.", "dr.", "gen.", "col.", "lt.", "capt.", "sgt.", "gov.", "sen.",
+    "p.", "pp.", "vol.", "ch.", "cir.", "adm.", "resp.", "petr.", "dept.", "ed.",
+    "approx.", "e.g.", "i.e.", "viz.", "st.", "ave.", "brgy.", "mun.", "prov.", "jan.",
+    "feb.", "mar.", "apr.", "jun.", "jul.", "aug.", "sep.", "sept.", "oct.", "nov.", "dec.",
+})
+
+# A candidate sentence end: terminal punctuation, optional closing quotes or brackets, then space
+_BOUNDARY = re.compile(r"[.!?][\"'”’)\]]*\s+")
+# Initials and dotted abbreviations such as "G.R.", "C.J.", "U.S." or "A."
+_INITIALS = re.compile(r"(?:[A-Za-z]\.)+$")
+
+def paragraph_spans(text: str, start: int = 0, end: int = None) -> List[Tuple[int, int]]:
+    """Spans of the non-blank paragraphs (separated by blank lines), whitespace-trimmed."""
+    end = len(text) if end is None else end
+    spans = []
+    position = start
+    while position < end:
+        separator = text.find("\n\n", position, end)
+        para_end = end if separator == -1 else separator
+        span = _strip_span(text, position, para_end)
+        if span:
+            spans.append(span)
+        position = para_end + 2
+    return spans
+
+def sentence_spans(text: str, start: int = 0, end: int = None) -> List[Tuple[int, int]]:
+    """
+    Spans of the sentences in text[start:end], whitespace-trimmed.
+
+    A period only ends a sentence when the word before it is not a known
+    legal abbreviation or initial ("G.R. No.", "vs.", "Art.", "J.") and the
+    next word does not start in lower case.
+    """
+    end = len(text) if end is None else end
+    spans = []
+    sentence_start = start
+    for match in _BOUNDARY.finditer(text, start, end):
+        next_char = text[match.end()] if match.end() < end else ""
+        if next_char.islower():
+            continue
+        if text[match.start()] == ".":
+            # Walk back over the word ending at the period (bounded by the word's length)
+            word_start = match.start()
+            while word_start > sentence_start and not text[word_start - 1].isspace():
+                word_start -= 1
+            token = text[word_start:match.start() + 1].lstrip("(\"'“‘[").lower()
+            if token in LEGAL_ABBREVIATIONS or _INITIALS.fullmatch(token):
+                continue
+        span = _strip_span(text, sentence_start, match.end())
+        if span:
+            spans.append(span)
+        sentence_start = match.end()
+
+    span = _strip_span(text, sentence_start, end)
+    if span:
+        spans.append(span)
+    return spans
+
+def split_long_span(text: str, start: int, end: int, max_length: int) -> List[Tuple[int, int]]:
+    """Break a span longer than max_length at word boundaries (or hard, for a single long word)."""
+    spans = []
+    while end - start > max_length:
+        cut = text.rfind(" ", start + 1, start + max_length + 1)
+        if cut == -1:
+            cut = start + max_length
+        span = _strip_span(text, start, cut)
+        if span:
+            spans.append(span)
+        start = cut
+        while start < end and text[start].isspace():
+            start += 1
+    span = _strip_span(text, start, end)
+    if span:
+        spans.append(span)
+    return spans
+
+def _strip_span(text: str, start: int, end: int) -> Tuple[int, int]:
+    """Shrink a span past leading and trailing whitespace; empty spans become ()."""
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return (start, end) if start < end else ()
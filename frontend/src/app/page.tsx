@@ -111,7 +111,7 @@ export default function Home() {
     setIsLoading(true);
 
     try {
-      const response = await fetch("http://localhost:8000/api/query", {
+      const response = await fetch("http://localhost:8000/api/query/stream", {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
@@ -122,7 +122,7 @@ export default function Home() {
         }),
       });
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         const errorData = await response.json().catch(() => ({}));
         console.error("Query error response:", errorData);
         throw new Error(
@@ -131,8 +131,36 @@ export default function Home() {
         );
       }
 
-      const data = await response.json();
-      setAnswer(data);
+      // Read Server-Sent Events: relevant chunks arrive first, then the answer
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split("\n\n");
+        buffer = events.pop() || "";
+
+        for (const raw of events) {
+          const event = raw.match(/^event: (.*)$/m)?.[1];
+          const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] || "{}");
+
+          if (event === "chunks") {
+            setAnswer({ answer: "", relevant_chunks: data.relevant_chunks });
+            setIsLoading(false);
+          } else if (event === "answer") {
+            setAnswer((prev) => ({
+              answer: data.answer,
+              relevant_chunks: prev?.relevant_chunks || [],
+            }));
+          } else if (event === "error") {
+            throw new Error(data.detail || "An error occurred");
+          }
+        }
+      }
     } catch (err) {
       console.error("Error getting answer:", err);
       setError(err instanceof Error ? err.message : "An error occurred");
@@ -167,6 +195,12 @@ export default function Home() {
 
       await loadUserDocuments();
 
+      // Processing runs in the background; poll the job until it settles
+      if (result.job_id) {
+        await waitForJob(result.job_id);
+        await loadUserDocuments();
+      }
+
       // Switch to search tab after upload
       setActiveTab("search");
 
@@ -177,6 +211,26 @@ export default function Home() {
     }
   };
 
+  const waitForJob = async (jobId: string) => {
+    while (true) {
+      await new Promise((resolve) => setTimeout(resolve, 2000));
+
+      const response = await fetch(`http://localhost:8000/api/jobs/${jobId}`);
+      if (!response.ok) return;
+
+      const job = await response.json();
+      if (job.status === "processed") return;
+      if (job.status === "failed") {
+        throw new Error(job.error || "Document processing failed");
+      }
+      if (job.status === "cancelled") {
+        throw new Error(
+          "Document processing was cancelled because the document was deleted"
+        );
+      }
+    }
+  };
+
   const handleDeleteDocument = async (documentId: string) => {
     if (!userId) return;
 
@@ -400,7 +454,7 @@ export default function Home() {
                   <CardContent>
                     <div className="prose dark:prose-invert max-w-none">
                       <p className="text-lg leading-relaxed whitespace-pre-line">
-                        {answer.answer}
+                        {answer.answer || "Reading the most relevant passages..."}
                       </p>
                     </div>
                   </CardContent>